@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import os
+import signal
+from typing import Callable, Dict, List, Optional, Sequence, TextIO, Tuple
+
+_logger = logging.getLogger().getChild(__name__)
+
+# Called with each line of output, without the trailing newline.
+LineCallback = Callable[[str], None]
+
+# Maximum length of an output line.
+_LINE_LIMIT = 1 << 24
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def get_processes() -> Dict[int, List[Tuple[int, int]]]:
+  """Returns the processes of each session.
+
+  This reads /proc and returns an empty dict if it is not available.
+
+  Returns:
+    Dict mapping session ids, i.e., the pids of the session leaders, to lists
+    of (pid, resident set size in bytes) of the processes in the sessions.
+  """
+  try:
+    entries = os.listdir('/proc')
+  except FileNotFoundError:
+    return {}
+  sessions = {}  # type: Dict[int, List[Tuple[int, int]]]
+  for entry in entries:
+    if not entry.isdigit():
+      continue
+    try:
+      with open('/proc/%s/stat' % entry) as stat_file:
+        stat = stat_file.read()
+      # fields after the command name, starting from the state
+      fields = stat[stat.rindex(')') + 2:].split()
+      sessions.setdefault(int(fields[3]), []).append(
+          (int(entry), int(fields[21]) * _PAGE_SIZE))
+    except (OSError, ValueError, IndexError):
+      continue  # the process has exited
+  return sessions
+
+
+class Runner:
+  """Run a process in an asyncio event loop and stream its output.
+
+  stdout and stderr are read line by line as soon as they are produced, so the
+  process never blocks on a full pipe. Each line is appended to the log file,
+  if any, and passed to the callbacks. The process is started in a new session,
+  so that it can be killed with all the processes it spawned.
+
+  If the task awaiting run or wait is cancelled, the process tree is killed.
+
+  The resident set size of the process tree is not sampled by the runner itself;
+  a caller running many processes, e.g., a scheduler, reads /proc once per
+  interval with get_processes and passes the result to update_peak_rss.
+
+  Subclasses may override finish, which is called after the process exits, and
+  cleanup, which is called after run in any case.
+
+  Attributes:
+    args: Sequence of the program and its arguments.
+    cwd: Optional working directory.
+    log_file: Optional name of the log file.
+    on_stdout: Optional LineCallback for stdout.
+    on_stderr: Optional LineCallback for stderr.
+    process: asyncio.subprocess.Process once started, or None.
+    returncode: Return code once finished, or None.
+    peak_rss: Peak resident set size in bytes of the process tree sampled so
+        far by update_peak_rss.
+  """
+
+  def __init__(self,
+               args: Sequence[str],
+               cwd: Optional[str] = None,
+               log_file: Optional[str] = None,
+               on_stdout: Optional[LineCallback] = None,
+               on_stderr: Optional[LineCallback] = None) -> None:
+    self.args = tuple(args)
+    self.cwd = cwd
+    self.log_file = log_file
+    self.on_stdout = on_stdout
+    self.on_stderr = on_stderr
+    self.process = None  # type: Optional[asyncio.subprocess.Process]
+    self.returncode = None  # type: Optional[int]
+    self.peak_rss = 0
+
+  def __repr__(self) -> str:
+    return '%s(%s)' % (type(self).__name__, ' '.join(self.args))
+
+  def __await__(self):
+    return self.run().__await__()
+
+  async def start(self) -> None:
+    self.process = await asyncio.create_subprocess_exec(
+        *self.args,
+        cwd=self.cwd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,
+        limit=_LINE_LIMIT)
+    _logger.debug('started %s as pid %d', self, self.process.pid)
+
+  async def wait(self) -> int:
+    """Stream the output until the process exits.
+
+    If the streaming fails, e.g., a callback raises or a line is longer than
+    the limit, or the task is cancelled, the process tree is killed before the
+    exception propagates, so that no process is left running without its
+    output being read.
+
+    Returns:
+      The return code of the process.
+    """
+    assert self.process is not None, 'process is not started'
+    log = None  # type: Optional[TextIO]
+    if self.log_file is not None:
+      log = open(self.log_file, 'a')
+    streams = [
+        asyncio.ensure_future(self._stream(self.process.stdout, self.on_stdout,
+                                           log)),
+        asyncio.ensure_future(self._stream(self.process.stderr, self.on_stderr,
+                                           log)),
+    ]
+    try:
+      await asyncio.gather(*streams)
+      return await self.process.wait()
+    finally:
+      for stream in streams:
+        stream.cancel()
+      if self.process.returncode is None:
+        self.kill()
+        await self.process.wait()
+      # the streams must stop writing before the log is closed
+      await asyncio.gather(*streams, return_exceptions=True)
+      if log is not None:
+        log.close()
+
+  async def run(self) -> int:
+    """Start the process, stream its output, and finish.
+
+    Returns:
+      The return code, which finish may override.
+    """
+    try:
+      await self.start()
+      self.returncode = await self.wait()
+      self.finish()
+    finally:
+      self.cleanup()
+    return self.returncode
+
+  def kill(self) -> None:
+    """Kill the process and all processes in its session.
+
+    Processes that started a new process group but stayed in the session are
+    found via /proc.
+    """
+    if self.process is not None and self.process.returncode is None:
+      _logger.debug('killing %s', self)
+      pids = [self.process.pid]
+      pids.extend(pid for pid, _ in get_processes().get(self.process.pid, ())
+                  if pid != self.process.pid)
+      try:
+        os.killpg(self.process.pid, signal.SIGKILL)
+      except ProcessLookupError:
+        pass
+      for pid in pids:
+        try:
+          os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+          pass
+
+  def update_peak_rss(self,
+                      processes: Dict[int, List[Tuple[int, int]]]) -> None:
+    """Update peak_rss with a sample of the processes.
+
+    Args:
+      processes: Processes of each session, as returned by get_processes.
+    """
+    if self.process is not None and self.process.returncode is None:
+      rss = sum(rss for _, rss in processes.get(self.process.pid, ()))
+      self.peak_rss = max(self.peak_rss, rss)
+
+  def finish(self) -> None:
+    """Process the results after the process exits."""
+
+  def cleanup(self) -> None:
+    """Release the resources after run."""
+
+  @staticmethod
+  async def _stream(reader: asyncio.StreamReader,
+                    callback: Optional[LineCallback],
+                    log: Optional[TextIO]) -> None:
+    while True:
+      line = (await reader.readline()).decode(errors='replace')
+      if not line:
+        return
+      if log is not None:
+        log.write(line)
+        log.flush()
+      if callback is not None:
+        callback(line.rstrip('\n'))
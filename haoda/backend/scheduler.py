@@ -0,0 +1,491 @@
+import asyncio
+import collections
+import heapq
+import json
+import logging
+import os
+import time
+from typing import (Any, Awaitable, Callable, Dict, Iterable, List, Optional,
+                    Set, TextIO, Tuple, Union)
+
+from haoda import util
+from haoda.backend import runner
+
+_logger = logging.getLogger().getChild(__name__)
+
+# Kinds of job slots.
+IMPLICIT = 'implicit'
+JOB_SERVER = 'job server'
+LOCAL = 'local'
+
+
+class TokenPool:
+  """Job slots from a GNU make job server, or a local pool if none is inherited.
+
+  With a job server, the calling process implicitly holds one job slot, and
+  each additional slot is a token read from the job server, which is written
+  back on release. Tokens are read from a non-blocking file descriptor reopened
+  from the job server, so that a pending acquisition can be cancelled without
+  losing a token. Without a job server, max_jobs local slots are available.
+
+  The pool must be used in a single event loop.
+
+  Attributes:
+    job_server_fd: The job server file descriptor, or None.
+    max_jobs: Number of local slots.
+  """
+
+  def __init__(self,
+               job_server_fd: Union[int, Tuple[()], None] = (),
+               max_jobs: Optional[int] = None) -> None:
+    self.job_server_fd = util.get_job_server_fd(job_server_fd)
+    self.max_jobs = max_jobs or os.cpu_count() or 1
+    self._implicit_free = True
+    self._implicit_released = None  # type: Optional[asyncio.Event]
+    self._local = None  # type: Optional[asyncio.Semaphore]
+    self._read_fd = None  # type: Optional[int]
+
+  async def acquire(self) -> str:
+    """Acquire a job slot.
+
+    Returns:
+      The kind of the slot, to be passed to release.
+
+    Raises:
+      util.InternalError: If the job server is closed.
+    """
+    if self.job_server_fd is None:
+      if self._local is None:
+        self._local = asyncio.Semaphore(self.max_jobs)
+      await self._local.acquire()
+      return LOCAL
+    if self._implicit_released is None:
+      self._implicit_released = asyncio.Event()
+    while not self._implicit_free:
+      self._implicit_released.clear()
+      read = asyncio.ensure_future(self._read_token())
+      released = asyncio.ensure_future(self._implicit_released.wait())
+      try:
+        await asyncio.wait((read, released),
+                           return_when=asyncio.FIRST_COMPLETED)
+      except BaseException:
+        # a token read before the cancellation must be written back
+        if (read.done() and not read.cancelled() and
+            read.exception() is None):
+          util.release_job_slot(self.job_server_fd)
+        raise
+      finally:
+        read.cancel()
+        released.cancel()
+      if read.done() and not read.cancelled():
+        read.result()
+        return JOB_SERVER
+    self._implicit_free = False
+    return IMPLICIT
+
+  async def _read_token(self) -> None:
+    if self._read_fd is None:
+      self._read_fd = os.open('/proc/self/fd/%d' % self.job_server_fd,
+                              os.O_RDONLY | os.O_NONBLOCK)
+    loop = asyncio.get_event_loop()
+    while True:
+      try:
+        if os.read(self._read_fd, 1):
+          return
+        raise util.InternalError('job server is closed')
+      except BlockingIOError:
+        pass
+      readable = loop.create_future()
+      loop.add_reader(self._read_fd,
+                      lambda: readable.done() or readable.set_result(None))
+      try:
+        await readable
+      finally:
+        loop.remove_reader(self._read_fd)
+
+  def release(self, kind: str) -> None:
+    """Release a job slot of the given kind."""
+    if kind == IMPLICIT:
+      self._implicit_free = True
+      if self._implicit_released is not None:
+        self._implicit_released.set()
+    elif kind == JOB_SERVER:
+      util.release_job_slot(self.job_server_fd)
+    elif kind == LOCAL:
+      self._local.release()
+    else:
+      raise ValueError('invalid job slot: %s' % kind)
+
+  def close(self) -> None:
+    if self._read_fd is not None:
+      os.close(self._read_fd)
+      self._read_fd = None
+
+
+class MemoryModel:
+  """A model of the peak memory of jobs, learned from previous jobs.
+
+  The peak memory of a job type is modeled as a linear function of the design
+  size, fitted by least squares over the recorded samples. With samples of a
+  single size, the peak is assumed to grow in proportion to the size. The
+  prediction is scaled up by margin.
+
+  Attributes:
+    path: Optional name of a JSON file the samples are loaded from and saved to.
+    default: Prediction in bytes for job types without any sample.
+    margin: Factor applied to the predictions.
+    max_samples: Number of most recent samples kept for each job type.
+    samples: Dict mapping job types to lists of (size, peak memory) samples.
+  """
+
+  def __init__(self,
+               path: Optional[str] = None,
+               default: float = float(4 << 30),
+               margin: float = 1.2,
+               max_samples: int = 64) -> None:
+    self.path = path
+    self.default = default
+    self.margin = margin
+    self.max_samples = max_samples
+    self.samples = {}  # type: Dict[str, List[Tuple[float, float]]]
+    if path is not None:
+      try:
+        with open(path) as model_file:
+          for job_type, samples in json.load(model_file).items():
+            self.samples[job_type] = [tuple(_) for _ in samples]
+      except (OSError, ValueError):
+        pass
+
+  def record(self, job_type: str, size: float, peak: float) -> None:
+    samples = self.samples.setdefault(job_type, [])
+    samples.append((size, peak))
+    del samples[:-self.max_samples]
+
+  def predict(self, job_type: str, size: float) -> float:
+    """Returns the predicted peak memory in bytes."""
+    samples = self.samples.get(job_type)
+    if not samples:
+      return self.default
+    mean_size = sum(_[0] for _ in samples) / len(samples)
+    mean_peak = sum(_[1] for _ in samples) / len(samples)
+    variance = sum((_[0] - mean_size)**2 for _ in samples)
+    if variance == 0:
+      peak = max(_[1] for _ in samples)
+      if 0 < mean_size < size:
+        peak *= size / mean_size
+    else:
+      slope = sum((x - mean_size) * (y - mean_peak) for x, y in samples
+                 ) / variance
+      peak = max(mean_peak + slope * (size - mean_size),
+                 min(_[1] for _ in samples))
+    return peak * self.margin
+
+  def save(self) -> None:
+    if self.path is not None:
+      util.update_file(self.path,
+                       json.dumps(self.samples, indent=2, sort_keys=True))
+
+
+class Job:
+  """A tool job.
+
+  Attributes:
+    name: Unique name of the job.
+    factory: Callable that starts the job and returns an awaitable of its
+        return code, e.g., a class of haoda.backend.runner.Runner with bound
+        arguments. Blocking tools can be run with loop.run_in_executor.
+    priority: Jobs with a higher priority start first among ready jobs.
+    deps: Tuple of the names of the jobs this job depends on.
+    job_type: Optional type of the job, e.g., 'hls' or 'synth', used to
+        predict and record its peak memory.
+    size: Size of the design, e.g., the number of modules or of HDL lines,
+        used to predict its peak memory.
+    memory: Optional peak memory in bytes, which overrides the prediction.
+    peak_memory: Measured peak memory in bytes if the awaitable returned by
+        factory is a runner.Runner, or None.
+    returncode: Return code, or None if not finished.
+    error: Exception raised by the job or the reason it is skipped, or None.
+    ready_time: time.monotonic() when all dependencies have succeeded.
+    start_time: time.monotonic() when the job has acquired a job slot.
+    end_time: time.monotonic() when the job has finished.
+  """
+
+  def __init__(self,
+               name: str,
+               factory: Callable[[], Awaitable[Optional[int]]],
+               priority: int = 0,
+               deps: Iterable[str] = (),
+               job_type: Optional[str] = None,
+               size: float = 0.,
+               memory: Optional[float] = None) -> None:
+    self.name = name
+    self.factory = factory
+    self.priority = priority
+    self.deps = tuple(deps)
+    self.job_type = job_type
+    self.size = size
+    self.memory = memory
+    self.peak_memory = None  # type: Optional[float]
+    self.returncode = None  # type: Optional[int]
+    self.error = None  # type: Optional[BaseException]
+    self.ready_time = None  # type: Optional[float]
+    self.start_time = None  # type: Optional[float]
+    self.end_time = None  # type: Optional[float]
+
+  def __repr__(self) -> str:
+    return 'job<%s: %s>' % (self.name, self.status)
+
+  @property
+  def status(self) -> str:
+    if self.error is not None or self.returncode not in (None, 0):
+      return 'skipped' if self.start_time is None else 'failed'
+    if self.end_time is not None:
+      return 'succeeded'
+    return 'pending' if self.start_time is None else 'running'
+
+  @property
+  def queue_time(self) -> Optional[float]:
+    if self.start_time is None or self.ready_time is None:
+      return None
+    return self.start_time - self.ready_time
+
+  @property
+  def run_time(self) -> Optional[float]:
+    if self.end_time is None or self.start_time is None:
+      return None
+    return self.end_time - self.start_time
+
+
+class Scheduler:
+  """Run tool jobs in parallel with priorities and dependencies.
+
+  A job becomes ready once all its dependencies have succeeded, and the ready
+  job of the highest priority, or added first among equal priorities, starts
+  as soon as a job slot is acquired. The slot is released when the job
+  finishes, fails, or is cancelled. Jobs depending on a failed job are skipped.
+
+  With a memory budget, a job is only admitted if the predicted peak memory of
+  the running jobs and itself fits in the budget, or if no other job is
+  running. If the ready job of the highest priority does not fit, a smaller
+  ready job may start first.
+
+  The memory of the running runner.Runner jobs is sampled from a single scan of
+  /proc every rss_interval seconds, and the measured peaks are recorded in the
+  memory model.
+
+  Attributes:
+    jobs: Dict mapping job names to Jobs, in the order they are added.
+    pool: TokenPool of the job slots.
+    memory_budget: Optional memory budget in bytes.
+    memory_model: MemoryModel to predict the peak memory of the jobs.
+    rss_interval: Interval in seconds between samples of the memory usage.
+  """
+
+  def __init__(self,
+               job_server_fd: Union[int, Tuple[()], None] = (),
+               max_jobs: Optional[int] = None,
+               memory_budget: Optional[float] = None,
+               memory_model: Optional[MemoryModel] = None,
+               rss_interval: float = 1.) -> None:
+    self.jobs = collections.OrderedDict()  # type: Dict[str, Job]
+    self.pool = TokenPool(job_server_fd, max_jobs)
+    self.memory_budget = memory_budget
+    self.memory_model = memory_model or MemoryModel()
+    self.rss_interval = rss_interval
+    self._reserved_memory = {}  # type: Dict[str, float]
+    self._runners = {}  # type: Dict[str, runner.Runner]
+
+  def add(self,
+          name: str,
+          factory: Callable[[], Awaitable[Optional[int]]],
+          priority: int = 0,
+          deps: Iterable[str] = (),
+          job_type: Optional[str] = None,
+          size: float = 0.,
+          memory: Optional[float] = None) -> Job:
+    """Add a job. See Job for the arguments.
+
+    Raises:
+      ValueError: If the name is already used.
+    """
+    if name in self.jobs:
+      raise ValueError('duplicate job: %s' % name)
+    job = self.jobs[name] = Job(name, factory, priority, deps, job_type, size,
+                                memory)
+    return job
+
+  async def run(self) -> bool:
+    """Run all jobs.
+
+    If the task running this is cancelled, the running jobs are cancelled.
+
+    Returns:
+      Whether all jobs have succeeded.
+
+    Raises:
+      ValueError: If a dependency is unknown or cyclic.
+    """
+    dependents = {name: []
+                  for name in self.jobs}  # type: Dict[str, List[Job]]
+    num_deps = {}  # type: Dict[str, int]
+    for job in self.jobs.values():
+      for dep in job.deps:
+        if dep not in self.jobs:
+          raise ValueError('job %s depends on unknown job %s' %
+                           (job.name, dep))
+        dependents[dep].append(job)
+      num_deps[job.name] = len(job.deps)
+    self._check_acyclic(dependents, num_deps)
+
+    ready = []  # type: List[Tuple[int, int, str]]
+    seq = 0
+
+    def push(job: Job) -> None:
+      nonlocal seq
+      job.ready_time = time.monotonic()
+      heapq.heappush(ready, (-job.priority, seq, job.name))
+      seq += 1
+
+    def skip(job: Job, reason: str) -> None:
+      for dependent in dependents[job.name]:
+        if dependent.error is None:
+          dependent.error = util.SemanticError(reason)
+          skip(dependent, reason)
+
+    for job in self.jobs.values():
+      if not job.deps:
+        push(job)
+    running = {}  # type: Dict[asyncio.Future, Job]
+    acquiring = None  # type: Optional[Tuple[Job, asyncio.Future]]
+    sampler = asyncio.ensure_future(self._sample_memory())
+    try:
+      while ready or running or acquiring:
+        if acquiring is None and ready:
+          job = self._admit(ready, bool(running))
+          if job is not None:
+            acquiring = job, asyncio.ensure_future(self.pool.acquire())
+        waits = set(running)  # type: Set[asyncio.Future]
+        if acquiring is not None:
+          waits.add(acquiring[1])
+        done, _ = await asyncio.wait(waits,
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if acquiring is not None and acquiring[1] in done:
+          job, future = acquiring
+          acquiring = None
+          running[asyncio.ensure_future(self._run_job(job,
+                                                      future.result()))] = job
+        for future in done:
+          if future not in running:
+            continue
+          job = running.pop(future)
+          if job.status == 'succeeded':
+            for dependent in dependents[job.name]:
+              num_deps[dependent.name] -= 1
+              if num_deps[dependent.name] == 0 and dependent.error is None:
+                push(dependent)
+          else:
+            skip(job, 'dependency %s %s' % (job.name, job.status))
+    finally:
+      sampler.cancel()
+      if acquiring is not None:
+        future = acquiring[1]
+        if not future.done():
+          future.cancel()
+        elif not future.cancelled() and future.exception() is None:
+          self.pool.release(future.result())
+      for future in running:
+        future.cancel()
+      if running:
+        await asyncio.wait(running)
+      self.pool.close()
+      self._reserved_memory.clear()
+      self.memory_model.save()
+    _logger.info('%d of %d jobs succeeded', sum(
+        _.status == 'succeeded' for _ in self.jobs.values()), len(self.jobs))
+    return all(_.status == 'succeeded' for _ in self.jobs.values())
+
+  def _admit(self, ready: List[Tuple[int, int, str]],
+             busy: bool) -> Optional[Job]:
+    """Pop the first ready job that fits in the memory budget, if any."""
+    for entry in sorted(ready):
+      job = self.jobs[entry[-1]]
+      memory = job.memory
+      if memory is None:
+        memory = self.memory_model.predict(job.job_type or '', job.size)
+      used = sum(self._reserved_memory.values())
+      if (self.memory_budget is None or not busy or
+          used + memory <= self.memory_budget):
+        ready.remove(entry)
+        heapq.heapify(ready)
+        self._reserved_memory[job.name] = memory
+        return job
+    return None
+
+  async def _run_job(self, job: Job, slot: str) -> None:
+    job.start_time = time.monotonic()
+    _logger.debug('starting %s with %s slot', job.name, slot)
+    try:
+      awaitable = job.factory()
+      if isinstance(awaitable, runner.Runner):
+        self._runners[job.name] = awaitable
+      job.returncode = await awaitable
+      peak = getattr(awaitable, 'peak_rss', None)
+      if peak:
+        job.peak_memory = peak
+        if job.job_type is not None:
+          self.memory_model.record(job.job_type, job.size, peak)
+    except asyncio.CancelledError as e:
+      job.error = e
+      raise
+    except Exception as e:  # pylint: disable=broad-except
+      _logger.error('job %s raised %s', job.name, e)
+      job.error = e
+    finally:
+      self.pool.release(slot)
+      self._reserved_memory.pop(job.name, None)
+      self._runners.pop(job.name, None)
+      job.end_time = time.monotonic()
+    if job.returncode:
+      _logger.error('job %s returned %d', job.name, job.returncode)
+
+  async def _sample_memory(self) -> None:
+    """Sample the memory of all running runners with one scan of /proc."""
+    while True:
+      if self._runners:
+        processes = runner.get_processes()
+        for job_runner in self._runners.values():
+          job_runner.update_peak_rss(processes)
+      await asyncio.sleep(self.rss_interval)
+
+  @staticmethod
+  def _check_acyclic(dependents: Dict[str, List[Job]],
+                     num_deps: Dict[str, int]) -> None:
+    num_deps = dict(num_deps)
+    queue = [name for name, count in num_deps.items() if count == 0]
+    num_visited = 0
+    while queue:
+      num_visited += 1
+      for dependent in dependents[queue.pop()]:
+        num_deps[dependent.name] -= 1
+        if num_deps[dependent.name] == 0:
+          queue.append(dependent.name)
+    if num_visited != len(num_deps):
+      raise ValueError('job dependencies are cyclic')
+
+  def print_report(self, out: TextIO) -> None:
+    """Print the status, queue time, run time, and peak memory of each job."""
+
+    def seconds(value: Any) -> str:
+      return '-' if value is None else '%.1f' % value
+
+    def megabytes(value: Any) -> str:
+      return '-' if value is None else '%.0f' % (value / (1 << 20))
+
+    name_width = max((len(_) for _ in self.jobs), default=3)
+    row = '{:<{}} {:<9} {:>8} {:>8} {:>8}\n'
+    out.write(
+        row.format('job', name_width, 'status', 'queue/s', 'run/s', 'peak/MB'))
+    for job in self.jobs.values():
+      out.write(
+          row.format(job.name, name_width, job.status, seconds(job.queue_time),
+                     seconds(job.run_time), megabytes(job.peak_memory)))
@@ -1,22 +1,46 @@
 import collections
+import collections.abc
 import contextlib
 import glob
+import hashlib
+import io
 import logging
 import os
+import re
+import shlex
+import shutil
 import subprocess
 import tarfile
 import tempfile
 import xml.etree.ElementTree as ET
 import xml.sax.saxutils
 import zipfile
-from typing import (BinaryIO, Iterable, Iterator, Mapping, Optional, TextIO,
-                    Tuple, Union)
+from typing import (Any, BinaryIO, Dict, Iterable, Iterator, List, Mapping,
+                    Optional, Set, TextIO, Tuple, Union)
 
 from haoda import ir, util
+from haoda.backend import runner
 
 _logger = logging.getLogger().getChild(__name__)
 
 
+def get_vivado_args(cwd: str, commands: str, *args: str) -> List[str]:
+  """Write the Tcl commands to cwd and returns the vivado command line."""
+  with open(os.path.join(cwd, 'commands.tcl'), mode='w+') as tcl_file:
+    tcl_file.write(commands)
+  return [
+      'vivado', '-mode', 'batch', '-source', tcl_file.name, '-nojournal',
+      '-tclargs', *args
+  ]
+
+
+def get_vivado_hls_args(cwd: str, commands: str) -> List[str]:
+  """Write the Tcl commands to cwd and returns the vivado_hls command line."""
+  with open(os.path.join(cwd, 'commands.tcl'), mode='w+') as tcl_file:
+    tcl_file.write(commands)
+  return ['vivado_hls', '-f', tcl_file.name]
+
+
 class Vivado(subprocess.Popen):
   """Call vivado with the given Tcl commands and arguments.
 
@@ -30,13 +54,7 @@ class Vivado(subprocess.Popen):
 
   def __init__(self, commands: str, *args: Iterable[str]):
     self.cwd = tempfile.TemporaryDirectory(prefix='vivado-')
-    with open(os.path.join(self.cwd.name, 'commands.tcl'),
-              mode='w+') as tcl_file:
-      tcl_file.write(commands)
-    cmd_args = [
-        'vivado', '-mode', 'batch', '-source', tcl_file.name, '-nojournal',
-        '-tclargs', *args
-    ]
+    cmd_args = get_vivado_args(self.cwd.name, commands, *args)
     pipe_args = {'stdout': subprocess.PIPE, 'stderr': subprocess.PIPE}
     super().__init__(cmd_args, cwd=self.cwd.name, **pipe_args)  # type: ignore
 
@@ -57,10 +75,7 @@ class VivadoHls(subprocess.Popen):
 
   def __init__(self, commands: str):
     self.cwd = tempfile.TemporaryDirectory(prefix='vivado-hls-')
-    with open(os.path.join(self.cwd.name, 'commands.tcl'),
-              mode='w+') as tcl_file:
-      tcl_file.write(commands)
-    cmd_args = ['vivado_hls', '-f', tcl_file.name]
+    cmd_args = get_vivado_hls_args(self.cwd.name, commands)
     pipe_args = {'stdout': subprocess.PIPE, 'stderr': subprocess.PIPE}
     super().__init__(cmd_args, cwd=self.cwd.name, **pipe_args)  # type: ignore
 
@@ -69,6 +84,48 @@ class VivadoHls(subprocess.Popen):
     self.cwd.cleanup()
 
 
+class AsyncVivado(runner.Runner):
+  """Call vivado with the given Tcl commands and arguments under asyncio.
+
+  This is the asyncio counterpart of Vivado. The output is streamed as in
+  runner.Runner, and the temporary working directory is removed after run.
+
+  Args:
+    commands: A string of Tcl commands.
+    args: Iterable of strings as arguments to the Tcl commands.
+    kwargs: Keyword arguments of runner.Runner other than args and cwd.
+  """
+
+  def __init__(self, commands: str, *args: str, **kwargs: Any) -> None:
+    self.tmpdir = tempfile.TemporaryDirectory(prefix='vivado-')
+    super().__init__(get_vivado_args(self.tmpdir.name, commands, *args),
+                     cwd=self.tmpdir.name,
+                     **kwargs)
+
+  def cleanup(self) -> None:
+    self.tmpdir.cleanup()
+
+
+class AsyncVivadoHls(runner.Runner):
+  """Call vivado_hls with the given Tcl commands under asyncio.
+
+  This is the asyncio counterpart of VivadoHls.
+
+  Args:
+    commands: A string of Tcl commands.
+    kwargs: Keyword arguments of runner.Runner other than args and cwd.
+  """
+
+  def __init__(self, commands: str, **kwargs: Any) -> None:
+    self.tmpdir = tempfile.TemporaryDirectory(prefix='vivado-hls-')
+    super().__init__(get_vivado_hls_args(self.tmpdir.name, commands),
+                     cwd=self.tmpdir.name,
+                     **kwargs)
+
+  def cleanup(self) -> None:
+    self.tmpdir.cleanup()
+
+
 PACKAGEXO_COMMANDS = r'''
 set tmp_ip_dir "{tmpdir}/tmp_ip_dir"
 set tmp_project "{tmpdir}/tmp_project"
@@ -117,7 +174,8 @@ class PackageXo(Vivado):
     xo_file: Name of the generated xo file.
     top_name: Top-level module name.
     kernel_xml: Name of a xml file containing description of the kernel.
-    hdl_dir: Directory name containing all HDL files.
+    hdl_dir: Directory name containing all HDL files. Tcl files in it are
+        sourced in the packaging project, e.g., as written by write_floorplan.
     m_axi_names: Variable names connected to the m_axi bus.
     iface_names: Other interface names, default to ('s_axi_control').
     cpp_kernels: File names of C++ kernels.
@@ -132,28 +190,122 @@ class PackageXo(Vivado):
                iface_names: Iterable[str] = ('s_axi_control',),
                cpp_kernels=()):
     self.tmpdir = tempfile.TemporaryDirectory(prefix='package-xo-')
-    if _logger.isEnabledFor(logging.INFO):
-      for _, _, files in os.walk(hdl_dir):
-        for filename in files:
-          _logger.info('packing: %s', filename)
-    iface_names = list(iface_names)
-    iface_names.extend(map('m_axi_{}'.format, m_axi_names))
-    kwargs = {
-        'top_name': top_name,
-        'kernel_xml': kernel_xml,
-        'hdl_dir': hdl_dir,
-        'xo_file': xo_file,
-        'bus_ifaces': ''.join(map(BUS_IFACE.format, iface_names)),
-        'tmpdir': self.tmpdir.name,
-        'cpp_kernels': ''.join(map(' -kernel_files {}'.format, cpp_kernels))
-    }
-    super().__init__(PACKAGEXO_COMMANDS.format(**kwargs))
+    super().__init__(
+        get_package_xo_commands(self.tmpdir.name, xo_file, top_name,
+                                kernel_xml, hdl_dir, m_axi_names, iface_names,
+                                cpp_kernels))
 
   def __exit__(self, *args) -> None:
     super().__exit__(*args)
     self.tmpdir.cleanup()
 
 
+class AsyncPackageXo(AsyncVivado):
+  """Packages the given files into a Xilinx hardware object under asyncio.
+
+  This is the asyncio counterpart of PackageXo, with the same arguments and
+  additional keyword arguments of runner.Runner.
+  """
+
+  def __init__(self,
+               xo_file: str,
+               top_name: str,
+               kernel_xml: str,
+               hdl_dir: str,
+               m_axi_names: Iterable[str] = (),
+               iface_names: Iterable[str] = ('s_axi_control',),
+               cpp_kernels=(),
+               **kwargs: Any) -> None:
+    self.package_dir = tempfile.TemporaryDirectory(prefix='package-xo-')
+    super().__init__(
+        get_package_xo_commands(self.package_dir.name, xo_file, top_name,
+                                kernel_xml, hdl_dir, m_axi_names, iface_names,
+                                cpp_kernels), **kwargs)
+
+  def cleanup(self) -> None:
+    super().cleanup()
+    self.package_dir.cleanup()
+
+
+def get_package_xo_commands(tmpdir: str,
+                            xo_file: str,
+                            top_name: str,
+                            kernel_xml: str,
+                            hdl_dir: str,
+                            m_axi_names: Iterable[str] = (),
+                            iface_names: Iterable[str] = ('s_axi_control',),
+                            cpp_kernels=()) -> str:
+  """Returns the Tcl commands of PackageXo, with tmpdir as the temporary
+  directory and the other arguments as in PackageXo.
+  """
+  if _logger.isEnabledFor(logging.INFO):
+    for _, _, files in os.walk(hdl_dir):
+      for filename in files:
+        _logger.info('packing: %s', filename)
+  iface_names = list(iface_names)
+  iface_names.extend(map('m_axi_{}'.format, m_axi_names))
+  kwargs = {
+      'top_name': top_name,
+      'kernel_xml': kernel_xml,
+      'hdl_dir': hdl_dir,
+      'xo_file': xo_file,
+      'bus_ifaces': ''.join(map(BUS_IFACE.format, iface_names)),
+      'tmpdir': tmpdir,
+      'cpp_kernels': ''.join(map(' -kernel_files {}'.format, cpp_kernels))
+  }
+  return PACKAGEXO_COMMANDS.format(**kwargs)
+
+
+FLOORPLAN_TCL = r'''
+# floorplan constraints of the kernel, applied in implementation
+set floorplan_xdc [file join [file dirname [info script]] "{xdc_file}"]
+add_files -fileset constrs_1 -norecurse ${{floorplan_xdc}}
+set_property USED_IN_SYNTHESIS false [get_files ${{floorplan_xdc}}]
+set_property PROCESSING_ORDER LATE [get_files ${{floorplan_xdc}}]
+'''
+
+
+def print_pblock_xdc(out: TextIO,
+                     cells: Mapping[int, Iterable[str]],
+                     prefix: str = 'pblock_slr') -> None:
+  """Print XDC constraints that place cells in SLRs.
+
+  Args:
+    out: File object to write to.
+    cells: Mapping from SLR indices to cell name patterns, e.g., as returned
+        by haoda.ir.dataflow.floorplan.Floorplan.get_cells.
+    prefix: Prefix of the pblock names, followed by the SLR index.
+  """
+  for slr, patterns in cells.items():
+    pblock = '[get_pblocks {}{}]'.format(prefix, slr)
+    out.write('create_pblock {}{}\n'.format(prefix, slr))
+    out.write('resize_pblock {} -add SLR{}\n'.format(pblock, slr))
+    for pattern in patterns:
+      out.write('add_cells_to_pblock {} [get_cells -quiet -hierarchical '
+                '-filter {{NAME =~ "{}"}}]\n'.format(pblock, pattern))
+
+
+def write_floorplan(hdl_dir: str,
+                    cells: Mapping[int, Iterable[str]],
+                    name: str = 'floorplan') -> None:
+  """Write the floorplan constraints to the HDL directory of PackageXo.
+
+  The constraints are written to {name}.xdc, and {name}.tcl adds them to the
+  packaged kernel when sourced by PackageXo. Unchanged files are not rewritten.
+
+  Args:
+    hdl_dir: Directory name containing all HDL files.
+    cells: Mapping from SLR indices to cell name patterns as in
+        print_pblock_xdc.
+    name: Base name of the files.
+  """
+  xdc = io.StringIO()
+  print_pblock_xdc(xdc, cells)
+  util.update_file(os.path.join(hdl_dir, name + '.xdc'), xdc.getvalue())
+  util.update_file(os.path.join(hdl_dir, name + '.tcl'),
+                   FLOORPLAN_TCL.format(xdc_file=name + '.xdc').lstrip('\n'))
+
+
 HLS_COMMANDS = r'''
 cd "{project_dir}"
 open_project "{project_name}"
@@ -170,18 +322,205 @@ exit
 '''
 
 
+class HlsCache:
+  """A local content-addressed cache of HLS results.
+
+  Each entry is a tarball as packed by pack_hls_results, keyed by the SHA-256
+  of the path, content, and cflags of the kernel files, the path and content of
+  the headers they include as found by get_included_files and of extra_files,
+  the top name, clock period, part number, reset level, HLS_COMMANDS, and the
+  tool version.
+
+  Entries are written atomically, so concurrent runs may share the cache. When
+  max_bytes is set, the least recently used entries are removed on store.
+
+  Attributes:
+    cache_dir: Directory of the cache, default to $XDG_CACHE_HOME/haoda/hls.
+    tool_version: String identifying the tool. Default to the resolved path of
+        vivado_hls, which includes the version of a Xilinx installation.
+    max_bytes: Optional maximum total size of the entries in bytes.
+  """
+
+  def __init__(self,
+               cache_dir: Optional[str] = None,
+               tool_version: Optional[str] = None,
+               max_bytes: Optional[int] = None) -> None:
+    if cache_dir is None:
+      cache_dir = os.path.join(
+          os.environ.get('XDG_CACHE_HOME',
+                         os.path.join(os.path.expanduser('~'), '.cache')),
+          'haoda', 'hls')
+    if tool_version is None:
+      tool_path = shutil.which('vivado_hls')
+      tool_version = os.path.realpath(tool_path) if tool_path else ''
+    self.cache_dir = cache_dir
+    self.tool_version = tool_version
+    self.max_bytes = max_bytes
+
+  def __repr__(self) -> str:
+    return '%s(%s)' % (type(self).__name__, self.cache_dir)
+
+  def get_key(self,
+              kernel_files: Iterable[Union[str, Tuple[str, str]]],
+              top_name: str,
+              clock_period: str,
+              part_num: str,
+              reset_low: bool = True,
+              extra_files: Iterable[str] = ()) -> str:
+    """Returns the cache key of a RunHls with the given arguments.
+
+    Args:
+      kernel_files: Kernel files as in RunHls.
+      top_name: Top-level module name.
+      clock_period: Target clock period.
+      part_num: Target part number.
+      reset_low: Whether the reset is active low.
+      extra_files: File names of other inputs not found by get_included_files.
+
+    Returns:
+      The key as a hex string.
+    """
+    digest = hashlib.sha256()
+
+    def update(*fields: Any) -> None:
+      for field in fields:
+        digest.update(str(field).encode())
+        digest.update(b'\0')
+
+    update(self.tool_version, HLS_COMMANDS, top_name, clock_period, part_num,
+           reset_low)
+    headers = set()  # type: Set[str]
+    for kernel_file in kernel_files:
+      if isinstance(kernel_file, str):
+        kernel_file = (kernel_file, '')
+      update(os.path.abspath(kernel_file[0]), kernel_file[1],
+             _hash_file(kernel_file[0]))
+      headers.update(get_included_files(*kernel_file))
+    for header in sorted(headers):
+      update(header, _hash_file(header))
+    for extra_file in extra_files:
+      update(os.path.abspath(extra_file), _hash_file(extra_file))
+    return digest.hexdigest()
+
+  def get_path(self, key: str) -> str:
+    return os.path.join(self.cache_dir, key[:2], key + '.tar')
+
+  def load(self, key: str) -> Optional[bytes]:
+    """Returns the cached tarball, or None if it is not cached."""
+    path = self.get_path(key)
+    try:
+      with open(path, 'rb') as tar_file:
+        content = tar_file.read()
+      os.utime(path)
+    except FileNotFoundError:
+      _logger.debug('HLS cache miss: %s', key)
+      return None
+    _logger.info('HLS cache hit: %s', key)
+    return content
+
+  def store(self, key: str, content: bytes) -> None:
+    """Store a tarball and evict old entries if the cache is too large."""
+    path = self.get_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    util.update_file(path, content)
+    if self.max_bytes is not None:
+      self.evict(self.max_bytes)
+
+  def evict(self, max_bytes: int) -> None:
+    """Remove the least recently used entries until at most max_bytes remain.
+    """
+    entries = []
+    for path in glob.glob(os.path.join(self.cache_dir, '*', '*.tar')):
+      try:
+        stat = os.stat(path)
+      except FileNotFoundError:
+        continue
+      entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+      if total <= max_bytes:
+        break
+      with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+        _logger.debug('evicted %s from the HLS cache', path)
+      total -= size
+
+
+def _hash_file(path: str) -> str:
+  with open(path, 'rb') as f:
+    return hashlib.sha256(f.read()).hexdigest()
+
+
+_INCLUDE_REGEX = re.compile(r'^\s*#\s*include\s*([<"])([^>"]+)[>"]',
+                            re.MULTILINE)
+
+
+def get_included_files(kernel_file: str, cflags: str = '') -> List[str]:
+  """Returns the headers included by a kernel file, directly or indirectly.
+
+  Quoted headers are searched in the directory of the including file, then in
+  the -I directories in cflags, and angle-bracket headers in the -I directories
+  only. Headers not found, e.g., those shipped with the tool, are skipped, since
+  they are covered by the tool version. Preprocessor conditionals are not
+  evaluated, so headers in excluded branches are returned as well.
+
+  Args:
+    kernel_file: Name of the kernel file.
+    cflags: Compiler flags of the kernel file.
+
+  Returns:
+    Sorted list of the absolute paths of the headers.
+  """
+  include_dirs = []
+  args = shlex.split(cflags)
+  for idx, arg in enumerate(args):
+    if arg == '-I' and idx + 1 < len(args):
+      include_dirs.append(os.path.abspath(args[idx + 1]))
+    elif arg.startswith('-I') and len(arg) > 2:
+      include_dirs.append(os.path.abspath(arg[2:]))
+  headers = set()  # type: Set[str]
+  queue = [os.path.abspath(kernel_file)]
+  while queue:
+    path = queue.pop()
+    with open(path, errors='replace') as src_file:
+      content = src_file.read()
+    for match in _INCLUDE_REGEX.finditer(content):
+      search_dirs = include_dirs
+      if match.group(1) == '"':
+        search_dirs = [os.path.dirname(path)] + include_dirs
+      for search_dir in search_dirs:
+        header = os.path.normpath(os.path.join(search_dir, match.group(2)))
+        if os.path.isfile(header):
+          if header not in headers:
+            headers.add(header)
+            queue.append(header)
+          break
+  return sorted(headers)
+
+
 class RunHls(VivadoHls):
   """Runs Vivado HLS for the given kernels and generate HDL files
 
   This is a subclass of subprocess.Popen. A temporary directory will be created
   and used as the working directory.
 
+  If an HlsCache is given and has the results, they are written to tarfileobj
+  and a no-op process is started in place of vivado_hls. Successful results
+  are stored in the cache otherwise.
+
   Args:
     tarfileobj: File object that will contain the reports and HDL files.
     kernel_files: File names or tuple of file names and cflags of the kernels.
     top_name: Top-level module name.
     clock_period: Target clock period.
     part_num: Target part number.
+    reset_low: Whether the reset is active low.
+    cache: Optional HlsCache.
+    extra_files: File names of other inputs of the kernels hashed in the cache
+        key, in addition to the included headers.
+
+  Attributes:
+    cached: Whether the results are loaded from the cache.
   """
 
   def __init__(self,
@@ -190,54 +529,175 @@ class RunHls(VivadoHls):
                top_name: str,
                clock_period: str,
                part_num: str,
-               reset_low: bool = True):
+               reset_low: bool = True,
+               cache: Optional[HlsCache] = None,
+               extra_files: Iterable[str] = ()):
+    kernel_files = tuple(kernel_files)
     self.project_dir = tempfile.TemporaryDirectory(prefix='run-hls-')
     self.project_name = 'project'
     self.solution_name = top_name
     self.tarfileobj = tarfileobj
-    kernels = []
-    for kernel_file in kernel_files:
-      if isinstance(kernel_file, str):
-        kernels.append(
-            'add_files "{}" -cflags "-std=c++11"'.format(kernel_file))
-      else:
-        kernels.append(
-            'add_files "{}" -cflags "-std=c++11 {}"'.format(*kernel_file))
-    kwargs = {
-        'project_dir': self.project_dir.name,
-        'project_name': self.project_name,
-        'solution_name': self.solution_name,
-        'top_name': top_name,
-        'add_kernels': '\n'.join(kernels),
-        'part_num': part_num,
-        'clock_period': clock_period,
-        'reset_level': 'low' if reset_low else 'high',
-    }
-    super().__init__(HLS_COMMANDS.format(**kwargs))
+    self.cache = cache
+    self.cache_key = None  # type: Optional[str]
+    self.cached = False
+    if cache is not None:
+      self.cache_key = cache.get_key(kernel_files, top_name, clock_period,
+                                     part_num, reset_low, extra_files)
+      content = cache.load(self.cache_key)
+      if content is not None:
+        tarfileobj.write(content)
+        self.cached = True
+        self.cwd = tempfile.TemporaryDirectory(prefix='vivado-hls-')
+        pipe_args = {'stdout': subprocess.PIPE, 'stderr': subprocess.PIPE}
+        subprocess.Popen.__init__(self, ['true'], **pipe_args)  # type: ignore
+        return
+    super().__init__(
+        get_hls_commands(self.project_dir.name, self.project_name,
+                         kernel_files, top_name, clock_period, part_num,
+                         reset_low))
 
   def __exit__(self, *args):
     self.wait()
-    if self.returncode == 0:
-      with tarfile.open(mode='w', fileobj=self.tarfileobj) as tar:
-        solution_dir = os.path.join(self.project_dir.name, self.project_name,
-                                    self.solution_name)
-        try:
-          tar.add(os.path.join(solution_dir, 'syn/report'), arcname='report')
-          tar.add(os.path.join(solution_dir, 'syn/verilog'), arcname='hdl')
-          tar.add(os.path.join(solution_dir, self.cwd.name, 'vivado_hls.log'),
-                  arcname='log/' + self.solution_name + '.log')
-          for pattern in ('*.sched.adb.xml', '*.verbose.sched.rpt',
-                          '*.verbose.sched.rpt.xml'):
-            for f in glob.glob(
-                os.path.join(solution_dir, '.autopilot', 'db', pattern)):
-              tar.add(f, arcname='report/' + os.path.basename(f))
-        except FileNotFoundError as e:
-          self.returncode = 1
-          _logger.error('%s', e)
+    if self.returncode == 0 and not self.cached and not _pack_hls_results(
+        self.tarfileobj, self.cache, self.cache_key, self.project_dir.name,
+        self.project_name, self.solution_name, self.cwd.name):
+      self.returncode = 1
     super().__exit__(*args)
     self.project_dir.cleanup()
 
 
+class AsyncRunHls(AsyncVivadoHls):
+  """Runs Vivado HLS for the given kernels and generate HDL files under asyncio.
+
+  This is the asyncio counterpart of RunHls, with the same arguments and
+  additional keyword arguments of runner.Runner. The tarball is written to
+  tarfileobj once the tool succeeds, or by run without starting the tool if
+  the cache has it.
+  """
+
+  def __init__(self,
+               tarfileobj: BinaryIO,
+               kernel_files: Iterable[Union[str, Tuple[str, str]]],
+               top_name: str,
+               clock_period: str,
+               part_num: str,
+               reset_low: bool = True,
+               cache: Optional[HlsCache] = None,
+               extra_files: Iterable[str] = (),
+               **kwargs: Any) -> None:
+    kernel_files = tuple(kernel_files)
+    self.project_dir = tempfile.TemporaryDirectory(prefix='run-hls-')
+    self.project_name = 'project'
+    self.solution_name = top_name
+    self.tarfileobj = tarfileobj
+    self.cache = cache
+    self.cache_key = None  # type: Optional[str]
+    self.cached = False
+    if cache is not None:
+      self.cache_key = cache.get_key(kernel_files, top_name, clock_period,
+                                     part_num, reset_low, extra_files)
+    super().__init__(
+        get_hls_commands(self.project_dir.name, self.project_name,
+                         kernel_files, top_name, clock_period, part_num,
+                         reset_low), **kwargs)
+
+  async def run(self) -> int:
+    if self.cache is not None:
+      content = self.cache.load(self.cache_key)
+      if content is not None:
+        self.tarfileobj.write(content)
+        self.cached = True
+        self.returncode = 0
+        self.cleanup()
+        return self.returncode
+    return await super().run()
+
+  def finish(self) -> None:
+    if self.returncode == 0 and not _pack_hls_results(
+        self.tarfileobj, self.cache, self.cache_key, self.project_dir.name,
+        self.project_name, self.solution_name, self.tmpdir.name):
+      self.returncode = 1
+
+  def cleanup(self) -> None:
+    super().cleanup()
+    self.project_dir.cleanup()
+
+
+def get_hls_commands(project_dir: str,
+                     project_name: str,
+                     kernel_files: Iterable[Union[str, Tuple[str, str]]],
+                     top_name: str,
+                     clock_period: str,
+                     part_num: str,
+                     reset_low: bool = True) -> str:
+  """Returns the Tcl commands of RunHls, with the solution named after the top
+  and the other arguments as in RunHls.
+  """
+  kernels = []
+  for kernel_file in kernel_files:
+    if isinstance(kernel_file, str):
+      kernels.append('add_files "{}" -cflags "-std=c++11"'.format(kernel_file))
+    else:
+      kernels.append(
+          'add_files "{}" -cflags "-std=c++11 {}"'.format(*kernel_file))
+  kwargs = {
+      'project_dir': project_dir,
+      'project_name': project_name,
+      'solution_name': top_name,
+      'top_name': top_name,
+      'add_kernels': '\n'.join(kernels),
+      'part_num': part_num,
+      'clock_period': clock_period,
+      'reset_level': 'low' if reset_low else 'high',
+  }
+  return HLS_COMMANDS.format(**kwargs)
+
+
+def pack_hls_results(tarfileobj: BinaryIO, project_dir: str, project_name: str,
+                     solution_name: str, cwd: str) -> bool:
+  """Pack the reports, HDL files, and log of a Vivado HLS run into a tarball.
+
+  Args:
+    tarfileobj: File object that will contain the reports and HDL files.
+    project_dir: Directory of the HLS project.
+    project_name: Name of the HLS project.
+    solution_name: Name of the HLS solution.
+    cwd: Working directory of vivado_hls, where the log is.
+
+  Returns:
+    Whether all results are found.
+  """
+  with tarfile.open(mode='w', fileobj=tarfileobj) as tar:
+    solution_dir = os.path.join(project_dir, project_name, solution_name)
+    try:
+      tar.add(os.path.join(solution_dir, 'syn/report'), arcname='report')
+      tar.add(os.path.join(solution_dir, 'syn/verilog'), arcname='hdl')
+      tar.add(os.path.join(solution_dir, cwd, 'vivado_hls.log'),
+              arcname='log/' + solution_name + '.log')
+      for pattern in ('*.sched.adb.xml', '*.verbose.sched.rpt',
+                      '*.verbose.sched.rpt.xml'):
+        for f in glob.glob(
+            os.path.join(solution_dir, '.autopilot', 'db', pattern)):
+          tar.add(f, arcname='report/' + os.path.basename(f))
+    except FileNotFoundError as e:
+      _logger.error('%s', e)
+      return False
+  return True
+
+
+def _pack_hls_results(tarfileobj: BinaryIO, cache: Optional[HlsCache],
+                      cache_key: Optional[str], *args: str) -> bool:
+  """Pack the results as in pack_hls_results and store them in the cache."""
+  if cache is None:
+    return pack_hls_results(tarfileobj, *args)
+  buf = io.BytesIO()
+  if not pack_hls_results(buf, *args):
+    return False
+  tarfileobj.write(buf.getvalue())
+  cache.store(cache_key, buf.getvalue())
+  return True
+
+
 XILINX_XML_NS = {'xd': 'http://www.xilinx.com/xd'}
 
 
@@ -345,10 +805,10 @@ def print_kernel_xml(top_name: str, axis_inputs: Iterable[Tuple[str, str,
 
 BRAM_FIFO_TEMPLATE = '''`default_nettype none
 
-// first-word fall-through (FWFT) FIFO using block RAM
+// first-word fall-through (FWFT) FIFO using block RAM, or any RAM style
 // based on HLS generated code
 module {name} #(
-  parameter MEM_STYLE  = "block",
+  parameter MEM_STYLE  = "{mem_style}",
   parameter DATA_WIDTH = {width},
   parameter ADDR_WIDTH = {addr_width},
   parameter DEPTH      = {depth}
@@ -583,9 +1043,13 @@ endmodule  // fifo_srl
 AUTO_FIFO_TEMPLATE = '''`default_nettype none
 
 // first-word fall-through (FWFT) FIFO
-// if its capacity > 1024 bits, it uses block RAM, otherwise it will uses shift
-// register LUT
+// MEM_STYLE selects the implementation: "shiftreg" uses shift register LUT,
+// "block", "distributed", "ultra" or "registers" use fifo_bram with that RAM
+// style, and "auto" uses block RAM if its capacity > BRAM_THRESHOLD bits and
+// shift register LUT otherwise
 module {name} #(
+  parameter MEM_STYLE      = "auto",
+  parameter BRAM_THRESHOLD = 1024,
   parameter DATA_WIDTH = 32,
   parameter ADDR_WIDTH = 5,
   parameter DEPTH      = 32
@@ -607,8 +1071,10 @@ module {name} #(
 );
 
 generate
-  if (DATA_WIDTH * DEPTH > 1024) begin : bram
+  if (MEM_STYLE == "auto" ? DATA_WIDTH * DEPTH > BRAM_THRESHOLD
+                           : MEM_STYLE != "shiftreg") begin : bram
     fifo_bram #(
+      .MEM_STYLE (MEM_STYLE == "auto" ? "block" : MEM_STYLE),
       .DATA_WIDTH(DATA_WIDTH),
       .ADDR_WIDTH(ADDR_WIDTH),
       .DEPTH     (DEPTH)
@@ -654,14 +1120,340 @@ endmodule  // fifo
 '''
 
 
+ALMOST_FULL_FIFO_TEMPLATE = '''`default_nettype none
+
+// first-word fall-through (FWFT) FIFO with a registered almost-full signal
+// if_full_n is deasserted once GRACE_PERIOD or fewer entries are free, so that
+// writers may keep writing for GRACE_PERIOD cycles after it is deasserted and
+// it can be pipelined to the writer
+module {name} #(
+  parameter MEM_STYLE    = "{mem_style}",
+  parameter DATA_WIDTH   = {width},
+  parameter ADDR_WIDTH   = {addr_width},
+  parameter DEPTH        = {depth},
+  parameter GRACE_PERIOD = {grace_period}
+) (
+  input wire clk,
+  input wire reset,
+
+  // write
+  output wire                  if_full_n,
+  input  wire                  if_write_ce,
+  input  wire                  if_write,
+  input  wire [DATA_WIDTH-1:0] if_din,
+
+  // read
+  output wire                  if_empty_n,
+  input  wire                  if_read_ce,
+  input  wire                  if_read,
+  output wire [DATA_WIDTH-1:0] if_dout
+);
+
+(* ram_style = MEM_STYLE *)
+reg  [DATA_WIDTH-1:0] mem[0:DEPTH-1];
+reg  [ADDR_WIDTH-1:0] waddr;
+reg  [ADDR_WIDTH-1:0] raddr;
+reg  [ADDR_WIDTH:0]   used;
+reg                   full_n;
+reg  [DATA_WIDTH-1:0] dout_buf;
+reg                   dout_valid;
+wire                  push;
+wire                  pop;
+wire [ADDR_WIDTH:0]   used_next;
+
+assign if_full_n  = full_n;
+assign if_empty_n = dout_valid;
+assign if_dout    = dout_buf;
+// writes in the grace period are accepted as long as there is space
+assign push       = if_write_ce & if_write & (used != DEPTH);
+assign pop        = (used != 0) & (~dout_valid | (if_read_ce & if_read));
+assign used_next  = used + push - pop;
+
+always @(posedge clk) begin
+  if (reset) begin
+    waddr      <= {{ADDR_WIDTH{{1'b0}}}};
+    raddr      <= {{ADDR_WIDTH{{1'b0}}}};
+    used       <= {{(ADDR_WIDTH+1){{1'b0}}}};
+    full_n     <= 1'b1;
+    dout_valid <= 1'b0;
+  end else begin
+    if (push)
+      waddr <= waddr == DEPTH - 1 ? {{ADDR_WIDTH{{1'b0}}}} : waddr + 1'd1;
+    if (pop)
+      raddr <= raddr == DEPTH - 1 ? {{ADDR_WIDTH{{1'b0}}}} : raddr + 1'd1;
+    used   <= used_next;
+    full_n <= used_next < DEPTH - GRACE_PERIOD;
+    if (pop)
+      dout_valid <= 1'b1;
+    else if (if_read_ce & if_read)
+      dout_valid <= 1'b0;
+  end
+end
+
+always @(posedge clk) begin
+  if (push)
+    mem[waddr] <= if_din;
+end
+
+always @(posedge clk) begin
+  if (pop)
+    dout_buf <= mem[raddr];
+end
+
+endmodule  // fifo_almost_full
+
+`default_nettype wire
+'''
+
+RELAY_STATION_TEMPLATE = '''`default_nettype none
+
+// first-word fall-through (FWFT) FIFO with LEVEL pipeline stages on the write
+// data, write enable, and full signals, terminated by an almost-full FIFO that
+// absorbs the data in flight, so that the FIFO can span long distances
+module {name} #(
+  parameter MEM_STYLE  = "{mem_style}",
+  parameter DATA_WIDTH = {width},
+  parameter ADDR_WIDTH = {addr_width},
+  parameter DEPTH      = {depth},
+  parameter LEVEL      = {level}
+) (
+  input wire clk,
+  input wire reset,
+
+  // write
+  output wire                  if_full_n,
+  input  wire                  if_write_ce,
+  input  wire                  if_write,
+  input  wire [DATA_WIDTH-1:0] if_din,
+
+  // read
+  output wire                  if_empty_n,
+  input  wire                  if_read_ce,
+  input  wire                  if_read,
+  output wire [DATA_WIDTH-1:0] if_dout
+);
+
+(* shreg_extract = "no" *) reg [DATA_WIDTH-1:0] data_pipe[0:LEVEL-1];
+(* shreg_extract = "no" *) reg [LEVEL-1:0]      valid_pipe;
+(* shreg_extract = "no" *) reg [LEVEL-1:0]      full_n_pipe;
+wire                                            tail_full_n;
+
+assign if_full_n = full_n_pipe[LEVEL-1];
+
+integer i;
+always @(posedge clk) begin
+  if (reset) begin
+    valid_pipe  <= {{LEVEL{{1'b0}}}};
+    full_n_pipe <= {{LEVEL{{1'b1}}}};
+  end else begin
+    valid_pipe[0]  <= if_write_ce & if_write & full_n_pipe[LEVEL-1];
+    full_n_pipe[0] <= tail_full_n;
+    for (i = 1; i < LEVEL; i = i + 1) begin
+      valid_pipe[i]  <= valid_pipe[i-1];
+      full_n_pipe[i] <= full_n_pipe[i-1];
+    end
+  end
+end
+
+always @(posedge clk) begin
+  data_pipe[0] <= if_din;
+  for (i = 1; i < LEVEL; i = i + 1)
+    data_pipe[i] <= data_pipe[i-1];
+end
+
+{tail_name} #(
+  .MEM_STYLE   (MEM_STYLE),
+  .DATA_WIDTH  (DATA_WIDTH),
+  .ADDR_WIDTH  (ADDR_WIDTH),
+  .DEPTH       (DEPTH),
+  .GRACE_PERIOD(LEVEL * 2 + 1)
+) tail (
+  .clk  (clk),
+  .reset(reset),
+
+  .if_full_n  (tail_full_n),
+  .if_write_ce(1'b1),
+  .if_write   (valid_pipe[LEVEL-1]),
+  .if_din     (data_pipe[LEVEL-1]),
+
+  .if_empty_n(if_empty_n),
+  .if_read_ce(if_read_ce),
+  .if_read   (if_read),
+  .if_dout   (if_dout)
+);
+
+endmodule  // fifo_relay_station
+
+`default_nettype wire
+'''
+
+REGISTER_SLICE_TEMPLATE = '''`default_nettype none
+
+// first-word fall-through (FWFT) FIFO of 2 entries as a register slice, i.e.,
+// a skid buffer, where if_full_n and if_empty_n are both registered and there
+// is no combinational path from the reader to the writer
+module {name} #(
+  parameter DATA_WIDTH = {width}
+) (
+  input wire clk,
+  input wire reset,
+
+  // write
+  output wire                  if_full_n,
+  input  wire                  if_write_ce,
+  input  wire                  if_write,
+  input  wire [DATA_WIDTH-1:0] if_din,
+
+  // read
+  output wire                  if_empty_n,
+  input  wire                  if_read_ce,
+  input  wire                  if_read,
+  output wire [DATA_WIDTH-1:0] if_dout
+);
+
+reg  [DATA_WIDTH-1:0] main_data;
+reg                   main_valid;
+reg  [DATA_WIDTH-1:0] skid_data;
+reg                   skid_valid;
+wire                  push;
+wire                  pop;
+
+assign if_full_n  = ~skid_valid;
+assign if_empty_n = main_valid;
+assign if_dout    = main_data;
+assign push       = if_write_ce & if_write & ~skid_valid;
+assign pop        = if_read_ce & if_read & main_valid;
+
+always @(posedge clk) begin
+  if (reset) begin
+    main_valid <= 1'b0;
+    skid_valid <= 1'b0;
+  end else if (~main_valid | pop) begin
+    main_valid <= skid_valid | push;
+    skid_valid <= 1'b0;
+  end else if (push) begin
+    skid_valid <= 1'b1;
+  end
+end
+
+always @(posedge clk) begin
+  if (~main_valid | pop)
+    main_data <= skid_valid ? skid_data : if_din;
+  if (push & main_valid & ~pop)
+    skid_data <= if_din;
+end
+
+endmodule  // fifo_register_slice
+
+`default_nettype wire
+'''
+
+# FIFO styles that trade resources for timing, in addition to FIFO_IMPLS
+FIFO_STYLES = 'almost_full', 'relay_station', 'register_slice'
+
+
+# FIFO implementations, in the order of preference when costs tie
+FIFO_IMPLS = 'srl', 'lutram', 'bram', 'uram', 'registers'
+
+# ram_style of fifo_bram for each implementation other than SRL
+FIFO_MEM_STYLES = {
+    'lutram': 'distributed',
+    'bram': 'block',
+    'uram': 'ultra',
+    'registers': 'registers',
+}
+
+
+class FifoCostTable:
+  """Geometry of the memory primitives of a device family, used to estimate
+  the resources of FIFO implementations.
+
+  Attributes:
+    srl_depth: Depth of an SRL primitive, 1 bit wide and 1 LUT each.
+    lutram: (width, depth, LUTs) of a simple dual-port LUTRAM primitive.
+    bram_aspects: (width, depth) aspect ratios of a BRAM_18K primitive.
+    uram: (width, depth) of a URAM primitive, or None if not available.
+  """
+
+  def __init__(self,
+               srl_depth: int,
+               lutram: Tuple[int, int, int],
+               bram_aspects: Iterable[Tuple[int, int]],
+               uram: Optional[Tuple[int, int]] = None) -> None:
+    self.srl_depth = srl_depth
+    self.lutram = lutram
+    self.bram_aspects = tuple(bram_aspects)
+    self.uram = uram
+
+  def get_cost(self, impl: str, width: int, depth: int) -> Dict[str, int]:
+    """Estimate the resources of the memory of a FIFO.
+
+    The control logic is the same for all implementations and is not counted.
+
+    Args:
+      impl: One of FIFO_IMPLS.
+      width: FIFO width.
+      depth: FIFO depth.
+
+    Returns:
+      Dict mapping resource names, i.e., FF, LUT, BRAM_18K, and URAM, to usage.
+
+    Raises:
+      ValueError: If impl is invalid or not available on the device.
+    """
+    cost = {'FF': 0, 'LUT': 0, 'BRAM_18K': 0, 'URAM': 0}
+    if impl == 'registers':
+      # one register per bit, read mux of about one LUT per bit per entry
+      cost['FF'] = width * depth
+      cost['LUT'] = width * depth
+    elif impl == 'srl':
+      cost['LUT'] = width * _ceil_div(depth, self.srl_depth)
+    elif impl == 'lutram':
+      lutram_width, lutram_depth, luts = self.lutram
+      cost['LUT'] = (luts * _ceil_div(width, lutram_width) *
+                     _ceil_div(depth, lutram_depth))
+      cost['FF'] = width  # output register
+    elif impl == 'bram':
+      cost['BRAM_18K'] = min(
+          _ceil_div(width, aspect_width) * _ceil_div(depth, aspect_depth)
+          for aspect_width, aspect_depth in self.bram_aspects)
+    elif impl == 'uram' and self.uram is not None:
+      cost['URAM'] = (_ceil_div(width, self.uram[0]) *
+                      _ceil_div(depth, self.uram[1]))
+    else:
+      raise ValueError('FIFO implementation %s is not available' % impl)
+    return cost
+
+
+_BRAM_18K_ASPECTS = ((36, 512), (18, 1024), (9, 2048), (4, 4096), (2, 8192),
+                     (1, 16384))
+
+FIFO_COST_TABLES = {
+    '7series':
+        FifoCostTable(srl_depth=32,
+                      lutram=(3, 64, 4),
+                      bram_aspects=_BRAM_18K_ASPECTS),
+    'ultrascale':
+        FifoCostTable(srl_depth=32,
+                      lutram=(7, 64, 8),
+                      bram_aspects=_BRAM_18K_ASPECTS),
+    'ultrascale_plus':
+        FifoCostTable(srl_depth=32,
+                      lutram=(7, 64, 8),
+                      bram_aspects=_BRAM_18K_ASPECTS,
+                      uram=(72, 4096)),
+}
+
+
 class VerilogPrinter(util.Printer):
   """A text-based Verilog printer."""
 
   def module(self, module_name: str, args: Iterable[str]) -> None:
     self.println('module %s (' % module_name)
     self.do_indent()
-    self._out.write(' ' * self._indent * self._tab)
-    self._out.write((',\n' + ' ' * self._indent * self._tab).join(args))
+    prefix = self._prefix(self._indent)
+    for idx, arg in enumerate(args):
+      self.write((',\n' if idx else '') + prefix + arg)
     self.un_indent()
     self.println('\n);')
 
@@ -710,17 +1502,28 @@ class VerilogPrinter(util.Printer):
     self.println('end else begin')
     self.do_indent()
 
-  def module_instance(self, module_name: str, instance_name: str,
-                      args: Union[Mapping[str, str], Iterable[str]]) -> None:
-    self.println('{module_name} {instance_name}('.format(**locals()))
-    self.do_indent()
-    if isinstance(args, collections.Mapping):
-      self._out.write(',\n'.join(' ' * self._indent * self._tab +
-                                 '.{}({})'.format(*arg)
-                                 for arg in args.items()))
+  def module_instance(
+      self,
+      module_name: str,
+      instance_name: str,
+      args: Union[Mapping[str, str], Iterable[str]],
+      params: Optional[Mapping[str, str]] = None) -> None:
+    if params:
+      self.println('%s #(' % module_name)
+      self.do_indent()
+      prefix = self._prefix(self._indent)
+      for idx, param in enumerate(params.items()):
+        self.write((',\n' if idx else '') + prefix + '.{}({})'.format(*param))
+      self.un_indent()
+      self.println('\n) {}('.format(instance_name))
     else:
-      self._out.write(',\n'.join(
-          ' ' * self._indent * self._tab + arg for arg in args))
+      self.println('{module_name} {instance_name}('.format(**locals()))
+    self.do_indent()
+    prefix = self._prefix(self._indent)
+    if isinstance(args, collections.abc.Mapping):
+      args = ('.{}({})'.format(*arg) for arg in args.items())
+    for idx, arg in enumerate(args):
+      self.write((',\n' if idx else '') + prefix + arg)
     self.un_indent()
     self.println('\n);')
 
@@ -728,11 +1531,16 @@ class VerilogPrinter(util.Printer):
                   width: int,
                   depth: int,
                   name: str = '',
-                  threshold: int = 1024) -> None:
+                  threshold: int = 1024,
+                  impl: Optional[str] = None,
+                  grace_period: int = 2,
+                  level: int = 1) -> None:
     """Generate FIFO with the given parameters.
 
-    Generate an FIFO module. If its capacity is larger than threshold, BRAM FIFO
-        will be used. Otherwise, SRL FIFO will be used.
+    Generate an FIFO module of the given implementation, e.g., as selected by
+        select_fifo_impls, or of one of FIFO_STYLES for timing closure. If not
+        given, BRAM FIFO will be used if its capacity is larger than threshold,
+        and SRL FIFO will be used otherwise.
 
     Args:
       width: FIFO width.
@@ -740,26 +1548,48 @@ class VerilogPrinter(util.Printer):
       name: Optionally give the fifo a name, default to
           'fifo_w{width}_d{depth}_A'.
       threshold: Optionally give a threshold to decide whether to use BRAM or
-          SRL. Defaults to 1024 bits.
+          SRL. Defaults to 1024 bits. For almost-full FIFOs and relay stations,
+          it decides whether to use BRAM or distributed RAM.
+      impl: Optionally give one of FIFO_IMPLS or FIFO_STYLES.
+      grace_period: Number of writes accepted after an almost-full FIFO
+          deasserts if_full_n.
+      level: Number of pipeline stages of a relay station.
 
     Raises:
-      ValueError: If depth or width is invalid.
+      ValueError: If depth, width, or impl is invalid.
     """
-    if width * depth > threshold:
-      self.bram_fifo_module(width, depth)
+    if impl is None:
+      impl = 'bram' if width * depth > threshold else 'srl'
+    mem_style = 'block' if width * depth > threshold else 'distributed'
+    if impl == 'srl':
+      self.srl_fifo_module(width, depth, name)
+    elif impl in FIFO_MEM_STYLES:
+      self.bram_fifo_module(width, depth, name, FIFO_MEM_STYLES[impl])
+    elif impl == 'almost_full':
+      self.almost_full_fifo_module(width, depth, name, mem_style, grace_period)
+    elif impl == 'relay_station':
+      self.relay_station_module(width, depth, name, mem_style, level)
+    elif impl == 'register_slice':
+      self.register_slice_module(width, depth, name)
     else:
-      self.srl_fifo_module(width, depth)
+      raise ValueError('Invalid FIFO implementation: %s' % impl)
 
-  def bram_fifo_module(self, width: int, depth: int, name: str = '') -> None:
+  def bram_fifo_module(self,
+                       width: int,
+                       depth: int,
+                       name: str = '',
+                       mem_style: str = 'block') -> None:
     """Generate BRAM FIFO with the given parameters.
 
-    Generate a BRAM FIFO module.
+    Generate a BRAM FIFO module. The same module implements distributed RAM,
+        UltraRAM, and register FIFOs with a different RAM style.
 
     Args:
       width: FIFO width.
       depth: FIFO depth.
       name: Optionally give the fifo a name, default to
           'fifo_w{width}_d{depth}_A'.
+      mem_style: Optionally give the ram_style, default to 'block'.
 
     Raises:
       ValueError: If depth or width is invalid.
@@ -768,10 +1598,11 @@ class VerilogPrinter(util.Printer):
       raise ValueError('Invalid BRAM FIFO depth: %d < 1' % depth)
     if not name:
       name = 'fifo_w{width}_d{depth}_A'.format(width=width, depth=depth)
-    self._out.write(
+    self.write(
         BRAM_FIFO_TEMPLATE.format(width=width,
                                   depth=depth,
                                   name=name,
+                                  mem_style=mem_style,
                                   addr_width=(depth - 1).bit_length()))
 
   def srl_fifo_module(self, width: int, depth: int, name: str = '') -> None:
@@ -793,9 +1624,397 @@ class VerilogPrinter(util.Printer):
     if not name:
       name = 'fifo_w{width}_d{depth}_A'.format(width=width, depth=depth)
     addr_width = (depth - 1).bit_length()
-    self._out.write(
+    self.write(
         SRL_FIFO_TEMPLATE.format(width=width,
                                  depth=depth,
                                  name=name,
                                  addr_width=addr_width,
                                  depth_width=addr_width + 1))
+
+  def almost_full_fifo_module(self,
+                              width: int,
+                              depth: int,
+                              name: str = '',
+                              mem_style: str = 'block',
+                              grace_period: int = 2) -> None:
+    """Generate almost-full FIFO with the given parameters.
+
+    Generate a FIFO module whose registered if_full_n is deasserted when
+        grace_period or fewer entries are free.
+
+    Args:
+      width: FIFO width.
+      depth: FIFO depth.
+      name: Optionally give the fifo a name, default to
+          'fifo_w{width}_d{depth}_A'.
+      mem_style: Optionally give the ram_style, default to 'block'.
+      grace_period: Optionally give the grace period, default to 2.
+
+    Raises:
+      ValueError: If depth or grace_period is invalid.
+    """
+    if grace_period < 0 or depth <= grace_period:
+      raise ValueError('Invalid almost-full FIFO depth: %d <= %d' %
+                       (depth, grace_period))
+    if not name:
+      name = 'fifo_w{width}_d{depth}_A'.format(width=width, depth=depth)
+    self.write(
+        ALMOST_FULL_FIFO_TEMPLATE.format(width=width,
+                                         depth=depth,
+                                         name=name,
+                                         mem_style=mem_style,
+                                         grace_period=grace_period,
+                                         addr_width=max(
+                                             (depth - 1).bit_length(), 1)))
+
+  def relay_station_module(self,
+                           width: int,
+                           depth: int,
+                           name: str = '',
+                           mem_style: str = 'block',
+                           level: int = 1) -> None:
+    """Generate relay station with the given parameters.
+
+    Generate a relay station module and the almost-full FIFO module it
+        instantiates, named '{name}_tail'. The FIFO must be deeper than
+        2 * level + 1 to absorb the data in flight.
+
+    Args:
+      width: FIFO width.
+      depth: FIFO depth.
+      name: Optionally give the fifo a name, default to
+          'fifo_w{width}_d{depth}_A'.
+      mem_style: Optionally give the ram_style, default to 'block'.
+      level: Optionally give the number of pipeline stages, default to 1.
+
+    Raises:
+      ValueError: If depth or level is invalid.
+    """
+    if level < 1:
+      raise ValueError('Invalid relay station level: %d < 1' % level)
+    if not name:
+      name = 'fifo_w{width}_d{depth}_A'.format(width=width, depth=depth)
+    tail_name = name + '_tail'
+    self.almost_full_fifo_module(width, depth, tail_name, mem_style,
+                                 level * 2 + 1)
+    self.write(
+        RELAY_STATION_TEMPLATE.format(width=width,
+                                      depth=depth,
+                                      name=name,
+                                      tail_name=tail_name,
+                                      mem_style=mem_style,
+                                      level=level,
+                                      addr_width=max(
+                                          (depth - 1).bit_length(), 1)))
+
+  def register_slice_module(self,
+                            width: int,
+                            depth: int = 2,
+                            name: str = '') -> None:
+    """Generate register slice FIFO with the given parameters.
+
+    Generate a FIFO module of 2 entries with all control signals registered.
+
+    Args:
+      width: FIFO width.
+      depth: FIFO depth, which must be 2.
+      name: Optionally give the fifo a name, default to
+          'fifo_w{width}_d{depth}_A'.
+
+    Raises:
+      ValueError: If depth is not 2.
+    """
+    if depth != 2:
+      raise ValueError('Invalid register slice FIFO depth: %d != 2' % depth)
+    if not name:
+      name = 'fifo_w{width}_d{depth}_A'.format(width=width, depth=depth)
+    self.write(REGISTER_SLICE_TEMPLATE.format(width=width, name=name))
+
+
+def _ceil_div(lhs: int, rhs: int) -> int:
+  return -(-lhs // rhs)
+
+
+def select_fifo_impls(
+    fifos: Iterable[Tuple[str, int, int]],
+    capacity: Mapping[str, float],
+    usage: Optional[Mapping[str, float]] = None,
+    cost_table: Union[str, FifoCostTable] = 'ultrascale_plus',
+    max_register_depth: int = 2) -> Dict[str, Tuple[str, Dict[str, int]]]:
+  """Select the implementation of each FIFO under a resource budget.
+
+  The FIFOs are assigned in decreasing order of capacity. Each FIFO takes the
+  implementation that fits in the remaining budget with the lowest cost, where
+  each resource is weighted by the inverse of its remaining amount, so that
+  scarce resources are saved for compute and for the larger FIFOs. Registers
+  are only used for FIFOs no deeper than max_register_depth, since their read
+  mux grows with the depth and hurts timing. If no implementation fits, the
+  one that overflows the budget the least is taken.
+
+  Args:
+    fifos: Iterable of (name, width, depth) tuples.
+    capacity: Mapping from resource names, i.e., FF, LUT, BRAM_18K, and URAM,
+        to the amount available on the device or to the FIFOs. A missing
+        resource is not available.
+    usage: Optional mapping from resource names to the amount used by the rest
+        of the design, e.g., haoda.report.xilinx.hls.HlsResources as a dict.
+    cost_table: A FifoCostTable or a key of FIFO_COST_TABLES.
+    max_register_depth: Maximum depth of a FIFO implemented as registers.
+
+  Returns:
+    Dict mapping FIFO names to (implementation, cost) in the given order.
+  """
+  if isinstance(cost_table, str):
+    cost_table = FIFO_COST_TABLES[cost_table]
+  if usage is None:
+    usage = {}
+  remaining = {
+      resource: capacity.get(resource, 0) - usage.get(resource, 0)
+      for resource in ('FF', 'LUT', 'BRAM_18K', 'URAM')
+  }
+  fifos = tuple(fifos)
+  selection = {}  # type: Dict[str, Tuple[str, Dict[str, int]]]
+  for name, width, depth in sorted(fifos, key=lambda _: -_[1] * _[2]):
+    candidates = []
+    for impl in FIFO_IMPLS:
+      if impl == 'registers' and depth > max_register_depth:
+        continue
+      if impl == 'uram' and cost_table.uram is None:
+        continue
+      cost = cost_table.get_cost(impl, width, depth)
+      overflow = max(
+          (amount / max(remaining[resource], 1)
+           for resource, amount in cost.items()
+           if amount > remaining[resource]),
+          default=0.)
+      weighted_cost = sum(amount / max(remaining[resource], 1)
+                          for resource, amount in cost.items())
+      candidates.append((overflow, weighted_cost, impl, cost))
+    overflow, _, impl, cost = min(candidates, key=lambda _: _[:2])
+    if overflow > 0:
+      _logger.warning('FIFO %s (%d x %d) does not fit in the budget', name,
+                      width, depth)
+    for resource, amount in cost.items():
+      remaining[resource] -= amount
+    selection[name] = impl, cost
+  return collections.OrderedDict(
+      (name, selection[name]) for name, _, _ in fifos)
+
+
+def print_fifo_report(out: TextIO,
+                      selection: Mapping[str, Tuple[str, Mapping[str, int]]],
+                      shapes: Optional[Mapping[str, Tuple[int, int]]] = None
+                     ) -> None:
+  """Print a per-FIFO report of the selected implementations.
+
+  Args:
+    out: File object to write to.
+    selection: Mapping from FIFO names to (implementation, cost), as returned
+        by select_fifo_impls.
+    shapes: Optional mapping from FIFO names to (width, depth).
+  """
+  resources = 'FF', 'LUT', 'BRAM_18K', 'URAM'
+  name_width = max((len(_) for _ in selection), default=4)
+  header = '{:<{}} {:>6} {:>6} {:<9}'.format('FIFO', name_width, 'width',
+                                             'depth', 'impl')
+  out.write(header + ''.join(' %8s' % _ for _ in resources) + '\n')
+  total = dict.fromkeys(resources, 0)
+  for name, (impl, cost) in selection.items():
+    width, depth = (shapes or {}).get(name, ('-', '-'))
+    out.write('{:<{}} {:>6} {:>6} {:<9}'.format(name, name_width, width, depth,
+                                                impl))
+    out.write(''.join(' %8d' % cost.get(_, 0) for _ in resources) + '\n')
+    for resource in resources:
+      total[resource] += cost.get(resource, 0)
+  out.write('{:<{}} {:>6} {:>6} {:<9}'.format('total', name_width, '', '', ''))
+  out.write(''.join(' %8d' % total[_] for _ in resources) + '\n')
+
+
+FIFO_PORTS = ('clk', 'reset', 'if_full_n', 'if_write_ce', 'if_write', 'if_din',
+              'if_empty_n', 'if_read_ce', 'if_read', 'if_dout')
+
+
+class FifoLibrary:
+  """A registry of the FIFOs used in a design.
+
+  Instead of a module per FIFO shape, each implementation style is emitted once
+  as a parameterized module, i.e., fifo_srl or fifo_bram, and the FIFOs are
+  instances with their width, depth, and RAM style as parameters. The requested
+  shapes are tracked so that only the styles in use are emitted.
+
+  Attributes:
+    threshold: Capacity in bits above which BRAM is used if the implementation
+        is not given, as in VerilogPrinter.fifo_module.
+    shapes: Dict mapping (impl, width, depth) to the number of requests, in the
+        order of first request.
+    wrappers: Dict mapping names of per-shape modules to (impl, width, depth).
+  """
+
+  def __init__(self, threshold: int = 1024) -> None:
+    self.threshold = threshold
+    self.shapes = collections.OrderedDict(
+    )  # type: Dict[Tuple[str, int, int], int]
+    self.wrappers = collections.OrderedDict(
+    )  # type: Dict[str, Tuple[str, int, int]]
+
+  @staticmethod
+  def module_name(impl: str) -> str:
+    return 'fifo_srl' if impl == 'srl' else 'fifo_bram'
+
+  def request(self,
+              width: int,
+              depth: int,
+              impl: Optional[str] = None) -> Tuple[str, Dict[str, str]]:
+    """Request a FIFO of the given shape.
+
+    Args:
+      width: FIFO width.
+      depth: FIFO depth.
+      impl: Optionally give one of FIFO_IMPLS.
+
+    Returns:
+      Tuple of the module name and the parameters to instantiate it with.
+
+    Raises:
+      ValueError: If depth or impl is invalid.
+    """
+    if impl is None:
+      impl = 'bram' if width * depth > self.threshold else 'srl'
+    if impl != 'srl' and impl not in FIFO_MEM_STYLES:
+      raise ValueError('Invalid FIFO implementation: %s' % impl)
+    if depth < 2:
+      raise ValueError('Invalid FIFO depth: %d < 2' % depth)
+    key = impl, width, depth
+    self.shapes[key] = self.shapes.get(key, 0) + 1
+    return self.module_name(impl), self._params(impl, width, depth)
+
+  @staticmethod
+  def _params(impl: str, width: int, depth: int) -> Dict[str, str]:
+    params = collections.OrderedDict()  # type: Dict[str, str]
+    if impl != 'srl':
+      params['MEM_STYLE'] = '"%s"' % FIFO_MEM_STYLES[impl]
+    params['DATA_WIDTH'] = str(width)
+    params['ADDR_WIDTH'] = str((depth - 1).bit_length())
+    params['DEPTH'] = str(depth)
+    return params
+
+  def instance(self,
+               printer: VerilogPrinter,
+               instance_name: str,
+               width: int,
+               depth: int,
+               args: Union[Mapping[str, str], Iterable[str]],
+               impl: Optional[str] = None) -> None:
+    """Request a FIFO and print its instance.
+
+    Args:
+      printer: VerilogPrinter to print to.
+      instance_name: Name of the instance.
+      width: FIFO width.
+      depth: FIFO depth.
+      args: Port connections as in VerilogPrinter.module_instance.
+      impl: Optionally give one of FIFO_IMPLS.
+    """
+    module_name, params = self.request(width, depth, impl)
+    printer.module_instance(module_name, instance_name, args, params)
+
+  def wrapper(self,
+              width: int,
+              depth: int,
+              name: str = '',
+              impl: Optional[str] = None) -> str:
+    """Request a per-shape module that wraps the parameterized module.
+
+    This is for code that instantiates FIFOs by name, e.g., HLS generated RTL.
+    The wrapper only instantiates the library module, so it is much smaller
+    than a copy of the template as generated by VerilogPrinter.fifo_module.
+
+    Args:
+      width: FIFO width.
+      depth: FIFO depth.
+      name: Optionally give the module a name, default to
+          'fifo_w{width}_d{depth}_A'.
+      impl: Optionally give one of FIFO_IMPLS.
+
+    Returns:
+      Name of the module.
+
+    Raises:
+      ValueError: If the name is requested with a different shape.
+    """
+    if not name:
+      name = 'fifo_w{width}_d{depth}_A'.format(width=width, depth=depth)
+    if impl is None:
+      impl = 'bram' if width * depth > self.threshold else 'srl'
+    key = impl, width, depth
+    if self.wrappers.setdefault(name, key) != key:
+      raise ValueError('FIFO %s is requested as both %s and %s' %
+                       (name, self.wrappers[name], key))
+    self.request(width, depth, impl)
+    return name
+
+  def print_modules(self, printer: VerilogPrinter) -> None:
+    """Print each requested implementation style once, then the wrappers."""
+    impls = {impl for impl, _, _ in self.shapes}
+    _logger.debug('%d FIFO shapes in %d parameterized modules',
+                  len(self.shapes), len({self.module_name(_) for _ in impls}))
+    if 'srl' in impls:
+      printer.srl_fifo_module(32, 32, name=self.module_name('srl'))
+    if impls - {'srl'}:
+      printer.bram_fifo_module(32, 32, name=self.module_name('bram'))
+    for name, (impl, width, depth) in self.wrappers.items():
+      printer.println()
+      printer.println('`default_nettype none')
+      printer.println()
+      printer.module(name, (
+          'input wire clk',
+          'input wire reset',
+          'output wire if_full_n',
+          'input wire if_write_ce',
+          'input wire if_write',
+          'input wire [%d:0] if_din' % (width - 1),
+          'output wire if_empty_n',
+          'input wire if_read_ce',
+          'input wire if_read',
+          'output wire [%d:0] if_dout' % (width - 1),
+      ))
+      printer.module_instance(
+          self.module_name(impl), 'unit',
+          collections.OrderedDict((_, _) for _ in FIFO_PORTS),
+          self._params(impl, width, depth))
+      printer.endmodule(name)
+      printer.println()
+      printer.println('`default_nettype wire')
+
+
+def print_relay_stations(printer: VerilogPrinter,
+                         stations: Iterable[Any],
+                         threshold: int = 1024) -> None:
+  """Print the Verilog modules of relay stations.
+
+  Args:
+    printer: VerilogPrinter to print to.
+    stations: Iterable of haoda.ir.dataflow.relay.RelayStation, e.g., the
+        values returned by insert_relay_stations.
+    threshold: Capacity in bits above which BRAM is used.
+  """
+  for station in stations:
+    printer.fifo_module(station.width,
+                        station.depth,
+                        name=station.module_name,
+                        threshold=threshold,
+                        impl='relay_station',
+                        level=station.level)
+
+
+def print_relay_station_instance(printer: VerilogPrinter, station: Any,
+                                 args: Mapping[str, str]) -> None:
+  """Print an instance of a relay station.
+
+  Args:
+    printer: VerilogPrinter to print to.
+    station: haoda.ir.dataflow.relay.RelayStation to instantiate.
+    args: Mapping from the FIFO ports, i.e., FIFO_PORTS, to the connected
+        signals.
+  """
+  printer.module_instance(station.module_name, station.fifo.c_expr, args)
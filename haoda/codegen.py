@@ -0,0 +1,142 @@
+import collections
+import io
+import logging
+import multiprocessing
+import threading
+from typing import (Any, Callable, Iterable, Iterator, Optional, Sequence,
+                    TextIO, Tuple, Union)
+
+from haoda import ir, util
+from haoda.ir.dataflow.trait import TraitIndex
+
+_logger = logging.getLogger().getChild(__name__)
+
+# A task is a callable that prints to a CppPrinter, and its extra arguments.
+Task = Tuple[Callable[..., None], Tuple[Any, ...]]
+
+# Tasks of the pool a worker process belongs to, set by _init_worker.
+_tasks = ()  # type: Sequence[Task]
+
+_BUFFER_SIZE = 1 << 20
+
+
+def _init_worker(tasks: Sequence[Task]) -> None:
+  global _tasks  # pylint: disable=global-statement
+  _tasks = tasks
+
+
+def _run_task(task_id: int) -> str:
+  func, args = _tasks[task_id]
+  buf = io.StringIO()
+  with util.CppPrinter(buf, buffer_size=_BUFFER_SIZE) as printer:
+    func(printer, *args)
+  return buf.getvalue()
+
+
+def generate_parallel(
+    tasks: Iterable[Task],
+    processes: Optional[int] = None,
+    job_server_fd: Union[int, Tuple[()], None] = ()) -> Iterator[str]:
+  """Run code emission tasks in a process pool.
+
+  Each task is run as func(printer, *args) in a worker process, where printer is
+  a fresh util.CppPrinter, and the printed code is sent back. Results are
+  yielded in the order of the tasks as soon as all previous ones are done, so
+  the output is deterministic.
+
+  The calling process implicitly holds one job slot. Each additional task
+  running concurrently takes a job slot from the GNU make job server, which is
+  returned as soon as the task is done, even if it fails.
+
+  Tasks are passed to the workers once as the arguments of the pool
+  initializer. With the fork start method, they are inherited by the workers
+  instead of pickled. Otherwise, funcs and args must be picklable.
+
+  Args:
+    tasks: Iterable of (func, args) tuples.
+    processes: Optional number of worker processes, default to the CPU count.
+    job_server_fd: Job server file descriptor as in util.acquire_job_slot.
+
+  Yields:
+    The code printed by each task.
+  """
+  tasks = tuple(tasks)
+  job_server_fd = util.get_job_server_fd(job_server_fd)
+  implicit_slot = threading.Semaphore(1)
+  lock = threading.Lock()
+  num_held_slots = [0]  # job server slots held by running tasks
+
+  def acquire() -> bool:
+    """Returns whether a job server slot is acquired."""
+    if job_server_fd is None or implicit_slot.acquire(blocking=False):
+      return False
+    util.acquire_job_slot(job_server_fd)
+    with lock:
+      num_held_slots[0] += 1
+    return True
+
+  def release(from_job_server: bool) -> Callable[[Any], None]:
+
+    def callback(_: Any) -> None:
+      if from_job_server:
+        with lock:
+          num_held_slots[0] -= 1
+        util.release_job_slot(job_server_fd)
+      elif job_server_fd is not None:
+        implicit_slot.release()
+
+    return callback
+
+  pending = collections.deque()  # type: collections.deque
+  try:
+    with multiprocessing.Pool(processes,
+                              initializer=_init_worker,
+                              initargs=(tasks,)) as pool:
+      for task_id in range(len(tasks)):
+        callback = release(acquire())
+        pending.append(
+            pool.apply_async(_run_task, (task_id,),
+                             callback=callback,
+                             error_callback=callback))
+        while pending and pending[0].ready():
+          yield pending.popleft().get()
+      while pending:
+        yield pending.popleft().get()
+  finally:
+    # callbacks of unfinished tasks will not run once the pool is terminated
+    for _ in range(num_held_slots[0]):
+      util.release_job_slot(job_server_fd)
+
+
+def print_parallel(out: TextIO,
+                   tasks: Iterable[Task],
+                   processes: Optional[int] = None,
+                   job_server_fd: Union[int, Tuple[()], None] = ()) -> None:
+  """Run code emission tasks in a process pool and write the code in order.
+
+  See generate_parallel for the arguments.
+  """
+  for code in generate_parallel(tasks, processes, job_server_fd):
+    out.write(code)
+
+
+def print_traits(out: TextIO,
+                 index: TraitIndex,
+                 print_trait: Callable[[util.CppPrinter, ir.ModuleTrait, int],
+                                       None],
+                 processes: Optional[int] = None,
+                 job_server_fd: Union[int, Tuple[()], None] = ()) -> None:
+  """Emit the code of each distinct module trait once, in parallel.
+
+  Args:
+    out: File object to write to.
+    index: TraitIndex of the modules.
+    print_trait: Callable as print_trait(printer, trait, trait_id) that prints
+        the code of a trait.
+    processes: Optional number of worker processes, default to the CPU count.
+    job_server_fd: Job server file descriptor as in util.acquire_job_slot.
+  """
+  _logger.info('generating code for %d module traits', len(index))
+  print_parallel(out, ((print_trait, (trait, trait_id))
+                       for trait_id, trait in enumerate(index.traits)),
+                 processes, job_server_fd)
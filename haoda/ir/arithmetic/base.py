@@ -1,4 +1,4 @@
-import collections
+import collections.abc
 import functools
 import logging
 from collections import OrderedDict
@@ -47,7 +47,7 @@ def simplify(expr, logger=None):
   if logger is not None:
     passes = compose(passes, lambda node: print_tree(node, logger))
 
-  if isinstance(expr, collections.Iterable):
+  if isinstance(expr, collections.abc.Iterable):
     return type(expr)(map(passes, expr))
 
   return passes(expr)
@@ -209,7 +209,9 @@ def reverse_distribute(node: NodeT) -> NodeT:
           children = new_item, coeff
         new_operands.append(ir.MulDiv(operator=('*',), operand=children))
       if len(new_operands) > 1:
-        assert new_operators[0] == '+'
+        if new_operators[0] != '+':
+          # the first remaining operand is subtracted, e.g., a * x - y
+          return node
         new_node = ir.AddSub(operator=tuple(new_operators[1:]),
                              operand=tuple(new_operands))
         if new_node != node:
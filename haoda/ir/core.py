@@ -2,7 +2,7 @@ import collections
 import copy
 import logging
 import math
-from typing import List, Optional, Tuple, Union
+from typing import Any, List, Optional, Tuple, Union
 
 import cached_property
 
@@ -632,6 +632,7 @@ class Module():
     children: Set of child (output) Module.
     lets: List of haoda.ir.Let expressions.
     exprs: Dict of {FIFO: haoda.ir.Expr}, stores an output's expression.
+    module_id: Optional int, dense id assigned by a DataflowGraph.
   """
 
   def __init__(self):
@@ -641,9 +642,13 @@ class Module():
     self.children = []
     self.lets = []
     self.exprs = collections.OrderedDict()
+    self.module_id = None  # type: Optional[int]
+    self._interfaces_cache = None  # type: Optional[Tuple[Any, ...]]
 
   @property
   def name(self):
+    if self.module_id is not None:
+      return util.get_module_name(self.module_id)
     return 'module_%u' % hash(self)
 
   @property
@@ -655,7 +660,10 @@ class Module():
     return {(self, fifo.read_module): fifo for fifo in self.exprs}
 
   def fifo(self, dst_node):
-    return self.fifo_dict[(self, dst_node)]
+    for fifo in self.exprs:
+      if fifo.read_module is dst_node:
+        return fifo
+    raise KeyError((self, dst_node))
 
   def get_latency(self, dst_node):
     return self.fifo(dst_node).write_lat or 0
@@ -684,33 +692,28 @@ class Module():
   def output_fifos(self):
     return self._interfaces['output_fifos']
 
-  @cached_property.cached_property
+  @property
   def _interfaces(self):
-    # find dram reads
-    reads_in_lets = tuple(_.expr for _ in self.lets)
-    reads_in_exprs = tuple(self.exprs.values())
-    dram_reads = collections.OrderedDict()
-    for dram_ref in visitor.get_dram_refs(reads_in_lets + reads_in_exprs):
-      for bank in dram_ref.dram:
-        dram_reads[(dram_ref.var, bank)] = (dram_ref, bank)
-    dram_reads = tuple(dram_reads.values())
-
-    # find dram writes
-    writes_in_lets = tuple(
-        _.name for _ in self.lets if not isinstance(_.name, str))
-    dram_writes = collections.OrderedDict()
-    for dram_ref in visitor.get_dram_refs(writes_in_lets):
-      for bank in dram_ref.dram:
-        dram_writes[(dram_ref.var, bank)] = (dram_ref, bank)
-    dram_writes = tuple(dram_writes.values())
-
-    output_fifos = tuple(_.c_expr for _ in self.exprs)
-    input_fifos = tuple(_.c_expr for _ in visitor.get_read_fifo_set(self))
-
+    # lets and exprs may be reassigned or mutated in place, so the cache is
+    # valid only if they still hold the same objects
+    lets, fifos, exprs = (tuple(self.lets), tuple(self.exprs),
+                          tuple(self.exprs.values()))
+    cache = self._interfaces_cache
+    if cache is not None and all(
+        len(cached) == len(current) and all(
+            a is b for a, b in zip(cached, current))
+        for cached, current in zip(cache[:3], (lets, fifos, exprs))):
+      dram_reads, dram_writes, read_fifos = cache[3]
+    else:
+      dram_reads, dram_writes, read_fifos = _get_interfaces(lets, exprs)
+      self._interfaces_cache = (lets, fifos, exprs,
+                                (dram_reads, dram_writes, read_fifos))
+    # FIFO names depend on the module names of both ends, which may change
+    # after the FIFOs are found, so they are not cached
     return {
         'dram_writes': dram_writes,
-        'output_fifos': output_fifos,
-        'input_fifos': input_fifos,
+        'output_fifos': tuple(_.c_expr for _ in fifos),
+        'input_fifos': tuple(_.c_expr for _ in read_fifos),
         'dram_reads': dram_reads
     }
 
@@ -1083,24 +1086,7 @@ class ModuleTrait(Node):
 
   @cached_property.cached_property
   def _interfaces(self):
-    # find dram reads
-    reads_in_lets = tuple(_.expr for _ in self.lets)
-    reads_in_exprs = tuple(self.exprs)
-    dram_reads = collections.OrderedDict()
-    for dram_ref in visitor.get_dram_refs(reads_in_lets + reads_in_exprs):
-      for bank in dram_ref.dram:
-        dram_reads[(dram_ref.var, bank)] = (dram_ref, bank)
-    dram_reads = tuple(dram_reads.values())
-
-    # find dram writes
-    writes_in_lets = tuple(
-        _.name for _ in self.lets if not isinstance(_.name, str))
-    dram_writes = collections.OrderedDict()
-    for dram_ref in visitor.get_dram_refs(writes_in_lets):
-      for bank in dram_ref.dram:
-        dram_writes[(dram_ref.var, bank)] = (dram_ref, bank)
-    dram_writes = tuple(dram_writes.values())
-
+    dram_reads, dram_writes, _ = _get_interfaces(self.lets, self.exprs)
     output_fifos = tuple('{}{}'.format(FIFORef.ST_PREFIX, idx)
                          for idx, expr in enumerate(self.exprs))
     input_fifos = tuple(_.ld_name for _ in self.loads)
@@ -1113,6 +1099,34 @@ class ModuleTrait(Node):
     }
 
 
+def _get_interfaces(lets, exprs):
+  """Find the DRAM reads, DRAM writes, and read FIFOs of lets and exprs.
+
+  DRAM reads and read FIFOs are found in a single walk of the let expressions
+  and the exprs, and DRAM writes in the let names.
+
+  Returns:
+    Tuple of (dram_reads, dram_writes, read_fifos). DRAM reads and writes are
+    tuples of (DRAMRef, bank) with each (var, bank) appearing once. Read FIFOs
+    is a tuple of FIFOs with each FIFO appearing once.
+  """
+  dram_refs, fifos = visitor.NodeIndex(
+      (tuple(_.expr for _ in lets), tuple(exprs))).query(DRAMRef, FIFO)
+  dram_reads = collections.OrderedDict()
+  for dram_ref in dram_refs:
+    for bank in dram_ref.dram:
+      dram_reads[(dram_ref.var, bank)] = (dram_ref, bank)
+
+  dram_writes = collections.OrderedDict()
+  for dram_ref in visitor.get_dram_refs(
+      tuple(_.name for _ in lets if not isinstance(_.name, str))):
+    for bank in dram_ref.dram:
+      dram_writes[(dram_ref.var, bank)] = (dram_ref, bank)
+
+  return (tuple(dram_reads.values()), tuple(dram_writes.values()),
+          tuple(collections.OrderedDict.fromkeys(fifos)))
+
+
 def make_var(val):
   """Make literal Var from val."""
   return Var(name=val, idx=())
@@ -0,0 +1,201 @@
+import collections
+import logging
+from typing import Dict, List, Mapping, Tuple
+
+from haoda import ir, util
+from haoda.ir.dataflow import dram
+from haoda.ir.dataflow.graph import DataflowGraph
+
+_logger = logging.getLogger().getChild(__name__)
+
+
+class Burst:
+  """A wide DRAM access that packs consecutive offsets of a variable.
+
+  A burst covers one word of burst_width bits, which holds lanes elements at
+  offsets burst_id * lanes to (burst_id + 1) * lanes - 1, assuming that the
+  variable starts at a word boundary in each bank. All its referenced offsets
+  are transferred through a single FIFO per bank and unpacked into elements, or
+  packed from elements for writes.
+
+  Attributes:
+    is_write: Whether the burst writes to DRAM.
+    var: Name of the DRAM variable.
+    dram: Tuple of bank ids, as in DRAMRef.dram.
+    haoda_type: Element type as haoda.ir.Type.
+    burst_width: Width of the wide word in bits.
+    burst_id: Index of the word, i.e., the offset divided by the lanes.
+    offsets: Sorted tuple of the referenced offsets.
+  """
+
+  def __init__(self, is_write: bool, var: str, dram_banks: Tuple[int, ...],
+               haoda_type: ir.Type, burst_width: int, burst_id: int,
+               offsets: Tuple[int, ...]) -> None:
+    self.is_write = is_write
+    self.var = var
+    self.dram = dram_banks
+    self.haoda_type = haoda_type
+    self.burst_width = burst_width
+    self.burst_id = burst_id
+    self.offsets = offsets
+
+  def __repr__(self) -> str:
+    return 'burst<%s bank %s %s@%s x%d>' % (
+        'write' if self.is_write else 'read', util.lst2str(
+            self.dram), self.var, util.lst2str(self.offsets), self.lanes)
+
+  def __contains__(self, dram_ref: ir.DRAMRef) -> bool:
+    """Returns whether a DRAM reference is covered, in either direction."""
+    return (dram_ref.var == self.var and
+            tuple(dram_ref.dram) == self.dram and
+            str(dram_ref.haoda_type) == str(self.haoda_type) and
+            dram_ref.offset in self.offsets)
+
+  @property
+  def lanes(self) -> int:
+    return self.burst_width // self.haoda_type.width_in_bits
+
+  @property
+  def c_type(self) -> str:
+    return 'ap_uint<%d>' % self.burst_width
+
+  @property
+  def cl_type(self) -> str:
+    return self.haoda_type.get_cl_vec_type(self.burst_width)
+
+  def lane(self, offset: int) -> int:
+    return offset - self.burst_id * self.lanes
+
+  def buf_name(self, bank: int) -> str:
+    assert bank in self.dram, 'unexpected bank {}'.format(bank)
+    return 'dram_{}_bank_{}_burst_{}_buf'.format(self.var, bank, self.burst_id)
+
+  def fifo_name(self, bank: int) -> str:
+    assert bank in self.dram, 'unexpected bank {}'.format(bank)
+    return 'dram_{}_bank_{}_burst_{}_fifo'.format(self.var, bank,
+                                                  self.burst_id)
+
+  def lane_name(self, bank: int, offset: int) -> str:
+    return '{}_lane_{}'.format(self.buf_name(bank), self.lane(offset))
+
+  def print_unpack(self, printer: util.CppPrinter, bank: int) -> None:
+    """Print code that reads a word from the FIFO and unpacks the elements.
+
+    Each referenced offset is unpacked to a variable named lane_name.
+    """
+    assert not self.is_write, 'cannot unpack a write burst'
+    buf = self.buf_name(bank)
+    printer.println('const {} {} = {}.read();'.format(self.c_type, buf,
+                                                      self.fifo_name(bank)))
+    width = self.haoda_type.width_in_bits
+    for offset in self.offsets:
+      name = self.lane_name(bank, offset)
+      lane = self.lane(offset)
+      bits = '{}.range({}, {})'.format(buf, (lane + 1) * width - 1,
+                                       lane * width)
+      if self.haoda_type.is_float:
+        printer.println('const uint{}_t {}_bits = {};'.format(
+            width, name, bits))
+        printer.println('{} {};'.format(self.haoda_type.c_type, name))
+        printer.println('memcpy(&{0}, &{0}_bits, sizeof({0}));'.format(name))
+      else:
+        printer.println('const {0} {1} = {0}({2});'.format(
+            self.haoda_type.c_type, name, bits))
+
+  def print_pack(self, printer: util.CppPrinter, bank: int) -> None:
+    """Print code that packs the elements into a word and writes the FIFO.
+
+    Each referenced offset is packed from a variable named lane_name. Lanes not
+    referenced are zero.
+    """
+    assert self.is_write, 'cannot pack a read burst'
+    buf = self.buf_name(bank)
+    width = self.haoda_type.width_in_bits
+    printer.println('{} {} = 0;'.format(self.c_type, buf))
+    for offset in self.offsets:
+      name = self.lane_name(bank, offset)
+      lane = self.lane(offset)
+      bits = '{}.range({}, {})'.format(buf, (lane + 1) * width - 1,
+                                       lane * width)
+      if self.haoda_type.is_float:
+        printer.println('uint{}_t {}_bits;'.format(width, name))
+        printer.println('memcpy(&{0}_bits, &{0}, sizeof({0}));'.format(name))
+        printer.println('{} = {}_bits;'.format(bits, name))
+      else:
+        printer.println('{} = {};'.format(bits, name))
+    printer.println('{}.write({});'.format(self.fifo_name(bank), buf))
+
+
+def coalesce(graph: DataflowGraph,
+             burst_width: int = 512) -> Dict[ir.Module, Tuple[Burst, ...]]:
+  """Group the DRAM references of each module into wide bursts.
+
+  References of a module to the same variable, banks and type, in the same
+  direction, and within the same aligned word of burst_width bits are grouped
+  into a Burst. Words referenced at only one offset are left as narrow
+  accesses.
+
+  Args:
+    graph: DataflowGraph whose modules are scanned.
+    burst_width: Width of the memory interface in bits, e.g., the AXI width.
+
+  Returns:
+    Dict mapping modules to their bursts, for modules that have any.
+
+  Raises:
+    ValueError: If burst_width is not a multiple of an element width.
+  """
+  result = collections.OrderedDict(
+  )  # type: Dict[ir.Module, Tuple[Burst, ...]]
+  num_refs = num_bursts = num_coalesced = 0
+  for module in graph:
+    groups = collections.OrderedDict(
+    )  # type: Dict[Tuple[bool, str, Tuple[int, ...], str, int], List[int]]
+    types = {}  # type: Dict[str, ir.Type]
+    for is_write, dram_ref in dram.get_dram_refs(module):
+      num_refs += 1
+      haoda_type = dram_ref.haoda_type
+      width = haoda_type.width_in_bits
+      if burst_width % width != 0:
+        raise ValueError('burst width %d is not a multiple of %s' %
+                         (burst_width, haoda_type))
+      lanes = burst_width // width
+      key = (is_write, dram_ref.var, tuple(dram_ref.dram), str(haoda_type),
+             dram_ref.offset // lanes)
+      types[str(haoda_type)] = haoda_type
+      groups.setdefault(key, []).append(dram_ref.offset)
+    bursts = []
+    for key, offsets in groups.items():
+      if len(offsets) > 1:
+        is_write, var, banks, haoda_type, burst_id = key
+        bursts.append(
+            Burst(is_write, var, banks, types[haoda_type], burst_width,
+                  burst_id, tuple(sorted(offsets))))
+        num_coalesced += len(offsets)
+    if bursts:
+      result[module] = tuple(bursts)
+      num_bursts += len(bursts)
+  _logger.info('coalesced %d of %d DRAM references into %d bursts',
+               num_coalesced, num_refs, num_bursts)
+  return result
+
+
+def find_burst(bursts: Mapping[ir.Module, Tuple[Burst, ...]],
+               module: ir.Module, dram_ref: ir.DRAMRef,
+               is_write: bool) -> Burst:
+  """Look up the burst of a module that covers a DRAM reference.
+
+  Args:
+    bursts: Bursts as returned by coalesce.
+    module: The haoda.ir.Module referencing the DRAM.
+    dram_ref: The ir.DRAMRef to look up.
+    is_write: Whether the reference writes to DRAM, as in
+        dram.get_dram_refs.
+
+  Raises:
+    KeyError: If the reference is not coalesced.
+  """
+  for burst in bursts.get(module, ()):
+    if burst.is_write == is_write and dram_ref in burst:
+      return burst
+  raise KeyError((module, is_write, dram_ref))
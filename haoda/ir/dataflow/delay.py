@@ -0,0 +1,222 @@
+import collections
+import logging
+import math
+from typing import Any, Dict, List, Tuple
+
+from haoda import ir
+from haoda.ir import visitor
+
+_logger = logging.getLogger().getChild(__name__)
+
+REGISTER = 'register'
+SRL = 'srl'
+BRAM = 'bram'
+
+
+def select_impl(depth: int,
+                width: int,
+                register_max_depth: int = 2,
+                bram_min_bits: int = 1024) -> str:
+  """Select the implementation of a delay line.
+
+  Very short delay lines are registers, long and wide ones are BRAM, and the
+  others are shift registers that synthesis maps to SRLs.
+
+  Args:
+    depth: Number of elements in the delay line.
+    width: Width of each element in bits.
+    register_max_depth: Maximum depth implemented as registers.
+    bram_min_bits: Minimum number of bits implemented as BRAM.
+
+  Returns:
+    One of REGISTER, SRL, and BRAM.
+  """
+  if depth <= register_max_depth:
+    return REGISTER
+  if depth * width >= bram_min_bits:
+    return BRAM
+  return SRL
+
+
+class DelayLine:
+  """A delay line shared by all DelayedRefs on the same FIFO reference.
+
+  The buffer is as deep as the maximum delay and each delay is a read tap. As
+  registers or BRAM, the buffer is circular with a single pointer; as SRL, the
+  buffer shifts by one element on each store and the taps are at fixed
+  indices, so no pointer is needed.
+
+  Attributes:
+    ref: The FIFO reference being delayed.
+    delays: Sorted tuple of the distinct delays.
+    impl: One of REGISTER, SRL, and BRAM.
+  """
+
+  def __init__(self, ref: ir.Node, delays: Tuple[int, ...], impl: str) -> None:
+    self.ref = ref
+    self.delays = delays
+    self.impl = impl
+
+  def __repr__(self) -> str:
+    return '%s delayed %s as %s' % (self.ref, '/'.join(map(str, self.delays)),
+                                     self.impl)
+
+  @property
+  def depth(self) -> int:
+    return self.delays[-1]
+
+  @property
+  def haoda_type(self) -> ir.Type:
+    return self.ref.haoda_type
+
+  @property
+  def c_type(self) -> str:
+    return self.haoda_type.c_type
+
+  @property
+  def cl_type(self) -> str:
+    return self.haoda_type.cl_type
+
+  @property
+  def bits(self) -> int:
+    return self.depth * self.haoda_type.width_in_bits
+
+  @property
+  def buf_name(self) -> str:
+    return '{}_delay_line_buf'.format(self.ref.c_expr)
+
+  @property
+  def ptr(self) -> str:
+    return '{}_delay_line_ptr'.format(self.ref.c_expr)
+
+  @property
+  def ptr_type(self) -> ir.Type:
+    return ir.Type('uint%d' % int(math.log2(self.depth) + 1))
+
+  @property
+  def c_ptr_type(self) -> str:
+    return self.ptr_type.c_type
+
+  @property
+  def cl_ptr_type(self) -> str:
+    return self.ptr_type.cl_type
+
+  @property
+  def c_buf_decl(self) -> str:
+    return '{} {}[{}];'.format(self.c_type, self.buf_name, self.depth)
+
+  @property
+  def cl_buf_decl(self) -> str:
+    return '{} {}[{}];'.format(self.cl_type, self.buf_name, self.depth)
+
+  @property
+  def c_ptr_decl(self) -> str:
+    """Declaration of the pointer, or '' if no pointer is needed."""
+    if self.impl == SRL:
+      return ''
+    return '{} {} = 0;'.format(self.c_ptr_type, self.ptr)
+
+  @property
+  def cl_ptr_decl(self) -> str:
+    """Declaration of the pointer, or '' if no pointer is needed."""
+    if self.impl == SRL:
+      return ''
+    return '{} {} = 0;'.format(self.cl_ptr_type, self.ptr)
+
+  @property
+  def c_pragmas(self) -> Tuple[str, ...]:
+    if self.impl == BRAM:
+      return ('#pragma HLS resource variable={} core=RAM_2P_BRAM'.format(
+          self.buf_name),)
+    return ('#pragma HLS array_partition variable={} complete'.format(
+        self.buf_name),)
+
+  def c_buf_ref(self, delay: int) -> str:
+    """Returns the C expression of the element stored delay iterations ago.
+
+    It must be evaluated before the store of the current iteration.
+    """
+    return self._buf_ref(delay, '{}({{}})'.format(self.c_ptr_type))
+
+  def cl_buf_ref(self, delay: int) -> str:
+    """Returns the OpenCL expression of the element stored delay iterations
+    ago, as c_buf_ref.
+    """
+    return self._buf_ref(delay, '({})({{}})'.format(self.cl_ptr_type))
+
+  def _buf_ref(self, delay: int, cast: str) -> str:
+    if delay not in self.delays:
+      raise KeyError(delay)
+    if self.impl == SRL:
+      return '{}[{}]'.format(self.buf_name, delay - 1)
+    if delay == self.depth:
+      return '{}[{}]'.format(self.buf_name, self.ptr)
+    return '{}[{} < {} ? {} : {}]'.format(
+        self.buf_name, self.ptr, delay,
+        cast.format('{} + {}'.format(self.ptr, self.depth - delay)),
+        cast.format('{} - {}'.format(self.ptr, delay)))
+
+  def c_buf_load(self, delayed_ref: ir.DelayedRef) -> str:
+    """Returns the statement that loads the value of a DelayedRef tap."""
+    return '{} = {};'.format(delayed_ref.c_expr,
+                             self.c_buf_ref(delayed_ref.delay))
+
+  @property
+  def c_buf_stores(self) -> Tuple[str, ...]:
+    """Statements that store the current value, after all loads."""
+    if self.impl == SRL:
+      return ('for (int i = {}; i > 0; --i) {{'.format(self.depth - 1),
+              '#pragma HLS unroll',
+              '  {0}[i] = {0}[i - 1];'.format(self.buf_name), '}',
+              '{}[0] = {};'.format(self.buf_name, self.ref.ref_name))
+    return ('{}[{}] = {};'.format(self.buf_name, self.ptr, self.ref.ref_name),
+            '{} = {};'.format(self.ptr, self.c_next_ptr_expr))
+
+  @property
+  def c_next_ptr_expr(self) -> str:
+    return '{ptr} < {depth} ? {c_ptr_type}({ptr}+1) : {c_ptr_type}(0)'.format(
+        ptr=self.ptr, c_ptr_type=self.c_ptr_type, depth=self.depth - 1)
+
+  @property
+  def cl_next_ptr_expr(self) -> str:
+    return '{ptr} < {depth} ? ({ptr_type})({ptr}+1) : ({ptr_type})0'.format(
+        ptr=self.ptr, ptr_type=self.cl_ptr_type, depth=self.depth - 1)
+
+
+def get_delay_lines(node_or_iterable: Any,
+                    register_max_depth: int = 2,
+                    bram_min_bits: int = 1024) -> Dict[ir.Node, DelayLine]:
+  """Group the DelayedRefs in IR nodes into shared delay lines.
+
+  DelayedRefs on the same reference share one buffer as deep as the maximum
+  delay instead of a buffer each, so the buffers of all but the longest delay
+  are saved.
+
+  Args:
+    node_or_iterable: A haoda.ir.Node or an Iterable of them to scan, e.g., the
+        lets and exprs of a ModuleTrait.
+    register_max_depth: As in select_impl.
+    bram_min_bits: As in select_impl.
+
+  Returns:
+    Dict mapping the delayed references to their DelayLine, in the order of
+    first appearance.
+  """
+  delays = collections.OrderedDict()  # type: Dict[ir.Node, List[int]]
+  for delayed_ref in visitor.get_instances_of(node_or_iterable,
+                                              ir.DelayedRef):
+    delays.setdefault(delayed_ref.ref, []).append(delayed_ref.delay)
+  lines = collections.OrderedDict()  # type: Dict[ir.Node, DelayLine]
+  separate_bits = shared_bits = 0
+  for ref, ref_delays in delays.items():
+    ref_delays = tuple(sorted(set(ref_delays)))
+    width = ref.haoda_type.width_in_bits
+    lines[ref] = DelayLine(
+        ref, ref_delays,
+        select_impl(ref_delays[-1], width, register_max_depth, bram_min_bits))
+    separate_bits += sum(ref_delays) * width
+    shared_bits += lines[ref].bits
+  if lines:
+    _logger.debug('shared delay lines: %s; %d bits instead of %d',
+                  list(lines.values()), shared_bits, separate_bits)
+  return lines
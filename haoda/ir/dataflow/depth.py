@@ -0,0 +1,123 @@
+import collections
+import collections.abc
+import logging
+from typing import Dict, Iterable, Mapping, Optional, Union
+
+from haoda import ir
+from haoda.ir.dataflow.graph import DataflowGraph
+
+_logger = logging.getLogger().getChild(__name__)
+
+
+def get_arrival_times(
+    graph: DataflowGraph,
+    fifo_latency: int = 1,
+    extra_latency: Optional[Mapping[ir.FIFO, int]] = None
+) -> Dict[ir.Module, int]:
+  """Compute the earliest start time of each module.
+
+  A module may start once all its inputs can be read in time, i.e., for each
+  input FIFO, the start time of the write module plus the write latency plus
+  the FIFO latency minus the read latency. Modules without inputs start at 0.
+
+  Args:
+    graph: DataflowGraph to analyze. It must be acyclic.
+    fifo_latency: Latency of a FIFO from write to read, in cycles.
+    extra_latency: Optional mapping from FIFOs to their latency in addition to
+        fifo_latency, e.g., of pipeline stages.
+
+  Returns:
+    Dict mapping each module to its start time, in topological order.
+  """
+  arrival_times = collections.OrderedDict()  # type: Dict[ir.Module, int]
+  for module in graph.topological_order():
+    arrival_times[module] = max(
+        (arrival_times[fifo.write_module] +
+         get_edge_latency(fifo, fifo_latency, extra_latency)
+         for fifo in graph.in_fifos(module)),
+        default=0)
+  return arrival_times
+
+
+def get_edge_latency(
+    fifo: ir.FIFO,
+    fifo_latency: int = 1,
+    extra_latency: Optional[Mapping[ir.FIFO, int]] = None) -> int:
+  """Returns the latency from the start of the write module to the start of the
+  read module, if the read module does not wait for any other inputs.
+  """
+  if extra_latency is not None:
+    fifo_latency += extra_latency.get(fifo, 0)
+  return (fifo.write_module.get_latency(fifo.read_module) + fifo_latency -
+          (fifo.read_lat or 0))
+
+
+def size_fifos(graph: DataflowGraph,
+               ii: Optional[Mapping[ir.Module, int]] = None,
+               target_ii: Optional[int] = None,
+               min_depth: int = 2,
+               fifo_latency: int = 1,
+               update: bool = True,
+               extra_latency: Optional[Mapping[ir.FIFO, int]] = None
+              ) -> Dict[ir.FIFO, int]:
+  """Compute the minimum FIFO depths needed to sustain full throughput.
+
+  On reconvergent paths, data arriving via the shorter path have to wait in
+  the FIFO until the data from the longer path arrive. If the FIFO cannot hold
+  all of them, the write module stalls, or, if the longer path depends on the
+  write module, the design deadlocks. The number of tokens to hold is the slack
+  of the FIFO divided by the II at which the graph is producing tokens.
+
+  Args:
+    graph: DataflowGraph to analyze. It must be acyclic.
+    ii: Optional mapping from modules to their II, default to 1 for modules not
+        in the mapping.
+    target_ii: Optional II the graph should sustain, default to the largest II
+        of all modules. A larger value trades throughput for shallower FIFOs.
+    min_depth: Minimum depth of each FIFO.
+    fifo_latency: Latency of a FIFO from write to read, in cycles.
+    update: Whether to write the depths back to FIFO.depth.
+    extra_latency: Optional mapping from FIFOs to their latency in addition to
+        fifo_latency, as in get_arrival_times.
+
+  Returns:
+    Dict mapping each FIFO to its computed depth.
+
+  Raises:
+    ValueError: If an II is not positive.
+  """
+  if ii is None:
+    ii = {}
+  if target_ii is None:
+    target_ii = max((ii.get(module, 1) for module in graph), default=1)
+  if target_ii < 1 or any(_ < 1 for _ in ii.values()):
+    raise ValueError('II must be positive')
+  arrival_times = get_arrival_times(graph, fifo_latency, extra_latency)
+  depths = collections.OrderedDict()  # type: Dict[ir.FIFO, int]
+  for fifo in graph.fifos:
+    slack = (arrival_times[fifo.read_module] -
+             arrival_times[fifo.write_module] -
+             get_edge_latency(fifo, fifo_latency, extra_latency))
+    depths[fifo] = min_depth + -(-slack // target_ii)
+  if update:
+    for fifo, depth in depths.items():
+      fifo.depth = depth
+  if _logger.isEnabledFor(logging.INFO):
+    _logger.info('sized %d fifos at II=%d, total %d bits', len(depths),
+                 target_ii, get_fifo_bits(depths))
+  return depths
+
+
+def get_fifo_bits(
+    fifos: Union[Iterable[ir.FIFO], Mapping[ir.FIFO, int]]) -> int:
+  """Returns the total capacity of the FIFOs in bits.
+
+  Args:
+    fifos: Iterable of FIFOs, or a mapping from FIFOs to their depths which
+        override FIFO.depth.
+  """
+  if isinstance(fifos, collections.abc.Mapping):
+    items = fifos.items()
+  else:
+    items = ((fifo, fifo.depth) for fifo in fifos)
+  return sum(fifo.haoda_type.width_in_bits * depth for fifo, depth in items)
@@ -0,0 +1,207 @@
+import collections
+import logging
+from typing import (Any, Dict, Iterator, List, Mapping, Optional, Sequence,
+                    Tuple)
+
+from haoda import ir
+from haoda.ir import visitor
+from haoda.ir.dataflow.graph import DataflowGraph
+
+_logger = logging.getLogger().getChild(__name__)
+
+
+def get_dram_refs(module: ir.Module) -> Iterator[Tuple[bool, ir.DRAMRef]]:
+  """Iterate over the distinct DRAM references of a module.
+
+  Unlike Module.dram_reads and Module.dram_writes, references to the same
+  variable at different offsets are distinct, since each of them transfers an
+  element in every iteration.
+
+  Args:
+    module: The haoda.ir.Module to scan.
+
+  Yields:
+    Tuples of (is_write, dram_ref). Each (is_write, var, offset) appears once.
+  """
+  reads = tuple(_.expr for _ in module.lets) + tuple(module.exprs.values())
+  writes = tuple(_.name for _ in module.lets if not isinstance(_.name, str))
+  seen = set()
+  for is_write, nodes in ((False, reads), (True, writes)):
+    for dram_ref in visitor.get_dram_refs(nodes):
+      key = is_write, dram_ref.var, dram_ref.offset
+      if key not in seen:
+        seen.add(key)
+        yield is_write, dram_ref
+
+
+def get_var_traffic(
+    graph: DataflowGraph,
+    perf: Optional[Mapping[ir.Module, Any]] = None) -> Dict[str, float]:
+  """Compute the DRAM traffic of each variable.
+
+  Each module issues one iteration every II cycles in steady state, in which
+  each of its distinct DRAM references transfers one element.
+
+  Args:
+    graph: DataflowGraph to analyze.
+    perf: Optional mapping from modules to their
+        haoda.report.xilinx.hls.HlsPerformance, or any object with the ii
+        attribute. A missing or zero II defaults to 1.
+
+  Returns:
+    Dict mapping variable names to bytes per cycle, in the order of first
+    reference.
+  """
+  if perf is None:
+    perf = {}
+  traffic = collections.OrderedDict()  # type: Dict[str, float]
+  for module in graph:
+    ii = getattr(perf.get(module), 'ii', 0) or 1
+    for _, dram_ref in get_dram_refs(module):
+      traffic[dram_ref.var] = (traffic.get(dram_ref.var, 0.) +
+                               dram_ref.haoda_type.width_in_bytes / ii)
+  return traffic
+
+
+def get_bank_loads(
+    graph: DataflowGraph,
+    perf: Optional[Mapping[ir.Module, Any]] = None) -> Dict[int, float]:
+  """Compute the DRAM traffic of each bank.
+
+  The traffic of a reference is split evenly over the banks in DRAMRef.dram.
+
+  Args:
+    graph: DataflowGraph to analyze.
+    perf: Optional mapping from modules to their performance as in
+        get_var_traffic.
+
+  Returns:
+    Dict mapping bank ids to bytes per cycle, sorted by bank id.
+  """
+  if perf is None:
+    perf = {}
+  loads = {}  # type: Dict[int, float]
+  for module in graph:
+    ii = getattr(perf.get(module), 'ii', 0) or 1
+    for _, dram_ref in get_dram_refs(module):
+      share = dram_ref.haoda_type.width_in_bytes / ii / len(dram_ref.dram)
+      for bank in dram_ref.dram:
+        loads[bank] = loads.get(bank, 0.) + share
+  return collections.OrderedDict(sorted(loads.items()))
+
+
+def assign_banks(graph: DataflowGraph,
+                 banks: Optional[Sequence[int]] = None,
+                 perf: Optional[Mapping[ir.Module, Any]] = None,
+                 update: bool = True) -> Dict[str, Tuple[int, ...]]:
+  """Assign DRAM variables to banks to minimize the peak bank load.
+
+  Each variable keeps its number of banks and its traffic is split evenly over
+  them. Variables are assigned in decreasing order of traffic per bank, each to
+  the least loaded banks, then single moves and pairwise swaps off the most
+  loaded bank are applied as long as they lower the peak load.
+
+  Args:
+    graph: DataflowGraph whose DRAM references are assigned.
+    banks: Optional sequence of available bank ids, default to all banks that
+        are currently referenced.
+    perf: Optional mapping from modules to their performance as in
+        get_var_traffic.
+    update: Whether to update DRAMRef.dram in the modules.
+
+  Returns:
+    Dict mapping variable names to their sorted bank ids.
+
+  Raises:
+    ValueError: If a variable is split over more banks than available.
+  """
+  num_banks = collections.OrderedDict()  # type: Dict[str, int]
+  referenced_banks = set()
+  for module in graph:
+    for _, dram_ref in get_dram_refs(module):
+      num_banks.setdefault(dram_ref.var, len(dram_ref.dram))
+      referenced_banks.update(dram_ref.dram)
+  if banks is None:
+    banks = sorted(referenced_banks)
+  banks = tuple(banks)
+  for var, count in num_banks.items():
+    if count > len(banks):
+      raise ValueError('variable %s needs %d banks, only %d available' %
+                       (var, count, len(banks)))
+
+  traffic = get_var_traffic(graph, perf)
+  shares = {var: traffic[var] / num_banks[var] for var in num_banks}
+  loads = collections.OrderedDict((bank, 0.) for bank in banks)
+  assignment = {}  # type: Dict[str, List[int]]
+  for var in sorted(num_banks, key=lambda _: -shares[_]):
+    assignment[var] = sorted(banks, key=loads.get)[:num_banks[var]]
+    for bank in assignment[var]:
+      loads[bank] += shares[var]
+  _refine(assignment, shares, loads)
+
+  result = collections.OrderedDict(
+      (var, tuple(sorted(assignment[var]))) for var in num_banks)
+  _logger.info('peak DRAM bank load: %.2f bytes per cycle, assignment: %s',
+               max(loads.values(), default=0.),
+               ', '.join('%s: %s' % _ for _ in result.items()))
+  if update:
+    update_banks(graph, result)
+  return result
+
+
+def _refine(assignment: Dict[str, List[int]], shares: Mapping[str, float],
+            loads: Dict[int, float]) -> None:
+  """Lower the peak load in place by moves and swaps off the peak bank."""
+  while loads:
+    peak_bank = max(loads, key=loads.get)
+    peak = loads[peak_bank]
+    peak_vars = [var for var, banks in assignment.items() if peak_bank in banks]
+    best = None  # type: Optional[Tuple[float, str, int, Optional[str]]]
+    for var in peak_vars:
+      for bank, load in loads.items():
+        if bank in assignment[var]:
+          continue
+        # move var from peak_bank to bank
+        new_peak = max(peak - shares[var], load + shares[var])
+        if new_peak < peak and (best is None or new_peak < best[0]):
+          best = new_peak, var, bank, None
+        # swap var with another var on bank
+        for other in assignment:
+          if bank not in assignment[other] or peak_bank in assignment[other]:
+            continue
+          delta = shares[var] - shares[other]
+          new_peak = max(peak - delta, load + delta)
+          if new_peak < peak and (best is None or new_peak < best[0]):
+            best = new_peak, var, bank, other
+    if best is None:
+      return
+    _, var, bank, other = best
+    assignment[var][assignment[var].index(peak_bank)] = bank
+    loads[peak_bank] -= shares[var]
+    loads[bank] += shares[var]
+    if other is not None:
+      assignment[other][assignment[other].index(bank)] = peak_bank
+      loads[bank] -= shares[other]
+      loads[peak_bank] += shares[other]
+
+
+def update_banks(graph: DataflowGraph,
+                 assignment: Mapping[str, Sequence[int]]) -> None:
+  """Update DRAMRef.dram of all references to the assigned variables.
+
+  The DRAMRefs are replaced in the lets and exprs, not mutated in place.
+
+  Args:
+    graph: DataflowGraph whose modules are updated.
+    assignment: Mapping from variable names to bank ids.
+  """
+
+  def callback(obj, args):
+    if isinstance(obj, ir.DRAMRef) and obj.var in assignment:
+      obj.dram = tuple(assignment[obj.var])
+    return obj
+
+  for module in graph:
+    module.lets = [_.visit(callback) for _ in module.lets]
+    for fifo, expr in module.exprs.items():
+      module.exprs[fifo] = expr.visit(callback)
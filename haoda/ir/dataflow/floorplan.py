@@ -0,0 +1,168 @@
+import collections
+import logging
+from typing import Any, Dict, List, Mapping, Sequence
+
+from haoda import ir
+from haoda.ir.dataflow.graph import DataflowGraph
+
+_logger = logging.getLogger().getChild(__name__)
+
+Usage = Dict[str, float]
+
+
+class Floorplan:
+  """An assignment of modules to SLRs.
+
+  Attributes:
+    slots: Dict mapping modules to their SLR indices, in topological order.
+    usage: List of the resource usage of each SLR, as dicts mapping resource
+        names to amounts.
+    crossing_width: Total width in bits of the FIFOs crossing SLRs, each
+        weighted by the number of SLR boundaries it crosses.
+  """
+
+  def __init__(self, slots: Dict[ir.Module, int], usage: List[Usage],
+               crossing_width: int) -> None:
+    self.slots = slots
+    self.usage = usage
+    self.crossing_width = crossing_width
+
+  def __repr__(self) -> str:
+    return '%s(%d modules, %d SLRs, crossing width: %d)' % (
+        type(self).__name__, len(self.slots), len(
+            self.usage), self.crossing_width)
+
+  def get_cells(self,
+                cell_pattern: str = '*/{name}_U0') -> Dict[int, List[str]]:
+    """Get the cell name patterns of the modules in each SLR.
+
+    Args:
+      cell_pattern: Pattern of the cell names, formatted with the module name.
+          The default matches the instances in HLS generated dataflow regions.
+
+    Returns:
+      Dict mapping SLR indices to lists of cell name patterns, for SLRs with
+      any modules, sorted by SLR index.
+    """
+    cells = {}  # type: Dict[int, List[str]]
+    for module, slr in self.slots.items():
+      cells.setdefault(slr, []).append(cell_pattern.format(name=module.name))
+    return collections.OrderedDict(sorted(cells.items()))
+
+
+def floorplan(graph: DataflowGraph,
+              resources: Mapping[ir.Module, Any],
+              capacity: Sequence[Mapping[str, float]],
+              max_utilization: float = 0.75,
+              max_passes: int = 8) -> Floorplan:
+  """Assign modules to SLRs to minimize the width of crossing FIFOs.
+
+  Modules are first assigned in topological order, filling each SLR up to
+  max_utilization of its capacity before moving on to the next one, so that
+  pipelines cross each SLR boundary once. The assignment is then refined by
+  moving modules to the SLR that lowers the crossing width the most among those
+  with room for them, where a FIFO crossing several SLRs counts once per
+  boundary. Modules in an overloaded SLR move even if the crossing width grows.
+
+  Args:
+    graph: DataflowGraph to floorplan. It must be acyclic.
+    resources: Mapping from modules to their
+        haoda.report.xilinx.hls.HlsResources, or any object that iterates over
+        (resource name, usage) pairs.
+    capacity: Sequence of the capacity of each SLR, as mappings from resource
+        names to amounts. SLRs are assumed to be stacked in this order.
+        Resources missing from a mapping are not constrained.
+    max_utilization: Fraction of the capacity available to the modules.
+    max_passes: Maximum number of refinement passes.
+
+  Returns:
+    The Floorplan.
+
+  Raises:
+    ValueError: If no SLR is given.
+  """
+  if not capacity:
+    raise ValueError('no SLR to floorplan')
+  limits = [{
+      resource: amount * max_utilization for resource, amount in slr.items()
+  } for slr in capacity]
+  weights = {}  # type: Dict[ir.Module, Usage]
+  for module in graph:
+    weights[module] = {
+        resource: float(amount) for resource, amount in resources[module]
+    }
+  neighbors = {}  # type: Dict[ir.Module, Dict[ir.Module, int]]
+  for module in graph:
+    neighbors[module] = {}
+  for fifo in graph.fifos:
+    src, dst = fifo.edge
+    if src is not dst:
+      width = fifo.haoda_type.width_in_bits
+      neighbors[src][dst] = neighbors[src].get(dst, 0) + width
+      neighbors[dst][src] = neighbors[dst].get(src, 0) + width
+
+  # initial assignment
+  slots = collections.OrderedDict()  # type: Dict[ir.Module, int]
+  usage = [{} for _ in capacity]  # type: List[Usage]
+  slr = 0
+  for module in graph.topological_order():
+    while (slr + 1 < len(capacity) and
+           not _fits(usage[slr], weights[module], limits[slr])):
+      slr += 1
+    slots[module] = slr
+    _add(usage[slr], weights[module], 1)
+
+  # refinement
+  def get_cost(module: ir.Module, slr: int) -> int:
+    return sum(width * abs(slr - slots[neighbor])
+               for neighbor, width in neighbors[module].items())
+
+  for _ in range(max_passes):
+    num_moves = 0
+    for module, current in slots.items():
+      weight = weights[module]
+      overloaded = _get_utilization(usage[current], limits[current]) > 1
+      current_cost = get_cost(module, current)
+      best_slr, best_gain = current, 0
+      for slr in range(len(capacity)):
+        if slr == current or not _fits(usage[slr], weight, limits[slr]):
+          continue
+        gain = current_cost - get_cost(module, slr)
+        if gain > best_gain or (overloaded and best_slr == current):
+          best_slr, best_gain = slr, gain
+      if best_slr != current:
+        _add(usage[current], weight, -1)
+        _add(usage[best_slr], weight, 1)
+        slots[module] = best_slr
+        num_moves += 1
+    if num_moves == 0:
+      break
+
+  crossing_width = sum(get_cost(module, slr) for module, slr in slots.items())
+  result = Floorplan(slots, usage, crossing_width // 2)
+  _logger.info('floorplanned %s, utilization: %s', result, ', '.join(
+      'SLR%d: %.0f%%' % (slr, _get_utilization(usage[slr], capacity[slr]) * 100)
+      for slr in range(len(capacity))))
+  for slr, slr_capacity in enumerate(capacity):
+    if _get_utilization(usage[slr], slr_capacity) > 1:
+      _logger.warning('SLR%d is overloaded', slr)
+  return result
+
+
+def _add(usage: Usage, weight: Usage, sign: int) -> None:
+  for resource, amount in weight.items():
+    usage[resource] = usage.get(resource, 0.) + sign * amount
+
+
+def _fits(usage: Usage, weight: Usage, limit: Mapping[str, float]) -> bool:
+  return all(
+      usage.get(resource, 0.) + amount <= limit[resource]
+      for resource, amount in weight.items()
+      if resource in limit)
+
+
+def _get_utilization(usage: Usage, limit: Mapping[str, float]) -> float:
+  return max((amount / limit[resource]
+              for resource, amount in usage.items()
+              if limit.get(resource, 0) > 0),
+             default=0.)
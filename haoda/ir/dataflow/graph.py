@@ -0,0 +1,237 @@
+import array
+import collections
+import logging
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from haoda import ir, util
+
+_logger = logging.getLogger().getChild(__name__)
+
+
+class DataflowGraph:
+  """A container that owns all modules and FIFOs of a dataflow graph.
+
+  Modules and FIFOs are assigned dense integer ids in insertion order. The
+  adjacency and the FIFO index are maintained incrementally, so adding a module
+  or a FIFO and looking up a FIFO by its end points take O(1) time. Edges of the
+  graph are FIFOs; there is at most one FIFO between an ordered pair of modules.
+
+  The children and parents of the modules are kept in sync with the graph, so
+  the traversal methods of haoda.ir.Module keep working. A module not named by
+  any graph yet is named after its id in the graph it is first added to; graphs
+  of a subset of modules, e.g., partitions, keep the original names.
+  """
+
+  def __init__(self, modules: Iterable[ir.Module] = ()) -> None:
+    self._modules = []  # type: List[ir.Module]
+    self._module_ids = {}  # type: Dict[ir.Module, int]
+    self._fifos = []  # type: List[ir.FIFO]
+    self._fifo_ends = []  # type: List[Tuple[int, int]]
+    self._fifo_ids = {}  # type: Dict[Tuple[int, int], int]
+    self._out_fifos = []  # type: List[List[int]]
+    self._in_fifos = []  # type: List[List[int]]
+    # (parent, child) pairs already present in parent.children / child.parents
+    self._child_links = set()  # type: Set[Tuple[ir.Module, ir.Module]]
+    self._parent_links = set()  # type: Set[Tuple[ir.Module, ir.Module]]
+    self._csr = {}  # type: Dict[bool, Tuple[array.array, ...]]
+    for module in modules:
+      self.add_module(module)
+
+  @classmethod
+  def from_modules(cls, roots: Iterable[ir.Module]) -> 'DataflowGraph':
+    """Build a graph from existing modules and all their descendants.
+
+    Descendants are discovered via both Module.children and the read modules of
+    the output FIFOs, in BFS order.
+
+    Args:
+      roots: Iterable of haoda.ir.Module to start from.
+
+    Returns:
+      The constructed DataflowGraph.
+    """
+    graph = cls(roots)
+    module_id = 0
+    while module_id < len(graph._modules):
+      module = graph._modules[module_id]
+      for child in module.children:
+        graph.add_module(child)
+      for fifo in module.exprs:
+        graph.add_fifo(fifo)
+      module_id += 1
+    _logger.debug('built dataflow graph with %d modules and %d fifos',
+                  len(graph._modules), len(graph._fifos))
+    return graph
+
+  def __len__(self) -> int:
+    return len(self._modules)
+
+  def __contains__(self, module: ir.Module) -> bool:
+    return module in self._module_ids
+
+  def __iter__(self) -> Iterator[ir.Module]:
+    return iter(self._modules)
+
+  @property
+  def modules(self) -> Tuple[ir.Module, ...]:
+    return tuple(self._modules)
+
+  @property
+  def fifos(self) -> Tuple[ir.FIFO, ...]:
+    return tuple(self._fifos)
+
+  def add_module(self, module: ir.Module) -> int:
+    """Add a module to the graph if it is not there yet.
+
+    The module will be given a dense id, which is also used to name it if it is
+    not named by another graph yet.
+
+    Args:
+      module: The haoda.ir.Module to add.
+
+    Returns:
+      The id of the module.
+    """
+    module_id = self._module_ids.get(module)
+    if module_id is not None:
+      return module_id
+    module_id = len(self._modules)
+    self._modules.append(module)
+    self._module_ids[module] = module_id
+    self._out_fifos.append([])
+    self._in_fifos.append([])
+    self._child_links.update((module, child) for child in module.children)
+    self._parent_links.update((parent, module) for parent in module.parents)
+    if module.module_id is None:
+      module.module_id = module_id
+    self._csr.clear()
+    return module_id
+
+  def add_fifo(self, fifo: ir.FIFO) -> int:
+    """Add a FIFO to the graph if its end points are not connected yet.
+
+    Modules on both ends will be added if they are not in the graph, and their
+    children and parents will be updated. Expressions are not updated.
+
+    Args:
+      fifo: The haoda.ir.FIFO to add.
+
+    Returns:
+      The id of the FIFO connecting the two end points.
+    """
+    src = self.add_module(fifo.write_module)
+    dst = self.add_module(fifo.read_module)
+    fifo_id = self._fifo_ids.get((src, dst))
+    if fifo_id is not None:
+      return fifo_id
+    fifo_id = len(self._fifos)
+    self._fifos.append(fifo)
+    self._fifo_ends.append((src, dst))
+    self._fifo_ids[(src, dst)] = fifo_id
+    self._out_fifos[src].append(fifo_id)
+    self._in_fifos[dst].append(fifo_id)
+    link = fifo.write_module, fifo.read_module
+    if link not in self._child_links:
+      self._child_links.add(link)
+      fifo.write_module.children.append(fifo.read_module)
+    if link not in self._parent_links:
+      self._parent_links.add(link)
+      fifo.read_module.parents.append(fifo.write_module)
+    self._csr.clear()
+    return fifo_id
+
+  def module(self, module_id: int) -> ir.Module:
+    return self._modules[module_id]
+
+  def module_id(self, module: ir.Module) -> int:
+    return self._module_ids[module]
+
+  def fifo_id(self, fifo: ir.FIFO) -> int:
+    return self._fifo_ids[(self._module_ids[fifo.write_module],
+                           self._module_ids[fifo.read_module])]
+
+  def fifo_ends(self, fifo_id: int) -> Tuple[int, int]:
+    """Returns the (write module id, read module id) of a FIFO."""
+    return self._fifo_ends[fifo_id]
+
+  def get_fifo(self, src: ir.Module, dst: ir.Module) -> ir.FIFO:
+    """Look up the FIFO between two modules.
+
+    Raises:
+      KeyError: If the modules are not connected.
+    """
+    return self._fifos[self._fifo_ids[(self._module_ids[src],
+                                       self._module_ids[dst])]]
+
+  def out_fifos(self, module: ir.Module) -> Tuple[ir.FIFO, ...]:
+    return tuple(
+        self._fifos[_] for _ in self._out_fifos[self._module_ids[module]])
+
+  def in_fifos(self, module: ir.Module) -> Tuple[ir.FIFO, ...]:
+    return tuple(
+        self._fifos[_] for _ in self._in_fifos[self._module_ids[module]])
+
+  def successors(self, module: ir.Module) -> Tuple[ir.Module, ...]:
+    return tuple(self._fifos[_].read_module
+                 for _ in self._out_fifos[self._module_ids[module]])
+
+  def predecessors(self, module: ir.Module) -> Tuple[ir.Module, ...]:
+    return tuple(self._fifos[_].write_module
+                 for _ in self._in_fifos[self._module_ids[module]])
+
+  def csr(self, reverse: bool = False) -> Tuple[array.array, ...]:
+    """Export the adjacency in the compressed sparse row (CSR) format.
+
+    The result is cached until the graph is modified. The arrays are signed
+    64-bit integers supporting the buffer protocol, so they can be wrapped
+    without copying, e.g., via numpy.frombuffer(indptr, dtype=numpy.int64).
+
+    Args:
+      reverse: If True, rows are read modules and columns are write modules.
+
+    Returns:
+      Tuple of (indptr, indices, fifo_ids). The edges of the module with id i
+      are at positions indptr[i] to indptr[i + 1]; indices holds the module ids
+      on the other ends and fifo_ids holds the ids of the FIFOs.
+    """
+    result = self._csr.get(reverse)
+    if result is None:
+      rows = self._in_fifos if reverse else self._out_fifos
+      other_end = 0 if reverse else 1
+      indptr = array.array('q', [0])
+      indices = array.array('q')
+      fifo_ids = array.array('q')
+      for fifos in rows:
+        fifo_ids.extend(fifos)
+        indices.extend(self._fifo_ends[_][other_end] for _ in fifos)
+        indptr.append(len(indices))
+      result = self._csr[reverse] = indptr, indices, fifo_ids
+    return result
+
+  def topological_order(self) -> List[ir.Module]:
+    """Sort all modules in topological order in O(V+E) time.
+
+    Modules without dependencies are sorted by their ids.
+
+    Returns:
+      List of all modules in topological order.
+
+    Raises:
+      util.SemanticError: If the graph is not acyclic.
+    """
+    in_degrees = [len(_) for _ in self._in_fifos]
+    queue = collections.deque(
+        module_id for module_id, in_degree in enumerate(in_degrees)
+        if in_degree == 0)
+    order = []
+    while queue:
+      module_id = queue.popleft()
+      order.append(self._modules[module_id])
+      for fifo_id in self._out_fifos[module_id]:
+        dst = self._fifo_ends[fifo_id][1]
+        in_degrees[dst] -= 1
+        if in_degrees[dst] == 0:
+          queue.append(dst)
+    if len(order) != len(self._modules):
+      raise util.SemanticError('dataflow graph is not acyclic')
+    return order
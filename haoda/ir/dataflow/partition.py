@@ -0,0 +1,291 @@
+import logging
+import random
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from haoda import ir
+from haoda.ir.dataflow.graph import DataflowGraph
+
+_logger = logging.getLogger().getChild(__name__)
+
+Weight = Tuple[float, ...]
+Adjacency = List[Dict[int, int]]
+
+
+class Partition:
+  """A partition of a dataflow graph, to be implemented as a separate kernel.
+
+  Modules are shared with the original graph, not copied.
+
+  Attributes:
+    name: Name of the partition.
+    graph: DataflowGraph of the modules in this partition and the FIFOs between
+        them.
+    resources: Sum of the resource estimation of the modules, or None if no
+        resource estimation is given.
+    axis_inputs: List of stream ports replacing the cut FIFOs read by this
+        partition, as (port_name, peer_name, haoda_type, c_type) tuples that can
+        be passed to haoda.backend.xilinx.print_kernel_xml. The port name is the
+        c_expr of the FIFO, so the ports on both ends have the same name.
+    axis_outputs: List of stream ports replacing the cut FIFOs written by this
+        partition, in the same format as axis_inputs.
+  """
+
+  def __init__(self, name: str) -> None:
+    self.name = name
+    self.graph = DataflowGraph()
+    self.resources = None  # type: Any
+    self.axis_inputs = []  # type: List[Tuple[str, str, ir.Type, str]]
+    self.axis_outputs = []  # type: List[Tuple[str, str, ir.Type, str]]
+
+  def __repr__(self) -> str:
+    return '%s(%s: %d modules, %d inputs, %d outputs)' % (
+        type(self).__name__, self.name, len(self.graph), len(self.axis_inputs),
+        len(self.axis_outputs))
+
+
+def partition(graph: DataflowGraph,
+              num_partitions: int,
+              resources: Optional[Mapping[ir.Module, Any]] = None,
+              imbalance: float = 0.05,
+              seed: int = 0) -> List[Partition]:
+  """Partition a dataflow graph into balanced parts with minimum cut width.
+
+  This is a multilevel partitioner. The graph is coarsened by repeatedly
+  merging the pairs of modules connected by the widest FIFOs, the coarsest
+  graph is partitioned greedily, and the partition is projected back level by
+  level, refined at each level by moving boundary modules with positive gain in
+  cut width, in the spirit of Fiduccia-Mattheyses, while keeping each part
+  within its capacity for every resource.
+
+  Args:
+    graph: DataflowGraph to partition.
+    num_partitions: Number of partitions.
+    resources: Optional mapping from modules to their
+        haoda.report.xilinx.hls.HlsResources, or any object that iterates over
+        (resource name, usage) pairs and supports addition. If not given, each
+        module counts as 1 and the number of modules is balanced.
+    imbalance: Allowed ratio by which a partition may exceed the average usage
+        of each resource.
+    seed: Seed for the pseudo-random visiting order, for reproducibility.
+
+  Returns:
+    List of Partition.
+
+  Raises:
+    ValueError: If num_partitions is not positive.
+  """
+  if num_partitions < 1:
+    raise ValueError('invalid number of partitions: %d' % num_partitions)
+  modules = graph.modules
+  if resources is None:
+    weights = [(1.,)] * len(modules)  # type: List[Weight]
+  else:
+    weights = [
+        tuple(float(usage) for _, usage in resources[module])
+        for module in modules
+    ]
+  adjacency = [{} for _ in modules]  # type: Adjacency
+  for fifo_id, fifo in enumerate(graph.fifos):
+    src, dst = graph.fifo_ends(fifo_id)
+    if src != dst:
+      width = fifo.haoda_type.width_in_bits
+      adjacency[src][dst] = adjacency[src].get(dst, 0) + width
+      adjacency[dst][src] = adjacency[dst].get(src, 0) + width
+  parts = _multilevel_partition(weights, adjacency, num_partitions, imbalance,
+                                random.Random(seed))
+
+  partitions = [
+      Partition('partition_%d' % idx) for idx in range(num_partitions)
+  ]
+  for module, part in zip(modules, parts):
+    partitions[part].graph.add_module(module)
+    if resources is not None:
+      if partitions[part].resources is None:
+        partitions[part].resources = resources[module]
+      else:
+        partitions[part].resources += resources[module]
+  for fifo_id, fifo in enumerate(graph.fifos):
+    src, dst = (parts[_] for _ in graph.fifo_ends(fifo_id))
+    if src == dst:
+      partitions[src].graph.add_fifo(fifo)
+    else:
+      partitions[src].axis_outputs.append(
+          (fifo.c_expr, partitions[dst].name, fifo.haoda_type, fifo.c_type))
+      partitions[dst].axis_inputs.append(
+          (fifo.c_expr, partitions[src].name, fifo.haoda_type, fifo.c_type))
+  _logger.info('partitioned %d modules into %s, cut width: %d bits',
+               len(modules), partitions, _get_cut_width(adjacency, parts))
+  return partitions
+
+
+def _get_cut_width(adjacency: Adjacency, parts: Sequence[int]) -> int:
+  """Returns the total width of the edges crossing different parts."""
+  return sum(width for src, neighbors in enumerate(adjacency)
+             for dst, width in neighbors.items()
+             if src < dst and parts[src] != parts[dst])
+
+
+def _add(lhs: Weight, rhs: Weight) -> Weight:
+  return tuple(x + y for x, y in zip(lhs, rhs))
+
+
+def _sub(lhs: Weight, rhs: Weight) -> Weight:
+  return tuple(x - y for x, y in zip(lhs, rhs))
+
+
+def _fits(load: Weight, weight: Weight, capacity: Weight) -> bool:
+  return all(x + y <= z for x, y, z in zip(load, weight, capacity))
+
+
+def _normalize(load: Weight, capacity: Weight) -> float:
+  return max((x / z for x, z in zip(load, capacity) if z > 0), default=0.)
+
+
+def _multilevel_partition(weights: List[Weight], adjacency: Adjacency,
+                          num_partitions: int, imbalance: float,
+                          rng: random.Random) -> List[int]:
+  if not weights:
+    return []
+  total = weights[0]
+  for weight in weights[1:]:
+    total = _add(total, weight)
+  capacity = tuple(_ * (1 + imbalance) / num_partitions for _ in total)
+
+  # coarsen
+  levels = []  # type: List[Tuple[List[Weight], Adjacency, List[int]]]
+  while len(weights) > 16 * num_partitions:
+    mapping, coarse_weights, coarse_adjacency = _coarsen(
+        weights, adjacency, capacity, rng)
+    if len(coarse_weights) > 0.95 * len(weights):
+      break
+    levels.append((weights, adjacency, mapping))
+    weights, adjacency = coarse_weights, coarse_adjacency
+  _logger.debug('coarsened %d levels to %d nodes', len(levels), len(weights))
+
+  # partition and uncoarsen
+  parts = _initial_partition(weights, adjacency, num_partitions, capacity)
+  _refine(weights, adjacency, parts, num_partitions, capacity, rng)
+  while levels:
+    weights, adjacency, mapping = levels.pop()
+    parts = [parts[_] for _ in mapping]
+    _refine(weights, adjacency, parts, num_partitions, capacity, rng)
+  return parts
+
+
+def _coarsen(weights: List[Weight], adjacency: Adjacency, capacity: Weight,
+             rng: random.Random) -> Tuple[List[int], List[Weight], Adjacency]:
+  """Coarsen the graph by heavy-edge matching.
+
+  Returns:
+    Tuple of (mapping from fine nodes to coarse nodes, coarse weights, coarse
+    adjacency).
+  """
+  order = list(range(len(weights)))
+  rng.shuffle(order)
+  mapping = [-1] * len(weights)
+  coarse_weights = []  # type: List[Weight]
+  for node in order:
+    if mapping[node] >= 0:
+      continue
+    match, match_width = -1, -1
+    for neighbor, width in adjacency[node].items():
+      if (mapping[neighbor] < 0 and width > match_width and
+          _fits(weights[node], weights[neighbor], capacity)):
+        match, match_width = neighbor, width
+    mapping[node] = len(coarse_weights)
+    if match < 0:
+      coarse_weights.append(weights[node])
+    else:
+      mapping[match] = mapping[node]
+      coarse_weights.append(_add(weights[node], weights[match]))
+  coarse_adjacency = [{} for _ in coarse_weights]  # type: Adjacency
+  for node, neighbors in enumerate(adjacency):
+    coarse_node = mapping[node]
+    coarse_neighbors = coarse_adjacency[coarse_node]
+    for neighbor, width in neighbors.items():
+      coarse_neighbor = mapping[neighbor]
+      if coarse_neighbor != coarse_node:
+        coarse_neighbors[coarse_neighbor] = coarse_neighbors.get(
+            coarse_neighbor, 0) + width
+  return mapping, coarse_weights, coarse_adjacency
+
+
+def _initial_partition(weights: List[Weight], adjacency: Adjacency,
+                       num_partitions: int, capacity: Weight) -> List[int]:
+  """Assign the heaviest nodes first, each to the most connected part that has
+  room for it, or to the least loaded part if none has.
+  """
+  parts = [-1] * len(weights)
+  loads = [tuple(0. for _ in capacity)] * num_partitions
+  for node in sorted(range(len(weights)),
+                     key=lambda _: -_normalize(weights[_], capacity)):
+    connectivity = [0] * num_partitions
+    for neighbor, width in adjacency[node].items():
+      if parts[neighbor] >= 0:
+        connectivity[parts[neighbor]] += width
+    candidates = [
+        _ for _ in range(num_partitions)
+        if _fits(loads[_], weights[node], capacity)
+    ] or range(num_partitions)
+    part = min(candidates,
+               key=lambda _: (-connectivity[_], _normalize(loads[_], capacity)))
+    parts[node] = part
+    loads[part] = _add(loads[part], weights[node])
+  return parts
+
+
+def _refine(weights: List[Weight],
+            adjacency: Adjacency,
+            parts: List[int],
+            num_partitions: int,
+            capacity: Weight,
+            rng: random.Random,
+            max_passes: int = 8) -> None:
+  """Refine the partition in place by greedy gain-based moves.
+
+  A node moves to another part if that reduces the cut width, or keeps the cut
+  width and improves the balance, and the target part has room for it. A node
+  in an overloaded part moves to the part with the highest gain that has room.
+  """
+  loads = [tuple(0. for _ in capacity)] * num_partitions
+  for node, part in enumerate(parts):
+    loads[part] = _add(loads[part], weights[node])
+  order = list(range(len(weights)))
+  for _ in range(max_passes):
+    rng.shuffle(order)
+    num_moves = 0
+    for node in order:
+      part = parts[node]
+      weight = weights[node]
+      overloaded = not all(x <= z for x, z in zip(loads[part], capacity))
+      connectivity = {}  # type: Dict[int, int]
+      for neighbor, width in adjacency[node].items():
+        neighbor_part = parts[neighbor]
+        connectivity[neighbor_part] = connectivity.get(neighbor_part,
+                                                       0) + width
+      if not overloaded and (not connectivity or
+                             list(connectivity) == [part]):
+        continue
+      candidates = range(num_partitions) if overloaded else connectivity
+      internal = connectivity.get(part, 0)
+      best_part, best_gain = part, None  # type: int, Optional[int]
+      for candidate in candidates:
+        if candidate == part or not _fits(loads[candidate], weight, capacity):
+          continue
+        gain = connectivity.get(candidate, 0) - internal
+        if not overloaded:
+          if gain < 0:
+            continue
+          if gain == 0 and _normalize(_add(loads[candidate], weight),
+                                      capacity) >= _normalize(
+                                          loads[part], capacity):
+            continue
+        if best_gain is None or gain > best_gain:
+          best_part, best_gain = candidate, gain
+      if best_part != part:
+        loads[part] = _sub(loads[part], weight)
+        loads[best_part] = _add(loads[best_part], weight)
+        parts[node] = best_part
+        num_moves += 1
+    if num_moves == 0:
+      break
@@ -0,0 +1,120 @@
+import collections
+import logging
+from typing import Dict, Mapping, Optional, Sequence, Union
+
+from haoda import ir
+from haoda.ir.dataflow import depth
+from haoda.ir.dataflow.graph import DataflowGraph
+
+_logger = logging.getLogger().getChild(__name__)
+
+# A slot of a module, either an SLR index or coordinates on a grid of regions.
+Slot = Union[int, Sequence[int]]
+
+
+def get_distance(src: Slot, dst: Slot) -> int:
+  """Returns the Manhattan distance between two slots."""
+  if isinstance(src, int):
+    src = (src,)
+  if isinstance(dst, int):
+    dst = (dst,)
+  if len(src) != len(dst):
+    raise ValueError('slots %s and %s have different dimensions' % (src, dst))
+  return sum(abs(x - y) for x, y in zip(src, dst))
+
+
+class RelayStation:
+  """A relay station replacing a FIFO that crosses slots.
+
+  The Verilog module and instances are printed by the backend, e.g.,
+  haoda.backend.xilinx.print_relay_stations.
+
+  Attributes:
+    fifo: The ir.FIFO being replaced.
+    level: Number of pipeline stages, each adding a cycle of latency.
+    depth: Depth of the relay station, including GRACE_PERIOD entries to absorb
+        the data in flight.
+  """
+
+  def __init__(self, fifo: ir.FIFO, level: int, fifo_depth: int) -> None:
+    self.fifo = fifo
+    self.level = level
+    self.depth = fifo_depth
+
+  def __repr__(self) -> str:
+    return 'relay_station[%d x%d]: %s => %s' % (
+        self.depth, self.level, repr(self.fifo.write_module),
+        repr(self.fifo.read_module))
+
+  @property
+  def grace_period(self) -> int:
+    return self.level * 2 + 1
+
+  @property
+  def width(self) -> int:
+    return self.fifo.haoda_type.width_in_bits
+
+  @property
+  def module_name(self) -> str:
+    return 'relay_station_{}'.format(self.fifo.c_expr)
+
+
+def insert_relay_stations(graph: DataflowGraph,
+                          placement: Mapping[ir.Module, Slot],
+                          levels_per_hop: int = 1,
+                          ii: Optional[Mapping[ir.Module, int]] = None,
+                          update: bool = True) -> Dict[ir.FIFO, RelayStation]:
+  """Insert relay stations on the FIFOs that cross slots.
+
+  Each FIFO between modules placed in different slots is pipelined with
+  levels_per_hop stages per unit of distance between the slots. The added
+  latency is compensated by increasing the depth of the FIFO by the entries in
+  flight, i.e., the grace period of the relay station, and by the extra slack
+  on reconvergent paths, which may deepen FIFOs that are not pipelined.
+
+  Depths are computed from the depths sized by depth.size_fifos without the
+  relay stations, and FIFOs that are already deeper are kept as-is. Running the
+  pass again, e.g., after re-placement, thus does not deepen the FIFOs again.
+
+  Args:
+    graph: DataflowGraph to pipeline. It must be acyclic.
+    placement: Mapping from modules to their slots, e.g., SLR indices.
+    levels_per_hop: Number of pipeline stages per unit of distance.
+    ii: Optional mapping from modules to their II as in depth.size_fifos.
+    update: Whether to write the depths back to FIFO.depth.
+
+  Returns:
+    Dict mapping the pipelined FIFOs to their RelayStation.
+
+  Raises:
+    ValueError: If a module is not placed.
+  """
+  levels = collections.OrderedDict()  # type: Dict[ir.FIFO, int]
+  for fifo in graph.fifos:
+    for module in fifo.edge:
+      if module not in placement:
+        raise ValueError('module %s is not placed' % module.name)
+    distance = get_distance(placement[fifo.write_module],
+                            placement[fifo.read_module])
+    if distance > 0:
+      levels[fifo] = distance * levels_per_hop
+
+  old_depths = depth.size_fifos(graph, ii, update=False)
+  new_depths = depth.size_fifos(graph, ii, update=False, extra_latency=levels)
+  stations = collections.OrderedDict()  # type: Dict[ir.FIFO, RelayStation]
+  num_deepened = 0
+  for fifo in graph.fifos:
+    fifo_depth = max(new_depths[fifo], old_depths[fifo])
+    if fifo in levels:
+      fifo_depth += levels[fifo] * 2 + 1
+    fifo_depth = max(fifo_depth, fifo.depth or 0)
+    if fifo in levels:
+      stations[fifo] = RelayStation(fifo, levels[fifo], fifo_depth)
+    if fifo_depth != fifo.depth:
+      num_deepened += 1
+      if update:
+        fifo.depth = fifo_depth
+  _logger.info('inserted %d relay stations with %d pipeline stages, %d fifos '
+               'deepened', len(stations), sum(levels.values()), num_deepened)
+  return stations
+
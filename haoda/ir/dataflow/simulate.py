@@ -0,0 +1,257 @@
+import array
+import collections
+import itertools
+import logging
+import math
+import operator
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import cached_property
+
+from haoda import ir
+from haoda.ir.dataflow.graph import DataflowGraph
+
+_logger = logging.getLogger().getChild(__name__)
+
+# a time before any event
+_NEVER = -(1 << 62)
+
+
+class DramChannel:
+  """DRAM traffic of a source or sink module.
+
+  Attributes:
+    bytes_per_iter: Number of bytes transferred in each iteration.
+    bandwidth: Sustainable bandwidth in bytes per cycle.
+  """
+
+  def __init__(self, bytes_per_iter: int, bandwidth: float) -> None:
+    if bytes_per_iter < 0 or bandwidth <= 0:
+      raise ValueError('invalid DRAM channel: %d bytes per iteration at %s '
+                       'bytes per cycle' % (bytes_per_iter, bandwidth))
+    self.bytes_per_iter = bytes_per_iter
+    self.bandwidth = bandwidth
+
+  def earliest_issue_time(self, iteration: int) -> int:
+    return math.ceil(iteration * self.bytes_per_iter / self.bandwidth)
+
+
+class SimulationResult:
+  """Result of a dataflow simulation.
+
+  The FIFO occupancy histograms are computed from the issue times on demand.
+
+  Attributes:
+    num_iters: Number of simulated iterations of each module.
+    cycles: Number of cycles until the last module finishes.
+    issue_times: Dict mapping modules to arrays of the cycles at which each
+        iteration is issued.
+    fifo_offsets: Dict mapping FIFOs to the cycles, relative to the issue time,
+        at which a token is written and at which its slot becomes free.
+    stalls: Dict mapping modules to counters of stalled cycles by cause. A cause
+        is ('starved', fifo) if the module waits for an input, ('blocked', fifo)
+        if the module waits for space of an output, or ('dram', None) if the
+        module waits for DRAM bandwidth.
+  """
+
+  def __init__(self, num_iters: int) -> None:
+    self.num_iters = num_iters
+    self.cycles = 0
+    self.issue_times = collections.OrderedDict(
+    )  # type: Dict[ir.Module, array.array]
+    self.fifo_offsets = collections.OrderedDict(
+    )  # type: Dict[ir.FIFO, Tuple[int, int]]
+    self.stalls = collections.OrderedDict(
+    )  # type: Dict[ir.Module, Dict[Tuple[str, Optional[ir.FIFO]], int]]
+
+  @cached_property.cached_property
+  def fifo_occupancy(self) -> Dict[ir.FIFO, Dict[int, int]]:
+    """Dict mapping FIFOs to histograms, which map each occupancy to the number
+    of cycles at that occupancy.
+    """
+    return collections.OrderedDict(
+        (fifo,
+         get_occupancy_histogram(
+             write_times=(_ + write_offset
+                          for _ in self.issue_times[fifo.write_module]),
+             free_times=(_ + free_offset
+                         for _ in self.issue_times[fifo.read_module]),
+             end=self.cycles))
+        for fifo, (write_offset, free_offset) in self.fifo_offsets.items())
+
+  @property
+  def throughput(self) -> float:
+    """Iterations per cycle."""
+    return self.num_iters / self.cycles if self.cycles else 0.
+
+  def __str__(self) -> str:
+    lines = [
+        'simulated %d iterations in %d cycles, throughput: %.4f' %
+        (self.num_iters, self.cycles, self.throughput)
+    ]
+    for module, stalls in self.stalls.items():
+      for (cause, fifo), cycles in stalls.items():
+        lines.append('  %s stalled %d cycles: %s%s' %
+                     (module.name, cycles, cause,
+                      '' if fifo is None else ' on ' + fifo.c_expr))
+    return '\n'.join(lines)
+
+
+def simulate(graph: DataflowGraph,
+             num_iters: int,
+             perf: Optional[Mapping[ir.Module, Any]] = None,
+             dram: Optional[Mapping[ir.Module, DramChannel]] = None,
+             fifo_latency: int = 1,
+             default_depth: int = 2) -> SimulationResult:
+  """Simulate a dataflow graph at cycle level.
+
+  Each module is a pipelined process that issues one iteration every II cycles
+  at best. In each iteration, it reads one token from each input FIFO at cycle
+  FIFO.read_lat and writes one token to each output FIFO at cycle
+  FIFO.write_lat, or at the pipeline depth if FIFO.write_lat is None. A module
+  cannot issue an iteration before the inputs can be read in time, before the
+  outputs can be written without overflowing, or before its DRAM channel has
+  transferred the data of all previous iterations.
+
+  Instead of stepping cycle by cycle, the simulator computes the issue time of
+  each iteration from the events it depends on. Since a FIFO of depth D only
+  couples iteration k of its write module to iteration k - D of its read module,
+  a batch of iterations as large as the shallowest FIFO is computed for each
+  module in topological order without revisiting, so the cost is independent of
+  the number of idle cycles.
+
+  Args:
+    graph: DataflowGraph to simulate. It must be acyclic.
+    num_iters: Number of iterations each module runs.
+    perf: Optional mapping from modules to their
+        haoda.report.xilinx.hls.HlsPerformance, or any object with the ii and
+        depth attributes. Default to II=1 and depth=0.
+    dram: Optional mapping from modules to their DramChannel.
+    fifo_latency: Latency of a FIFO from write to read, in cycles.
+    default_depth: Depth used for FIFOs whose depth is None.
+
+  Returns:
+    The SimulationResult.
+
+  Raises:
+    ValueError: If a FIFO depth is not positive.
+  """
+  if perf is None:
+    perf = {}
+  if dram is None:
+    dram = {}
+  result = SimulationResult(num_iters)
+  order = graph.topological_order()
+  ii = {m: max(getattr(perf.get(m), 'ii', 1), 1) for m in order}
+  pipeline_depth = {m: getattr(perf.get(m), 'depth', 0) for m in order}
+  write_lat = {}  # type: Dict[ir.FIFO, int]
+  read_lat = {}  # type: Dict[ir.FIFO, int]
+  depth = {}  # type: Dict[ir.FIFO, int]
+  for fifo in graph.fifos:
+    write_lat[fifo] = (pipeline_depth[fifo.write_module]
+                       if fifo.write_lat is None else fifo.write_lat)
+    read_lat[fifo] = fifo.read_lat or 0
+    depth[fifo] = default_depth if fifo.depth is None else fifo.depth
+    if depth[fifo] < 1:
+      raise ValueError('invalid FIFO depth: %d' % depth[fifo])
+  batch_size = min(depth.values(), default=num_iters) or 1
+
+  issue_times = result.issue_times
+  for module in order:
+    issue_times[module] = array.array('q', [0]) * num_iters
+    result.stalls[module] = collections.Counter()
+
+  # precompute the dependencies of each module as
+  # (cause, issue times of the other end, offset, distance in iterations)
+  dependencies = []
+  for module in order:
+    deps = [(('starved', fifo), issue_times[fifo.write_module],
+             write_lat[fifo] + fifo_latency - read_lat[fifo], 0)
+            for fifo in graph.in_fifos(module)]
+    # token k can be written once token k - depth has been read
+    deps.extend((('blocked', fifo), issue_times[fifo.read_module],
+                 read_lat[fifo] + 1 - write_lat[fifo], depth[fifo])
+                for fifo in graph.out_fifos(module))
+    dependencies.append((issue_times[module], ii[module], deps,
+                         dram.get(module), result.stalls[module]))
+
+  for begin in range(0, num_iters, batch_size):
+    end = min(begin + batch_size, num_iters)
+    for times, module_ii, deps, channel, stalls in dependencies:
+      causes = []  # type: List[Tuple[str, Optional[ir.FIFO]]]
+      constraints = []  # type: List[List[int]]
+      for cause, other_times, offset, distance in deps:
+        if end <= distance:
+          continue
+        first = max(begin, distance)
+        causes.append(cause)
+        constraints.append([_NEVER] * (first - begin) + [
+            _ + offset
+            for _ in other_times[first - distance:end - distance]
+        ])
+      if channel is not None:
+        causes.append(('dram', None))
+        constraints.append(
+            [channel.earliest_issue_time(k) for k in range(begin, end)])
+
+      next_time = times[begin - 1] + module_ii if begin else 0
+      no_stall_times = range(next_time, next_time + (end - begin) * module_ii,
+                             module_ii)
+      ready = list(map(max, *constraints)) if len(constraints) > 1 else \
+          constraints[0] if constraints else ()
+      # fast path: no stall in the whole batch
+      if all(map(operator.le, ready, no_stall_times)):
+        times[begin:end] = array.array('q', no_stall_times)
+        continue
+      for idx, ready_time in enumerate(ready, begin):
+        if ready_time > next_time:
+          for cause, constraint in zip(causes, constraints):
+            if constraint[idx - begin] == ready_time:
+              stalls[cause] += ready_time - next_time
+              break
+          next_time = ready_time
+        times[idx] = next_time
+        next_time += module_ii
+
+  if num_iters > 0:
+    result.cycles = max(issue_times[m][-1] + pipeline_depth[m]
+                        for m in order) + 1
+  for fifo in graph.fifos:
+    result.fifo_offsets[fifo] = write_lat[fifo], read_lat[fifo] + 1
+  _logger.debug('%s', result)
+  return result
+
+
+def get_occupancy_histogram(write_times: Iterable[int],
+                            free_times: Iterable[int],
+                            end: int) -> Dict[int, int]:
+  """Compute the occupancy histogram of a FIFO.
+
+  Args:
+    write_times: Sorted cycles at which tokens are written.
+    free_times: Sorted cycles at which the slots of tokens become free.
+    end: Cycle at which the histogram ends.
+
+  Returns:
+    OrderedDict mapping each occupancy, in ascending order, to the number of
+    cycles at that occupancy.
+  """
+  histogram = collections.Counter()  # type: Dict[int, int]
+  occupancy = 0
+  time = 0
+  writes = itertools.chain(write_times, (end,))
+  frees = itertools.chain(free_times, (end,))
+  next_write = next(writes)
+  next_free = next(frees)
+  while time < end:
+    next_time = min(next_write, next_free, end)
+    if next_time > time:
+      histogram[occupancy] += next_time - time
+      time = next_time
+    while next_write <= time and next_write < end:
+      occupancy += 1
+      next_write = next(writes)
+    while next_free <= time and next_free < end:
+      occupancy -= 1
+      next_free = next(frees)
+  return collections.OrderedDict(sorted(histogram.items()))
@@ -0,0 +1,115 @@
+import collections
+import logging
+from typing import Any, Dict, List, Mapping, Optional
+
+from haoda import ir
+from haoda.ir.dataflow import depth
+from haoda.ir.dataflow.graph import DataflowGraph
+
+_logger = logging.getLogger().getChild(__name__)
+
+
+class ThroughputAnalysis:
+  """Result of the steady-state throughput analysis of a dataflow graph.
+
+  Attributes:
+    period: Number of cycles the slowest module spends on each invocation of the
+        graph in steady state.
+    bottlenecks: List of the slowest modules.
+    module_cycles: Dict mapping modules to the cycles spent on each invocation.
+    module_slack: Dict mapping modules to the cycles they could additionally
+        spend on each invocation without lowering the throughput.
+    fifo_slack: Dict mapping FIFOs to the cycles by which their data arrive
+        before the read module can start.
+    fifo_bandwidth: Dict mapping FIFOs to the bits they transfer per cycle in
+        steady state.
+    latency: Latency of the first data through the pipeline.
+    critical_path: List of modules on the path that determines the latency.
+  """
+
+  def __init__(self) -> None:
+    self.period = 0
+    self.bottlenecks = []  # type: List[ir.Module]
+    self.module_cycles = collections.OrderedDict(
+    )  # type: Dict[ir.Module, int]
+    self.module_slack = collections.OrderedDict(
+    )  # type: Dict[ir.Module, int]
+    self.fifo_slack = collections.OrderedDict()  # type: Dict[ir.FIFO, int]
+    self.fifo_bandwidth = collections.OrderedDict(
+    )  # type: Dict[ir.FIFO, float]
+    self.latency = 0
+    self.critical_path = []  # type: List[ir.Module]
+
+  @property
+  def throughput(self) -> float:
+    """Invocations of the graph per cycle."""
+    return 1. / self.period if self.period else 0.
+
+  def __str__(self) -> str:
+    return ('throughput: 1 invocation every %d cycles, bottleneck: %s; '
+            'latency: %d cycles, critical path: %s' %
+            (self.period, ', '.join(_.name for _ in self.bottlenecks),
+             self.latency, ' -> '.join(_.name for _ in self.critical_path)))
+
+
+def analyze_throughput(graph: DataflowGraph,
+                       perf: Optional[Mapping[ir.Module, Any]] = None,
+                       fifo_latency: int = 1) -> ThroughputAnalysis:
+  """Analyze the steady-state throughput and latency of a dataflow graph.
+
+  In steady state, each module spends II times trip count cycles on each
+  invocation of the graph, and the graph can be invoked no faster than its
+  slowest module. The latency is the longest path from a source to the end of
+  the pipeline of a module, using the same edge latencies as FIFO sizing. This
+  takes O(V+E) time.
+
+  Args:
+    graph: DataflowGraph to analyze. It must be acyclic.
+    perf: Optional mapping from modules to their
+        haoda.report.xilinx.hls.HlsPerformance, or any object with the ii, depth
+        and trip_count attributes. A missing or zero value defaults to 1 for ii
+        and trip_count, and to 0 for depth.
+    fifo_latency: Latency of a FIFO from write to read, in cycles.
+
+  Returns:
+    The ThroughputAnalysis.
+  """
+  if perf is None:
+    perf = {}
+  result = ThroughputAnalysis()
+  trip_counts = {}  # type: Dict[ir.Module, int]
+  for module in graph:
+    module_perf = perf.get(module)
+    trip_counts[module] = getattr(module_perf, 'trip_count', 0) or 1
+    result.module_cycles[module] = (getattr(module_perf, 'ii', 0) or
+                                    1) * trip_counts[module]
+  result.period = max(result.module_cycles.values(), default=0)
+  for module, cycles in result.module_cycles.items():
+    result.module_slack[module] = result.period - cycles
+    if cycles == result.period:
+      result.bottlenecks.append(module)
+
+  arrival_times = depth.get_arrival_times(graph, fifo_latency)
+  for fifo in graph.fifos:
+    result.fifo_slack[fifo] = (
+        arrival_times[fifo.read_module] - arrival_times[fifo.write_module] -
+        depth.get_edge_latency(fifo, fifo_latency))
+    result.fifo_bandwidth[fifo] = (fifo.haoda_type.width_in_bits *
+                                   trip_counts[fifo.write_module] /
+                                   result.period)
+
+  # the path ends at the module that finishes its first iteration the last
+  module = None
+  for candidate, arrival_time in arrival_times.items():
+    finish_time = arrival_time + getattr(perf.get(candidate), 'depth', 0)
+    if module is None or finish_time > result.latency:
+      module, result.latency = candidate, finish_time
+  while module is not None:
+    result.critical_path.append(module)
+    module = next((fifo.write_module
+                   for fifo in graph.in_fifos(module)
+                   if result.fifo_slack[fifo] == 0), None)
+  result.critical_path.reverse()
+
+  _logger.info('%s', result)
+  return result
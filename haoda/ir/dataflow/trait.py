@@ -0,0 +1,127 @@
+import collections
+import hashlib
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from haoda import ir
+
+_logger = logging.getLogger().getChild(__name__)
+
+# attributes compared by classes that override Node.__eq__
+_KEY_ATTRS = {
+    ir.DelayedRef: ('delay', 'ref'),
+    ir.DRAMRef: ('dram', 'offset'),
+    ir.FIFORef: ('lat', 'ref_id'),
+}
+
+
+def get_digest(node: ir.Node, memo: Optional[Dict[int, bytes]] = None) -> bytes:
+  """Compute a Merkle-style digest of an IR node.
+
+  The digest of a node is computed from its class and the digests of the
+  attributes compared by its __eq__, so it is stable across processes, unlike
+  hash(). Nodes equal to each other have the same digest, except that nodes of
+  different classes never do. haoda_type is only hashed where it is one of
+  those attributes, since a missing type compares equal to any type.
+
+  Args:
+    node: ir.Node to digest.
+    memo: Optional dict caching the digests by object id, which should only
+        live as long as the nodes are not mutated.
+
+  Returns:
+    The SHA-256 digest as bytes.
+  """
+  if memo is None:
+    memo = {}
+  digest = memo.get(id(node))
+  if digest is None:
+    attrs = _KEY_ATTRS.get(type(node), node.ATTRS)
+    items = [type(node).__name__.encode()]
+    items.extend(_encode(getattr(node, attr), memo) for attr in attrs)
+    digest = memo[id(node)] = hashlib.sha256(b'\0'.join(items)).digest()
+  return digest
+
+
+def _encode(val: Any, memo: Dict[int, bytes]) -> bytes:
+  if isinstance(val, ir.Node):
+    return get_digest(val, memo)
+  if isinstance(val, ir.Type):
+    if val.is_float:
+      return ('float%d' % val.width_in_bits).encode()
+    return str(val).encode()
+  if isinstance(val, (tuple, list)):
+    return b'(%s)' % b','.join(_encode(_, memo) for _ in val)
+  return repr(val).encode()
+
+
+class TraitIndex:
+  """An index that buckets modules by their ModuleTrait.
+
+  Each distinct trait is assigned a dense id in insertion order, so that it can
+  be generated and synthesized once and instantiated by all its modules. The
+  trait and its digest are computed once per module. Modules are bucketed by the
+  digest and compared with the first trait in the bucket only, so indexing N
+  modules takes O(N) trait constructions instead of O(N^2) comparisons.
+  """
+
+  def __init__(self, modules: Iterable[ir.Module] = ()) -> None:
+    self._traits = []  # type: List[ir.ModuleTrait]
+    self._digests = []  # type: List[bytes]
+    self._instances = []  # type: List[List[ir.Module]]
+    self._buckets = {}  # type: Dict[bytes, List[int]]
+    self._trait_ids = collections.OrderedDict()  # type: Dict[ir.Module, int]
+    for module in modules:
+      self.add(module)
+
+  def __len__(self) -> int:
+    return len(self._traits)
+
+  def __iter__(self) -> Iterator[Tuple[ir.ModuleTrait, Tuple[ir.Module, ...]]]:
+    """Iterate over (trait, modules) pairs in the order of trait ids."""
+    return zip(self._traits, map(tuple, self._instances))
+
+  @property
+  def traits(self) -> Tuple[ir.ModuleTrait, ...]:
+    return tuple(self._traits)
+
+  def add(self, module: ir.Module) -> int:
+    """Index a module if it is not indexed yet.
+
+    Args:
+      module: The haoda.ir.Module to index.
+
+    Returns:
+      The id of the module's trait.
+    """
+    trait_id = self._trait_ids.get(module)
+    if trait_id is not None:
+      return trait_id
+    trait = ir.ModuleTrait(module)
+    digest = get_digest(trait)
+    bucket = self._buckets.setdefault(digest, [])
+    for trait_id in bucket:
+      if self._traits[trait_id] == trait:
+        break
+    else:
+      trait_id = len(self._traits)
+      bucket.append(trait_id)
+      self._traits.append(trait)
+      self._digests.append(digest)
+      self._instances.append([])
+    self._instances[trait_id].append(module)
+    self._trait_ids[module] = trait_id
+    return trait_id
+
+  def trait_id(self, module: ir.Module) -> int:
+    return self._trait_ids[module]
+
+  def trait(self, module: ir.Module) -> ir.ModuleTrait:
+    return self._traits[self._trait_ids[module]]
+
+  def signature(self, trait_id: int) -> str:
+    """Returns the hex digest of a trait, stable across processes."""
+    return self._digests[trait_id].hex()
+
+  def instances(self, trait_id: int) -> Tuple[ir.Module, ...]:
+    return tuple(self._instances[trait_id])
@@ -1,8 +1,104 @@
 import collections
+import collections.abc
 
 from haoda import ir
 
 
+class NodeIndex():
+  """An index of IR nodes by class.
+
+  The trees are walked once when the index is built, in the same pre-order as
+  haoda.ir.Node.visit, but without copying, so the indexed nodes are the
+  original ones. A subtree shared by several parents is walked only once and
+  its nodes are repeated for each occurrence. The nodes of each queried class
+  are cached, so querying the same index again costs no walk.
+
+  The index is a snapshot of the trees when it is built, and holds references
+  to their nodes only as long as the index itself is alive. Build a new index
+  after the trees are mutated.
+  """
+
+  def __init__(self, node_or_iterable):
+    """Build the index.
+
+    Args:
+      node_or_iterable: A haoda.ir.Node object, a haoda.ir.Module object whose
+          lets and exprs are indexed, or an Iterable of them.
+
+    Raises:
+      TypeError: If obj is not an IR node, a module, or a sequence.
+    """
+    nodes = []
+    self._add(node_or_iterable, nodes, {})
+    self._nodes = tuple(nodes)
+    self._instances = {}
+
+  def _add(self, obj, nodes, walked):
+    if isinstance(obj, ir.Module):
+      self._add(obj.lets, nodes, walked)
+      self._add(obj.exprs.values(), nodes, walked)
+    elif isinstance(obj, collections.abc.Iterable):
+      for node in obj:
+        self._add(node, nodes, walked)
+    elif isinstance(obj, ir.Node):
+      _walk(obj, nodes, walked)
+    else:
+      raise TypeError('argument is not an IR node or a sequence')
+
+  def __len__(self):
+    return len(self._nodes)
+
+  def get(self, class_or_tuple):
+    """Get all indexed nodes of specific classes as a tuple.
+
+    Args:
+      class_or_tuple: Wanted class or tuple of wanted classes.
+
+    Returns:
+      A tuple of all wanted nodes, in pre-order.
+    """
+    return self.query(class_or_tuple)[0]
+
+  def query(self, *classes):
+    """Get all indexed nodes of each of several classes in one pass.
+
+    Args:
+      *classes: Wanted classes or tuples of classes.
+
+    Returns:
+      A tuple with a tuple of the wanted nodes for each argument.
+    """
+    missing = tuple(_ for _ in classes if _ not in self._instances)
+    if missing:
+      instances = tuple([] for _ in missing)
+      for node in self._nodes:
+        for class_or_tuple, result in zip(missing, instances):
+          if isinstance(node, class_or_tuple):
+            result.append(node)
+      self._instances.update(zip(missing, map(tuple, instances)))
+    return tuple(self._instances[_] for _ in classes)
+
+
+def _walk(node, nodes, walked):
+  """Append the nodes of a subtree in pre-order, reusing walked subtrees."""
+  subtree = walked.get(id(node))
+  if subtree is not None:
+    nodes.extend(nodes[subtree[1]:subtree[2]])
+    return
+  begin = len(nodes)
+  nodes.append(node)
+  for attr in node.SCALAR_ATTRS:
+    child = getattr(node, attr, None)
+    if isinstance(child, ir.Node):
+      _walk(child, nodes, walked)
+  for attr in node.LINEAR_ATTRS:
+    for child in getattr(node, attr, ()):
+      if isinstance(child, ir.Node):
+        _walk(child, nodes, walked)
+  # keep a reference to the node so that its id is not reused
+  walked[id(node)] = node, begin, len(nodes)
+
+
 def get_read_fifo_set(module):
   """Get all read FIFOs as a tuple. Each FIFO only appears once.
 
@@ -15,50 +111,44 @@ def get_read_fifo_set(module):
   Raises:
     TypeError: If argument is not a module.
   """
+  if not isinstance(module, ir.Module):
+    raise TypeError('argument is not a module')
+  return tuple(
+      collections.OrderedDict.fromkeys(NodeIndex(module).get(ir.FIFO)))
 
-  def visitor(obj, args):
-    if isinstance(obj, ir.FIFO):
-      args[obj] = None
-    return obj
 
-  fifo_loads = collections.OrderedDict()
-  if isinstance(module, ir.Module):
-    module.visit_loads(visitor, fifo_loads)
-  else:
-    raise TypeError('argument is not a module')
-  return tuple(fifo_loads)
+def get_instances(node_or_iterable, *classes):
+  """Get all ir.Node references of each of several classes in one walk.
+
+  Args:
+    node_or_iterable: A haoda.ir.Node object, a haoda.ir.Module object, or an
+        Iterable of them.
+    *classes: Wanted classes or tuples of classes.
+
+  Returns:
+    A tuple with a tuple of the wanted references for each class.
+
+  Raises:
+    TypeError: If obj is not an IR node, a module, or a sequence.
+  """
+  return NodeIndex(node_or_iterable).query(*classes)
 
 
 def get_instances_of(node_or_iterable, class_or_tuple):
   """Get all ir.Node references of specific classes as a tuple.
 
   Args:
-    node_or_iterable: A haoda.ir.Node object or an Iterable of
-        haoda.ir.Node objects.
+    node_or_iterable: A haoda.ir.Node object, a haoda.ir.Module object, or an
+        Iterable of them.
     class_or_tuple: Wanted class or tuple of wanted classes.
 
   Returns:
     A tuple of all wanted references.
 
   Raises:
-    TypeError: If obj is not an IR node or a sequence.
+    TypeError: If obj is not an IR node, a module, or a sequence.
   """
-
-  def visitor(node, instances):
-    if isinstance(node, class_or_tuple):
-      instances.append(node)
-    return node
-
-  if isinstance(node_or_iterable, collections.Iterable):
-    return sum(
-        (get_instances_of(node, class_or_tuple) for node in node_or_iterable),
-        ())
-  instances = []
-  if isinstance(node_or_iterable, ir.Node):
-    node_or_iterable.visit(visitor, instances)
-  else:
-    raise TypeError('argument is not an IR node or a sequence')
-  return tuple(instances)
+  return NodeIndex(node_or_iterable).get(class_or_tuple)
 
 
 def get_vars(node_or_iterable):
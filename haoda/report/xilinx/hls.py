@@ -138,6 +138,7 @@ class HlsPerformance:
     name: Optional name of the module.
     ii: Integer of pipeline II.
     depth: Integer of pipeline depth.
+    trip_count: Integer of loop trip count, or the maximum if it is variable.
   """
 
   def __init__(self,
@@ -150,7 +151,7 @@ class HlsPerformance:
     If obj is an xml.etree.ElementTree.Element, it has to be pointing to a
       valid HLS report XML tree.
     If obj is an io.TextIOBase, it will be parsed as a valid HLS report XML.
-    If obj is None, the ii and depth will be 0.
+    If obj is None, the ii, depth, and trip_count will be 0.
 
     Args:
       obj: Object used for initialization.
@@ -158,9 +159,10 @@ class HlsPerformance:
     Raises:
       TypeError: If obj is not of a correct type.
     """
-    self.name, self.ii, self.depth = None, 0, 0
+    self.name, self.ii, self.depth, self.trip_count = None, 0, 0, 0
     if isinstance(obj, HlsPerformance):
       self.name, self.ii, self.depth = obj.name, obj.ii, obj.depth
+      self.trip_count = obj.trip_count
       return
     if isinstance(obj, ET.Element):
       self.init_from_xml_element(obj)
@@ -198,6 +200,12 @@ class HlsPerformance:
     for item in elem.findall('PerformanceEstimates/SummaryOfLoopLatency/*'):
       self.ii = raise_if_not_found(item, 'PipelineII')
       self.depth = raise_if_not_found(item, 'PipelineDepth')
+      trip_count = item.findtext('TripCount/range/max',
+                                 item.findtext('TripCount'))
+      try:
+        self.trip_count = int(trip_count)
+      except (TypeError, ValueError):
+        self.trip_count = 0
     return self
 
 
@@ -4,7 +4,7 @@ import shutil
 import tempfile
 import xml.etree.ElementTree as ET
 import zipfile
-from typing import BinaryIO, Dict, Optional, TextIO
+from typing import Any, BinaryIO, Dict, Optional, TextIO
 
 from haoda import util
 from haoda.backend import xilinx as backend
@@ -61,52 +61,7 @@ class ReportXoUtil(backend.Vivado):
     self.tmpdir = tempfile.TemporaryDirectory(prefix='report-xo-util-')
     self.rpt_file = rpt_file
     self.rpt_file_name = os.path.join(self.tmpdir.name, 'post_synth_util.rpt')
-    with zipfile.ZipFile(xo_file) as xo_zip:
-      with xo_zip.open('xo.xml') as xo_xml:
-        kernel = ET.parse(xo_xml).find('./Kernels/Kernel')
-        if kernel is None:
-          raise util.InputError('cannot parse XO file')
-        ip_dir = kernel.attrib['IP']
-        kernel_name = kernel.attrib['Name']
-      hdl_dir_prefix = ip_dir + '/src'
-      if all(not x.startswith(hdl_dir_prefix) for x in xo_zip.namelist()):
-        hdl_dir_prefix = ip_dir + '/hdl/verilog'
-      hdl_dir = os.path.join(self.tmpdir.name, hdl_dir_prefix)
-      xo_zip.extractall(path=self.tmpdir.name,
-                        members=[
-                            name for name in xo_zip.namelist()
-                            if name.startswith(hdl_dir_prefix)
-                        ])
-      if part_num is None:
-        for hdl_file_format in ('{}.v', '{0}_{0}.v'):
-          try:
-            with open(os.path.join(
-                hdl_dir, hdl_file_format.format(kernel_name))) as hdl_file:
-              part_num = RtlHlsInfo(hdl_file)['HLS_INPUT_PART']
-            break
-          except FileNotFoundError:
-            pass
-    assert part_num is not None
-    if synth_kwargs is None:
-      synth_kwargs = {}
-    if report_util_kwargs is None:
-      report_util_kwargs = {}
-    synth_kwargs.setdefault('top', top_name)
-    synth_kwargs.setdefault('part', part_num)
-    report_util_kwargs.setdefault('hierarchical', '')
-    report_util_kwargs.setdefault('hierarchical_depth', '1')
-    report_util_kwargs.setdefault('file', self.rpt_file_name)
-
-    synth_args = ' '.join('-{} {}'.format(*kv) for kv in synth_kwargs.items())
-    report_util_args = ' '.join(
-        '-{} {}'.format(*kv) for kv in report_util_kwargs.items())
-    kwargs = {
-        'output_dir': os.path.join(self.tmpdir.name, 'output'),
-        'hdl_dir': hdl_dir,
-        'synth_args': synth_args,
-        'report_util_args': report_util_args,
-        'set_parallel': '',
-    }
+    set_parallel = ''
     self.job_server_fd = util.get_job_server_fd(())
     if self.job_server_fd is not None:
       new_fd = os.open('/proc/self/fd/%d' % self.job_server_fd,
@@ -118,8 +73,11 @@ class ReportXoUtil(backend.Vivado):
       except BlockingIOError as e:
         pass
       os.close(new_fd)
-      kwargs['set_parallel'] = 'set_param general.maxThreads %d' % self.num_jobs
-    super().__init__(REPORT_UTIL_COMMANDS.format(**kwargs))
+      set_parallel = 'set_param general.maxThreads %d' % self.num_jobs
+    super().__init__(
+        get_report_util_commands(self.tmpdir.name, self.rpt_file_name, xo_file,
+                                 top_name, part_num, synth_kwargs,
+                                 report_util_kwargs, set_parallel))
 
   def __exit__(self, *args):
     super().__exit__(*args)
@@ -133,6 +91,125 @@ class ReportXoUtil(backend.Vivado):
     self.tmpdir.cleanup()
 
 
+def get_report_util_commands(
+    tmpdir: str,
+    rpt_file_name: str,
+    xo_file: BinaryIO,
+    top_name: str = 'Dataflow',
+    part_num: Optional[str] = None,
+    synth_kwargs: Optional[Dict[str, str]] = None,
+    report_util_kwargs: Optional[Dict[str, str]] = None,
+    set_parallel: str = '') -> str:
+  """Extract the HDL files and returns the Tcl commands to report utilization.
+
+  Args:
+    tmpdir: Directory the HDL files are extracted to.
+    rpt_file_name: Name of the generated resource utilization report.
+    xo_file: XO file object containing the HDL files.
+    top_name: Top-level module name.
+    part_num: Part number, or None to read it from the HDL files.
+    synth_kwargs: Dict of arguments for the synth_design command.
+    report_util_kwargs: Dict of arguments for the report_utilization command.
+    set_parallel: Tcl commands to set the parallelism.
+
+  Returns:
+    The Tcl commands.
+
+  Raises:
+    InputError if input is not a valid XO.
+  """
+  with zipfile.ZipFile(xo_file) as xo_zip:
+    with xo_zip.open('xo.xml') as xo_xml:
+      kernel = ET.parse(xo_xml).find('./Kernels/Kernel')
+      if kernel is None:
+        raise util.InputError('cannot parse XO file')
+      ip_dir = kernel.attrib['IP']
+      kernel_name = kernel.attrib['Name']
+    hdl_dir_prefix = ip_dir + '/src'
+    if all(not x.startswith(hdl_dir_prefix) for x in xo_zip.namelist()):
+      hdl_dir_prefix = ip_dir + '/hdl/verilog'
+    hdl_dir = os.path.join(tmpdir, hdl_dir_prefix)
+    xo_zip.extractall(path=tmpdir,
+                      members=[
+                          name for name in xo_zip.namelist()
+                          if name.startswith(hdl_dir_prefix)
+                      ])
+    if part_num is None:
+      for hdl_file_format in ('{}.v', '{0}_{0}.v'):
+        try:
+          with open(os.path.join(
+              hdl_dir, hdl_file_format.format(kernel_name))) as hdl_file:
+            part_num = RtlHlsInfo(hdl_file)['HLS_INPUT_PART']
+          break
+        except FileNotFoundError:
+          pass
+  assert part_num is not None
+  if synth_kwargs is None:
+    synth_kwargs = {}
+  if report_util_kwargs is None:
+    report_util_kwargs = {}
+  synth_kwargs.setdefault('top', top_name)
+  synth_kwargs.setdefault('part', part_num)
+  report_util_kwargs.setdefault('hierarchical', '')
+  report_util_kwargs.setdefault('hierarchical_depth', '1')
+  report_util_kwargs.setdefault('file', rpt_file_name)
+
+  synth_args = ' '.join('-{} {}'.format(*kv) for kv in synth_kwargs.items())
+  report_util_args = ' '.join(
+      '-{} {}'.format(*kv) for kv in report_util_kwargs.items())
+  return REPORT_UTIL_COMMANDS.format(**{
+      'output_dir': os.path.join(tmpdir, 'output'),
+      'hdl_dir': hdl_dir,
+      'synth_args': synth_args,
+      'report_util_args': report_util_args,
+      'set_parallel': set_parallel,
+  })
+
+
+class AsyncReportXoUtil(backend.AsyncVivado):
+  """Run synthesis and generate resource utilization report under asyncio.
+
+  This is the asyncio counterpart of ReportXoUtil, with the same arguments and
+  additional keyword arguments of runner.Runner. The report is written to
+  rpt_file once the tool succeeds. Unlike ReportXoUtil, no extra tokens are
+  taken from the job server, since a scheduler already holds the job slot;
+  max_threads optionally limits the number of threads of Vivado.
+  """
+
+  def __init__(self,
+               xo_file: BinaryIO,
+               rpt_file: TextIO,
+               top_name: str = 'Dataflow',
+               part_num: Optional[str] = None,
+               synth_kwargs: Optional[Dict[str, str]] = None,
+               report_util_kwargs: Optional[Dict[str, str]] = None,
+               max_threads: Optional[int] = None,
+               **kwargs: Any) -> None:
+    self.report_dir = tempfile.TemporaryDirectory(prefix='report-xo-util-')
+    self.rpt_file = rpt_file
+    self.rpt_file_name = os.path.join(self.report_dir.name,
+                                      'post_synth_util.rpt')
+    set_parallel = ''
+    if max_threads is not None:
+      set_parallel = 'set_param general.maxThreads %d' % max_threads
+    super().__init__(
+        get_report_util_commands(self.report_dir.name, self.rpt_file_name,
+                                 xo_file, top_name, part_num, synth_kwargs,
+                                 report_util_kwargs, set_parallel), **kwargs)
+
+  def finish(self) -> None:
+    if self.returncode == 0:
+      try:
+        with open(self.rpt_file_name) as src_rpt_file:
+          shutil.copyfileobj(src_rpt_file, self.rpt_file)
+      except FileNotFoundError:
+        raise util.InternalError('failed to generated report file')
+
+  def cleanup(self) -> None:
+    super().cleanup()
+    self.report_dir.cleanup()
+
+
 RTL_HLS_INFO_REGEX = r'\(\* CORE_GENERATION_INFO\s*=\s*".*,\{(.*)\}" \*\)'
 
 
@@ -1,9 +1,12 @@
 import contextlib
+import hashlib
+import io
+import json
 import logging
 import os
 import signal
-from typing import (Any, Generator, Iterable, List, Optional, TextIO, Tuple,
-                    TypeVar, Union)
+from typing import (Any, Dict, Generator, Iterable, List, Optional, TextIO,
+                    Tuple, TypeVar, Union)
 
 T = TypeVar('T')
 
@@ -27,22 +30,61 @@ class InputError(Exception):
 
 
 class Printer:
-  """A text-based code printer."""
+  """A text-based code printer.
 
-  def __init__(self, out: TextIO):
+  Indentation prefixes are cached. If buffer_size is positive, the printed text
+  is buffered in chunks and written to the file object in blocks of at least
+  buffer_size characters, and on flush; the printer must be flushed, e.g., by
+  using it as a context manager, before the file object is used otherwise.
+  """
+
+  def __init__(self, out: TextIO, buffer_size: int = 0):
     self._out = out
     self._indent = 0
     self._assign = 0
     self._comments = []  # type: List[str]
     self._tab = 2
+    self._prefixes = ['']
+    self._buffer_size = buffer_size
+    self._chunks = []  # type: List[str]
+    self._buffered = 0
+
+  def __enter__(self) -> 'Printer':
+    return self
+
+  def __exit__(self, *args) -> None:
+    self.flush()
+
+  def _prefix(self, indent: int) -> str:
+    prefixes = self._prefixes
+    while len(prefixes) <= indent:
+      prefixes.append(' ' * len(prefixes) * self._tab)
+    return prefixes[indent]
+
+  def write(self, text: str) -> None:
+    """Write text as-is."""
+    if self._buffer_size <= 0:
+      self._out.write(text)
+      return
+    self._chunks.append(text)
+    self._buffered += len(text)
+    if self._buffered >= self._buffer_size:
+      self.flush()
+
+  def flush(self) -> None:
+    """Write the buffered text to the file object."""
+    if self._chunks:
+      self._out.write(''.join(self._chunks))
+      self._chunks.clear()
+      self._buffered = 0
 
   def println(self, line: str = '', indent: int = -1) -> None:
     if indent < 0:
       indent = self._indent
     if line:
-      self._out.write('%s%s\n' % (' ' * indent * self._tab, line))
+      self.write(self._prefix(indent) + line + '\n')
     else:
-      self._out.write('\n')
+      self.write('\n')
 
   def do_indent(self) -> None:
     self._indent += 1
@@ -296,3 +338,146 @@ def release_job_slot(job_server_fd: Union[int, Tuple[()],
   if job_server_fd is not None and os.write(job_server_fd, b'x') != 1:
     job_server_fd = None
   return job_server_fd
+
+
+class Manifest:
+  """Content hashes of generated files.
+
+  The manifest is a JSON file that maps the paths of the files, relative to the
+  directory of the manifest, to their SHA-256 digest, size, and mtime in ns. A
+  file whose size and mtime match the manifest is known to have the recorded
+  content without reading it.
+
+  This can be used as a context manager, which saves the manifest on exit.
+  """
+
+  def __init__(self, path: str) -> None:
+    self.path = path
+    self._root = os.path.dirname(os.path.abspath(path))
+    try:
+      with open(path) as manifest_file:
+        self._entries = json.load(manifest_file)  # type: Dict[str, List[Any]]
+    except (OSError, ValueError):
+      self._entries = {}
+    self._dirty = False
+
+  def __enter__(self) -> 'Manifest':
+    return self
+
+  def __exit__(self, *args) -> None:
+    self.save()
+
+  def _key(self, path: str) -> str:
+    return os.path.relpath(os.path.abspath(path), self._root)
+
+  def is_unchanged(self, path: str, digest: str) -> bool:
+    """Returns whether the file is known to have content of the digest."""
+    entry = self._entries.get(self._key(path))
+    if entry is None or entry[0] != digest:
+      return False
+    try:
+      stat = os.stat(path)
+    except OSError:
+      return False
+    return entry[1:] == [stat.st_size, stat.st_mtime_ns]
+
+  def update(self, path: str, digest: str) -> None:
+    stat = os.stat(path)
+    self._entries[self._key(path)] = [digest, stat.st_size, stat.st_mtime_ns]
+    self._dirty = True
+
+  def save(self) -> None:
+    if self._dirty:
+      update_file(self.path, json.dumps(self._entries, indent=2,
+                                        sort_keys=True))
+      self._dirty = False
+
+
+def update_file(path: str,
+                content: Union[str, bytes],
+                manifest: Optional[Manifest] = None) -> bool:
+  """Write a file only if its content changes.
+
+  The content is compared with the manifest if given, or with the existing file
+  otherwise. A changed file is written to a temporary file in the same
+  directory and atomically renamed, so that the file is never partially
+  written and the mtime of unchanged files is kept for make-based flows.
+
+  Args:
+    path: Path to the file.
+    content: The new content. A str is encoded as UTF-8.
+    manifest: Optional Manifest to look up and record the content hash.
+
+  Returns:
+    Whether the file is written.
+  """
+  if isinstance(content, str):
+    content = content.encode()
+  digest = hashlib.sha256(content).hexdigest()
+  if manifest is not None and manifest.is_unchanged(path, digest):
+    _logger.debug('%s is unchanged', path)
+    return False
+  try:
+    if os.stat(path).st_size == len(content):
+      with open(path, 'rb') as old_file:
+        if old_file.read() == content:
+          _logger.debug('%s is unchanged', path)
+          if manifest is not None:
+            manifest.update(path, digest)
+          return False
+    mode = os.stat(path).st_mode & 0o777  # type: Optional[int]
+  except FileNotFoundError:
+    mode = None  # new files get the default mode, as the umask applies
+  tmp_path, fd = _create_temp_file(path)
+  try:
+    with os.fdopen(fd, 'wb') as tmp_file:
+      tmp_file.write(content)
+    if mode is not None:
+      os.chmod(tmp_path, mode)
+    os.replace(tmp_path, path)
+  except BaseException:
+    os.unlink(tmp_path)
+    raise
+  _logger.debug('%s is written', path)
+  if manifest is not None:
+    manifest.update(path, digest)
+  return True
+
+
+def _create_temp_file(path: str) -> Tuple[str, int]:
+  """Create a new temporary file next to path, with mode 0o666 minus umask.
+
+  Unlike tempfile.mkstemp, which creates files with mode 0o600, the kernel
+  applies the umask, so it never needs to be changed and read by os.umask,
+  which is not thread-safe.
+
+  Returns:
+    Tuple of the path and the file descriptor opened for writing.
+  """
+  directory, basename = os.path.split(os.path.abspath(path))
+  while True:
+    tmp_path = os.path.join(
+        directory, '.%s.%s' % (basename, os.urandom(4).hex()))
+    try:
+      return tmp_path, os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+                               0o666)
+    except FileExistsError:
+      continue
+
+
+@contextlib.contextmanager
+def open_if_changed(
+    path: str,
+    manifest: Optional[Manifest] = None) -> Generator[TextIO, None, None]:
+  """Open a text buffer that replaces the file on exit only if changed.
+
+  The buffer can be passed to the printers as the output file object. Nothing
+  is written if an exception is raised.
+
+  Args:
+    path: Path to the file.
+    manifest: Optional Manifest as in update_file.
+  """
+  buf = io.StringIO()
+  yield buf
+  update_file(path, buf.getvalue(), manifest)
@@ -0,0 +1,81 @@
+import operator
+import random
+import unittest
+
+from haoda import ir
+from haoda.ir.arithmetic import base
+
+
+def make_random_expr(rng, depth):
+  if depth == 0 or rng.random() < 0.2:
+    var = ir.make_var(rng.choice('abxy'))
+    var.haoda_type = 'int32'
+    return var
+  kind = rng.randrange(4)
+  if kind == 0:
+    return ir.Unary(operator=tuple(rng.choice('-+') for _ in range(2)),
+                    operand=make_random_expr(rng, depth - 1))
+  if kind == 1:
+    return ir.Call(name=rng.choice(('min', 'max')),
+                   arg=[make_random_expr(rng, depth - 1) for _ in range(2)])
+  operands = [make_random_expr(rng, depth - 1) for _ in range(rng.randint(1, 3))]
+  if kind == 2:
+    return ir.MulDiv(operator=('*',) * (len(operands) - 1), operand=operands)
+  return ir.AddSub(operator=tuple(
+      rng.choice('+-') for _ in range(len(operands) - 1)),
+                   operand=operands)
+
+
+def evaluate(node, env):
+  if isinstance(node, ir.Var):
+    return env[node.name]
+  if isinstance(node, ir.Unary):
+    return (-1)**node.operator.count('-') * evaluate(node.operand, env)
+  if isinstance(node, ir.Call):
+    return {'min': min, 'max': max}[node.name](evaluate(_, env) for _ in node.arg)
+  ops = {'+': operator.add, '-': operator.sub, '*': operator.mul}
+  result = evaluate(node.operand[0], env)
+  for op, operand in zip(node.operator, node.operand[1:]):
+    result = ops[op](result, evaluate(operand, env))
+  return result
+
+
+class TestArithmetic(unittest.TestCase):
+
+  def setUp(self):
+    self.a, self.x, self.y = map(ir.make_var, 'axy')
+
+  def test_flatten(self):
+    inner = ir.AddSub(operator=('+',), operand=(self.x, self.y))
+    expr = ir.AddSub(operator=('+',),
+                     operand=(inner,
+                              ir.Unary(operator=('-', '-'), operand=inner)))
+    # the children of a flattened node are not flattened again
+    self.assertEqual(str(base.flatten(expr)), '(x + y + (x + y))')
+
+  def test_reverse_distribute(self):
+    expr = ir.AddSub(operator=('+', '+'),
+                     operand=(ir.MulDiv(operator=('*',),
+                                        operand=(self.a, self.x)),
+                              ir.MulDiv(operator=('*',),
+                                        operand=(self.a, self.y)), self.y))
+    self.assertEqual(str(base.reverse_distribute(expr)), '(y + (a * (x + y)))')
+
+    # a * x - y cannot start with the subtracted operand
+    expr = ir.AddSub(operator=('-',),
+                     operand=(ir.MulDiv(operator=('*',),
+                                        operand=(self.a, self.x)), self.y))
+    self.assertEqual(str(base.reverse_distribute(expr)), str(expr))
+
+  def test_random_exprs(self):
+    rng = random.Random(0)
+    env = {'a': 2, 'b': 3, 'x': 5, 'y': 7}
+    for _ in range(500):
+      expr = make_random_expr(rng, 4)
+      for func in (base.flatten, base.reverse_distribute, base.simplify):
+        self.assertEqual(evaluate(func(expr), env), evaluate(expr, env),
+                         str(expr))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,57 @@
+import io
+import os
+import tempfile
+import unittest
+
+from haoda import codegen
+
+
+def print_func(printer, name, num_params):
+  printer.print_func('void %s' % name,
+                     ('int p%d' % _ for _ in range(num_params)),
+                     suffix=';')
+
+
+def raise_error(printer):
+  raise ValueError('expected failure')
+
+
+class TestCodegen(unittest.TestCase):
+
+  def test_print_parallel(self):
+    tasks = [(print_func, ('func_%d' % _, _ % 3 + 1)) for _ in range(16)]
+    out = io.StringIO()
+    codegen.print_parallel(out, tasks, processes=4, job_server_fd=None)
+    self.assertEqual(
+        out.getvalue(), ''.join('void func_%d(%s);\n' % (_, ', '.join(
+            'int p%d' % p for p in range(_ % 3 + 1))) for _ in range(16)))
+
+  def test_nested(self):
+    tasks = [(print_func, ('func_%d' % _, 1)) for _ in range(4)]
+    out = io.StringIO()
+    for code in codegen.generate_parallel(tasks[:2], processes=2,
+                                          job_server_fd=None):
+      codegen.print_parallel(out, tasks[2:], processes=2, job_server_fd=None)
+      out.write(code)
+    self.assertEqual(
+        out.getvalue(), ''.join('void func_%d(int p0);\n' % _
+                                for _ in (2, 3, 0, 2, 3, 1)))
+
+  def test_job_server(self):
+    with tempfile.TemporaryDirectory() as tmpdir:
+      fifo_path = os.path.join(tmpdir, 'job_server')
+      os.mkfifo(fifo_path)
+      fd = os.open(fifo_path, os.O_RDWR | os.O_NONBLOCK)
+      os.write(fd, b'xx')
+      os.set_blocking(fd, True)
+      tasks = [(print_func, ('f', 1))] * 8 + [(raise_error, ())]
+      with self.assertRaises(ValueError):
+        codegen.print_parallel(io.StringIO(), tasks, processes=4,
+                               job_server_fd=fd)
+      os.set_blocking(fd, False)
+      self.assertEqual(os.read(fd, 8), b'xx')
+      os.close(fd)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,273 @@
+import io
+import unittest
+
+from haoda import ir, util
+from haoda.backend import xilinx
+from haoda.ir.dataflow import (burst, delay, depth, dram, floorplan,
+                               partition, relay, simulate, throughput, trait)
+from haoda.ir.dataflow.graph import DataflowGraph
+from haoda.report.xilinx.hls import HlsPerformance, HlsResources
+
+
+def connect(src, dst, haoda_type='float', **kwargs):
+  fifo = ir.FIFO(src, dst, **kwargs)
+  src.exprs[fifo] = ir.make_var('x')
+  src.exprs[fifo].haoda_type = haoda_type
+  src.add_child(dst)
+  return fifo
+
+
+class TestDataflow(unittest.TestCase):
+
+  def setUp(self):
+    #   a -> b -> d
+    #   a ------> d
+    self.a, self.b, self.d = (ir.Module() for _ in range(3))
+    self.ab = connect(self.a, self.b, write_lat=2)
+    self.ad = connect(self.a, self.d, write_lat=0)
+    self.bd = connect(self.b, self.d, write_lat=10)
+    self.graph = DataflowGraph.from_modules([self.a])
+
+  def test_size_fifos(self):
+    depths = depth.size_fifos(self.graph)
+    self.assertEqual(depths, {self.ab: 2, self.ad: 15, self.bd: 2})
+    self.assertEqual(self.ad.depth, 15)
+    self.assertEqual(depth.get_fifo_bits(self.graph.fifos), 19 * 32)
+
+  def test_size_fifos_with_ii(self):
+    depths = depth.size_fifos(self.graph, ii={self.b: 4}, update=False)
+    self.assertEqual(depths[self.ad], 6)
+    self.assertIsNone(self.ad.depth)
+    depths = depth.size_fifos(self.graph, target_ii=13, update=False)
+    self.assertEqual(depths[self.ad], 3)
+
+  def test_simulate(self):
+    # shallow FIFOs on the short path throttle the whole graph
+    for fifo in self.graph.fifos:
+      fifo.depth = 2
+    result = simulate.simulate(self.graph, 100)
+    self.assertLess(result.throughput, 0.5)
+    self.assertGreater(result.stalls[self.a][('blocked', self.ad)], 0)
+    self.assertEqual(max(result.fifo_occupancy[self.ad]), 2)
+
+    # sized FIFOs sustain full throughput
+    depth.size_fifos(self.graph)
+    result = simulate.simulate(self.graph, 100)
+    self.assertEqual(result.cycles, 100 + 14)
+    self.assertEqual(sum(result.fifo_occupancy[self.ad].values()),
+                     result.cycles)
+    self.assertEqual(list(result.fifo_occupancy[self.ad]),
+                     sorted(result.fifo_occupancy[self.ad]))
+
+  def test_simulate_dram(self):
+    dram = {self.a: simulate.DramChannel(bytes_per_iter=8, bandwidth=2)}
+    result = simulate.simulate(self.graph, 100, dram=dram, default_depth=32)
+    self.assertEqual(list(result.issue_times[self.a][:3]), [0, 4, 8])
+    self.assertEqual(result.stalls[self.a][('dram', None)], 99 * 3)
+
+  def test_analyze_throughput(self):
+    perf = HlsPerformance()
+    perf.ii, perf.depth, perf.trip_count = 2, 20, 100
+    result = throughput.analyze_throughput(self.graph, perf={self.b: perf})
+    self.assertEqual(result.period, 200)
+    self.assertEqual(result.bottlenecks, [self.b])
+    self.assertEqual(result.module_slack[self.a], 199)
+    self.assertEqual(result.fifo_slack, {self.ab: 0, self.ad: 13, self.bd: 0})
+    self.assertEqual(result.fifo_bandwidth[self.bd], 32 * 100 / 200)
+    self.assertEqual(result.latency, 23)
+    self.assertEqual(result.critical_path, [self.a, self.b])
+
+  def test_partition(self):
+    # two chains of 8 modules connected by a narrow FIFO
+    chains = [[ir.Module() for _ in range(8)] for _ in range(2)]
+    for chain in chains:
+      for src, dst in zip(chain, chain[1:]):
+        connect(src, dst, haoda_type='float64')
+    cut = connect(chains[0][3], chains[1][4], haoda_type='uint1')
+    graph = DataflowGraph.from_modules(_[0] for _ in chains)
+    partitions = partition.partition(graph, 2)
+    self.assertEqual({frozenset(_.graph.modules) for _ in partitions},
+                     {frozenset(_) for _ in chains})
+    src, dst = partitions if chains[0][0] in partitions[0].graph else reversed(
+        partitions)
+    self.assertEqual(src.axis_outputs,
+                     [(cut.c_expr, dst.name, ir.Type('uint1'), 'ap_uint<1>')])
+    self.assertEqual(dst.axis_inputs,
+                     [(cut.c_expr, src.name, ir.Type('uint1'), 'ap_uint<1>')])
+    self.assertEqual(len(src.graph.fifos), 7)
+
+  def test_trait_index(self):
+    src, dst = ir.Module(), ir.Module()
+    modules = [ir.Module() for _ in range(3)]
+    for module, operator in zip(modules, '--~'):
+      fifo = connect(src, module)
+      module.exprs[ir.FIFO(module, dst)] = ir.Unary(operator=(operator,),
+                                                    operand=fifo)
+    index = trait.TraitIndex(modules)
+    self.assertEqual(len(index), 2)
+    self.assertEqual(index.instances(0), tuple(modules[:2]))
+    self.assertEqual(index.instances(1), tuple(modules[2:]))
+    self.assertEqual(index.add(modules[1]), 0)
+    self.assertEqual(index.trait(modules[2]), ir.ModuleTrait(modules[2]))
+    self.assertEqual(index.signature(0),
+                     trait.get_digest(ir.ModuleTrait(modules[1])).hex())
+    self.assertNotEqual(index.signature(0), index.signature(1))
+
+    # equal nodes have equal digests even if only one of them is typed
+    typed, untyped = ir.make_var('x'), ir.make_var('x')
+    typed.haoda_type = 'float'
+    self.assertEqual(typed, untyped)
+    self.assertEqual(trait.get_digest(typed), trait.get_digest(untyped))
+
+  def test_assign_banks(self):
+    def dram_ref(var, offset):
+      return ir.DRAMRef(haoda_type='float', dram=(0,), var=var, offset=offset)
+
+    self.a.exprs[self.ab] = ir.make_var('x')
+    self.a.lets = [
+        ir.Let(haoda_type=None, name='x', expr=dram_ref('a', 0)),
+        ir.Let(haoda_type=None, name='y', expr=dram_ref('a', 1)),
+    ]
+    self.a.exprs[self.ad] = dram_ref('b', 0)
+    self.d.lets = [
+        ir.Let(haoda_type='float', name=dram_ref('c', 0), expr=ir.make_var('x'))
+    ]
+    self.assertEqual(dram.get_var_traffic(self.graph), {
+        'a': 8,
+        'b': 4,
+        'c': 4
+    })
+    self.assertEqual(dram.get_bank_loads(self.graph), {0: 16})
+    perf = HlsPerformance()
+    perf.ii = 2
+    self.assertEqual(dram.get_bank_loads(self.graph, {self.a: perf}), {0: 10})
+
+    assignment = dram.assign_banks(self.graph, banks=(0, 1))
+    self.assertEqual(assignment, {'a': (0,), 'b': (1,), 'c': (1,)})
+    self.assertEqual(dram.get_bank_loads(self.graph), {0: 8, 1: 8})
+    self.assertEqual(self.d.dram_writes[0][1], 1)
+    self.assertEqual(self.a.dram_reads[-1][1], 1)
+
+    with self.assertRaises(ValueError):
+      dram.assign_banks(self.graph, banks=())
+
+  def test_coalesce(self):
+    refs = [
+        ir.DRAMRef(haoda_type='float', dram=(0,), var='a', offset=offset)
+        for offset in (0, 2, 3, 5)
+    ]
+    self.a.lets = [
+        ir.Let(haoda_type=None, name='x%d' % idx, expr=ref)
+        for idx, ref in enumerate(refs)
+    ]
+    bursts = burst.coalesce(self.graph, burst_width=128)
+    self.assertEqual(list(bursts), [self.a])
+    self.assertEqual(len(bursts[self.a]), 1)
+    read = burst.find_burst(bursts, self.a, refs[1], is_write=False)
+    self.assertEqual((read.offsets, read.lanes, read.cl_type),
+                     ((0, 2, 3), 4, 'float4'))
+    with self.assertRaises(KeyError):
+      burst.find_burst(bursts, self.a, refs[3], is_write=False)
+    with self.assertRaises(KeyError):
+      burst.find_burst(bursts, self.a, refs[1], is_write=True)
+
+    buf = io.StringIO()
+    read.print_unpack(util.CppPrinter(buf), 0)
+    self.assertIn('dram_a_bank_0_burst_0_buf.range(95, 64)', buf.getvalue())
+    self.assertIn('dram_a_bank_0_burst_0_buf_lane_3', buf.getvalue())
+
+  def test_coalesce_read_write(self):
+    writes = [
+        ir.DRAMRef(haoda_type='float', dram=(0,), var='a', offset=offset)
+        for offset in (0, 1)
+    ]
+    self.a.lets = [
+        ir.Let(haoda_type=None, name=ref, expr=read)
+        for ref, read in zip(writes, reversed(writes))
+    ]
+    bursts = burst.coalesce(self.graph, burst_width=128)
+    read = burst.find_burst(bursts, self.a, writes[0], is_write=False)
+    write = burst.find_burst(bursts, self.a, writes[0], is_write=True)
+    self.assertFalse(read.is_write)
+    self.assertTrue(write.is_write)
+    self.assertNotIn(
+        ir.DRAMRef(haoda_type='float', dram=(1,), var='a', offset=0), write)
+
+  def test_delay_lines(self):
+    ref = ir.FIFORef(fifo=self.ab, lat=0, ref_id=0)
+    delayed_refs = [ir.DelayedRef(delay=_, ref=ref) for _ in (3, 10, 3)]
+    lines = delay.get_delay_lines(delayed_refs)
+    self.assertEqual(list(lines), [ref])
+    self.assertEqual((lines[ref].delays, lines[ref].impl), ((3, 10), delay.SRL))
+    self.assertEqual(lines[ref].c_buf_load(delayed_refs[0]),
+                     'fifo_ref_0_delayed_3 = fifo_ref_0_delay_line_buf[2];')
+
+    line = delay.get_delay_lines(delayed_refs, bram_min_bits=320)[ref]
+    self.assertEqual(line.impl, delay.BRAM)
+    self.assertEqual(line.c_buf_ref(10), 'fifo_ref_0_delay_line_buf['
+                     'fifo_ref_0_delay_line_ptr]')
+    self.assertIn('fifo_ref_0_delay_line_ptr + 7', line.c_buf_ref(3))
+    self.assertEqual(line.cl_ptr_decl,
+                     'uint4_t fifo_ref_0_delay_line_ptr = 0;')
+    self.assertIn('(uint4_t)(fifo_ref_0_delay_line_ptr - 3)',
+                  line.cl_buf_ref(3))
+    self.assertEqual(
+        line.cl_next_ptr_expr, 'fifo_ref_0_delay_line_ptr < 9 ? '
+        '(uint4_t)(fifo_ref_0_delay_line_ptr+1) : (uint4_t)0')
+    self.assertEqual(delay.select_impl(2, 512), delay.REGISTER)
+
+  def test_insert_relay_stations(self):
+    placement = {self.a: 0, self.b: 1, self.d: 1}
+    stations = relay.insert_relay_stations(self.graph, placement)
+    self.assertEqual(list(stations), [self.ab, self.ad])
+    self.assertEqual(stations[self.ab].level, 1)
+    self.assertEqual((self.ab.depth, self.ad.depth, self.bd.depth), (5, 18, 2))
+    # running the pass again does not deepen the FIFOs again
+    relay.insert_relay_stations(self.graph, placement)
+    self.assertEqual((self.ab.depth, self.ad.depth, self.bd.depth), (5, 18, 2))
+
+    # the longer path gets 2 more stages, which the shorter path compensates
+    placement = {self.a: (0, 0), self.b: (1, 1), self.d: (1, 0)}
+    for fifo in self.graph.fifos:
+      fifo.depth = None
+    stations = relay.insert_relay_stations(self.graph, placement)
+    self.assertEqual([_.level for _ in stations.values()], [2, 1, 1])
+    self.assertEqual(self.ad.depth, 15 + 2 + 3)
+
+    buf = io.StringIO()
+    printer = xilinx.VerilogPrinter(buf)
+    xilinx.print_relay_stations(printer, stations.values())
+    xilinx.print_relay_station_instance(
+        printer, stations[self.ab], {_: _ for _ in xilinx.FIFO_PORTS})
+    self.assertIn('module relay_station_%s_tail' % self.ab.c_expr,
+                  buf.getvalue())
+    self.assertIn('relay_station_%s %s' % ((self.ab.c_expr,) * 2),
+                  buf.getvalue())
+    with self.assertRaises(ValueError):
+      relay.insert_relay_stations(self.graph, {self.a: 0})
+
+  def test_floorplan(self):
+    # a chain of 6 modules with a wide FIFO in the middle, over 3 SLRs
+    chain = [ir.Module() for _ in range(6)]
+    for src, dst in zip(chain[:-1], chain[1:]):
+      connect(src, dst, 'uint512' if src is chain[2] else 'float')
+    graph = DataflowGraph.from_modules(chain[:1])
+    resources = {}
+    for module in chain:
+      resources[module] = HlsResources()
+      resources[module].LUT = 100
+    capacity = [{'LUT': 300}] * 3
+    result = floorplan.floorplan(graph, resources, capacity)
+    self.assertEqual([result.slots[_] for _ in chain], [0, 0, 1, 1, 2, 2])
+    self.assertEqual(result.crossing_width, 64)
+    self.assertEqual([_['LUT'] for _ in result.usage], [200.] * 3)
+
+    buf = io.StringIO()
+    xilinx.print_pblock_xdc(buf, result.get_cells())
+    self.assertIn('resize_pblock [get_pblocks pblock_slr2] -add SLR2',
+                  buf.getvalue())
+    self.assertEqual(buf.getvalue().count('add_cells_to_pblock'), 6)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+from haoda import ir, util
+from haoda.ir.dataflow.graph import DataflowGraph
+
+
+def connect(src, dst, **kwargs):
+  fifo = ir.FIFO(src, dst, **kwargs)
+  src.exprs[fifo] = ir.make_var('x')
+  src.add_child(dst)
+  return fifo
+
+
+class TestDataflowGraph(unittest.TestCase):
+
+  def setUp(self):
+    #   a -> b -> d
+    #   a -> c -> d
+    self.a, self.b, self.c, self.d = (ir.Module() for _ in range(4))
+    self.ab = connect(self.a, self.b)
+    self.ac = connect(self.a, self.c)
+    self.bd = connect(self.b, self.d)
+    self.cd = connect(self.c, self.d)
+
+  def test_from_modules(self):
+    graph = DataflowGraph.from_modules([self.a])
+    self.assertEqual(graph.modules, (self.a, self.b, self.c, self.d))
+    self.assertEqual(graph.fifos, (self.ab, self.ac, self.bd, self.cd))
+    self.assertEqual(self.d.name, util.get_module_name(3))
+    self.assertIs(graph.get_fifo(self.c, self.d), self.cd)
+    self.assertEqual(graph.predecessors(self.d), (self.b, self.c))
+    with self.assertRaises(KeyError):
+      graph.get_fifo(self.a, self.d)
+
+  def test_add_fifo(self):
+    graph = DataflowGraph.from_modules([self.a])
+    e = ir.Module()
+    fifo = ir.FIFO(self.d, e)
+    self.assertEqual(graph.add_fifo(fifo), 4)
+    self.assertEqual(graph.add_fifo(fifo), 4)
+    self.assertEqual(graph.module_id(e), 4)
+    self.assertEqual(self.d.children, [e])
+    self.assertEqual(e.parents, [self.d])
+
+  def test_csr(self):
+    graph = DataflowGraph.from_modules([self.a])
+    indptr, indices, fifo_ids = graph.csr()
+    self.assertEqual(list(indptr), [0, 2, 3, 4, 4])
+    self.assertEqual(list(indices), [1, 2, 3, 3])
+    self.assertEqual(list(fifo_ids), [0, 1, 2, 3])
+    indptr, indices, fifo_ids = graph.csr(reverse=True)
+    self.assertEqual(list(indptr), [0, 0, 1, 2, 4])
+    self.assertEqual(list(indices), [0, 0, 1, 2])
+    self.assertEqual(list(fifo_ids), [0, 1, 2, 3])
+
+  def test_topological_order(self):
+    graph = DataflowGraph.from_modules([self.a])
+    self.assertEqual(graph.topological_order(),
+                     [self.a, self.b, self.c, self.d])
+    graph.add_fifo(ir.FIFO(self.d, self.a))
+    with self.assertRaises(util.SemanticError):
+      graph.topological_order()
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+from haoda.backend import runner
+
+
+class TestRunner(unittest.TestCase):
+
+  def setUp(self):
+    self.loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(self.loop)
+
+  def tearDown(self):
+    asyncio.set_event_loop(None)
+    self.loop.close()
+
+  def test_stream(self):
+    lines = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+      log_file = os.path.join(tmpdir, 'tool.log')
+      proc = runner.Runner(
+          ('sh', '-c', 'echo out; echo err >&2; head -c 1000000 /dev/zero; '
+           'exit 3'),
+          log_file=log_file,
+          on_stderr=lines.append)
+      self.assertEqual(self.loop.run_until_complete(proc.run()), 3)
+      with open(log_file) as log:
+        self.assertIn('out\n', log.read())
+    self.assertEqual(lines, ['err'])
+
+  def test_cancel(self):
+    pids = []
+    proc = runner.Runner(('sh', '-c', 'sleep 60 & echo $!; wait'),
+                         on_stdout=lambda line: pids.append(int(line)))
+    task = self.loop.create_task(proc.run())
+    begin = time.monotonic()
+    while not pids and time.monotonic() - begin < 10:
+      self.loop.run_until_complete(asyncio.sleep(0.01))
+    self.assertTrue(pids)
+    begin = time.monotonic()
+    task.cancel()
+    with self.assertRaises(asyncio.CancelledError):
+      self.loop.run_until_complete(task)
+    self.assertLess(time.monotonic() - begin, 10)
+    self.assertEqual(proc.process.returncode, -9)
+    # the child is killed as well, although it may not be reaped yet
+    try:
+      with open('/proc/%d/stat' % pids[0]) as stat:
+        self.assertEqual(stat.read().split()[2], 'Z')
+    except FileNotFoundError:
+      pass
+
+  def test_callback_error(self):
+    pids = []
+
+    def on_stdout(line):
+      pids.append(int(line))
+      raise ValueError('expected failure')
+
+    # the child is in its own process group but in the same session
+    proc = runner.Runner(
+        (sys.executable, '-c', 'import os, subprocess\n'
+         'child = subprocess.Popen(("sleep", "60"), preexec_fn=os.setpgrp)\n'
+         'print(child.pid, flush=True)\n'
+         'child.wait()'),
+        on_stdout=on_stdout)
+    begin = time.monotonic()
+    with self.assertRaises(ValueError):
+      self.loop.run_until_complete(proc.run())
+    self.assertLess(time.monotonic() - begin, 10)
+    self.assertEqual(proc.process.returncode, -9)
+    # SIGKILL is delivered asynchronously
+    while is_running(pids[0]) and time.monotonic() - begin < 10:
+      time.sleep(0.01)
+    self.assertFalse(is_running(pids[0]))
+
+
+def is_running(pid):
+  """Returns whether a process is running, i.e., neither exited nor zombie."""
+  try:
+    with open('/proc/%d/stat' % pid) as stat:
+      return stat.read().rsplit(')', 1)[1].split()[0] != 'Z'
+  except FileNotFoundError:
+    return False
+
+
+if __name__ == '__main__':
+  unittest.main()
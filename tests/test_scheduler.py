@@ -0,0 +1,190 @@
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from haoda.backend import runner, scheduler
+from haoda.report.xilinx import rtl
+
+# Writes the file of report_utilization in the Tcl commands.
+FAKE_VIVADO = r'''#!{}
+import re, sys
+with open(sys.argv[sys.argv.index('-source') + 1]) as tcl_file:
+  rpt_file_name = re.search(r'-file (\S+)', tcl_file.read()).group(1)
+with open(rpt_file_name, 'w') as rpt_file:
+  rpt_file.write('utilization\n')
+'''.format(sys.executable)
+
+
+class TestScheduler(unittest.TestCase):
+
+  def setUp(self):
+    self.loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(self.loop)
+
+  def tearDown(self):
+    asyncio.set_event_loop(None)
+    self.loop.close()
+
+  def test_schedule(self):
+    order = []
+    running = [0, 0]  # current, max
+
+    def job(name, returncode=0):
+
+      async def run():
+        order.append(name)
+        running[0] += 1
+        running[1] = max(running)
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        return returncode
+
+      return run
+
+    sched = scheduler.Scheduler(job_server_fd=None, max_jobs=2)
+    sched.add('synth', job('synth'), deps=('hls_a', 'hls_b'))
+    sched.add('hls_a', job('hls_a'))
+    sched.add('hls_b', job('hls_b'), priority=1)
+    sched.add('hls_c', job('hls_c', returncode=1))
+    sched.add('report', job('report'), deps=('hls_c', 'synth'))
+    self.assertFalse(self.loop.run_until_complete(sched.run()))
+    self.assertEqual(order, ['hls_b', 'hls_a', 'hls_c', 'synth'])
+    self.assertEqual(running[1], 2)
+    self.assertEqual([_.status for _ in sched.jobs.values()],
+                     ['succeeded', 'succeeded', 'succeeded', 'failed',
+                      'skipped'])
+    out = io.StringIO()
+    sched.print_report(out)
+    self.assertEqual(len(out.getvalue().splitlines()), 6)
+
+    sched.add('cycle', job('cycle'), deps=('cycle',))
+    with self.assertRaises(ValueError):
+      self.loop.run_until_complete(sched.run())
+
+  def test_memory_budget(self):
+    running = [0, 0]  # current, max
+
+    async def job():
+      running[0] += 1
+      running[1] = max(running)
+      await asyncio.sleep(0.01)
+      running[0] -= 1
+      return 0
+
+    sched = scheduler.Scheduler(job_server_fd=None,
+                                max_jobs=4,
+                                memory_budget=10)
+    for idx in range(3):
+      sched.add('big_%d' % idx, job, memory=6)
+    self.assertTrue(self.loop.run_until_complete(sched.run()))
+    self.assertEqual(running[1], 1)
+
+    # a small job is admitted next to a big one
+    sched = scheduler.Scheduler(job_server_fd=None,
+                                max_jobs=4,
+                                memory_budget=10,
+                                rss_interval=0.01)
+    sched.add('big_0', job, priority=1, memory=6)
+    sched.add('big_1', job, priority=1, memory=6)
+    sched.add('small',
+              lambda: runner.Runner(('sleep', '0.1')),
+              job_type='sleep')
+    sched.memory_model.default = 4
+    self.assertTrue(self.loop.run_until_complete(sched.run()))
+    self.assertEqual(running[1], 1)
+    self.assertLess(sched.jobs['small'].start_time,
+                    sched.jobs['big_1'].start_time)
+    self.assertGreater(sched.jobs['small'].peak_memory, 0)
+    self.assertEqual(len(sched.memory_model.samples['sleep']), 1)
+
+  def test_memory_model(self):
+    model = scheduler.MemoryModel(default=100, margin=1)
+    self.assertEqual(model.predict('synth', 10), 100)
+    model.record('synth', 10, 20)
+    self.assertEqual(model.predict('synth', 5), 20)
+    self.assertEqual(model.predict('synth', 20), 40)
+    model.record('synth', 20, 30)
+    self.assertEqual(model.predict('synth', 30), 40)
+    with tempfile.TemporaryDirectory() as tmpdir:
+      model.path = os.path.join(tmpdir, 'memory.json')
+      model.save()
+      self.assertEqual(
+          scheduler.MemoryModel(model.path).samples,
+          {'synth': [(10, 20), (20, 30)]})
+
+  def test_job_server(self):
+
+    async def fail():
+      await asyncio.sleep(0.01)
+      raise RuntimeError('crashed')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+      fifo_path = os.path.join(tmpdir, 'job_server')
+      os.mkfifo(fifo_path)
+      fd = os.open(fifo_path, os.O_RDWR | os.O_NONBLOCK)
+      os.write(fd, b'xx')
+      os.set_blocking(fd, True)
+      sched = scheduler.Scheduler(job_server_fd=fd)
+      for idx in range(4):
+        sched.add('job_%d' % idx, fail)
+      self.assertFalse(self.loop.run_until_complete(sched.run()))
+      self.assertEqual({_.status for _ in sched.jobs.values()}, {'failed'})
+      # all tokens are returned
+      os.set_blocking(fd, False)
+      self.assertEqual(os.read(fd, 8), b'xx')
+      os.close(fd)
+
+  def test_cancel_acquire(self):
+    with tempfile.TemporaryDirectory() as tmpdir:
+      fifo_path = os.path.join(tmpdir, 'job_server')
+      os.mkfifo(fifo_path)
+      fd = os.open(fifo_path, os.O_RDWR | os.O_NONBLOCK)
+      # cancel the acquisition at every step it may be suspended at
+      for steps in range(8):
+        os.write(fd, b'x')
+        pool = scheduler.TokenPool(job_server_fd=fd)
+        self.assertEqual(self.loop.run_until_complete(pool.acquire()),
+                         scheduler.IMPLICIT)
+        task = self.loop.create_task(pool.acquire())
+        for _ in range(steps):
+          self.loop.run_until_complete(asyncio.sleep(0))
+        task.cancel()
+        try:
+          pool.release(self.loop.run_until_complete(task))
+        except asyncio.CancelledError:
+          pass
+        pool.close()
+        self.assertEqual(os.read(fd, 8), b'x', 'steps: %d' % steps)
+      os.close(fd)
+
+  def test_report_xo_util(self):
+    with tempfile.TemporaryDirectory() as tmpdir:
+      vivado = os.path.join(tmpdir, 'vivado')
+      with open(vivado, 'w') as vivado_file:
+        vivado_file.write(FAKE_VIVADO)
+      os.chmod(vivado, 0o755)
+      xo_file = io.BytesIO()
+      with zipfile.ZipFile(xo_file, 'w') as xo_zip:
+        xo_zip.writestr('xo.xml', '<Root><Kernels><Kernel IP="ip" Name="top"/>'
+                        '</Kernels></Root>')
+        xo_zip.writestr('ip/src/top.v', 'module top(); endmodule\n')
+      rpt_file = io.StringIO()
+      sched = scheduler.Scheduler(job_server_fd=None, rss_interval=0.01)
+      xo_file.seek(0)
+      sched.add(
+          'synth',
+          lambda: rtl.AsyncReportXoUtil(xo_file, rpt_file, 'top', 'xcu200'),
+          job_type='synth')
+      with mock.patch.dict(os.environ,
+                           {'PATH': tmpdir + os.pathsep + os.environ['PATH']}):
+        self.assertTrue(self.loop.run_until_complete(sched.run()))
+      self.assertEqual(rpt_file.getvalue(), 'utilization\n')
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -1,3 +1,7 @@
+import hashlib
+import io
+import os
+import tempfile
 import unittest
 
 from haoda import util
@@ -39,6 +43,58 @@ class TestUtil(unittest.TestCase):
     self.assertEqual(util.get_suitable_int_type(15, -17), 'int6')
     self.assertEqual(util.get_suitable_int_type(16, -16), 'int6')
 
+  def test_printer_buffer(self):
+
+    def print_code(printer):
+      printer.println('int f() {')
+      printer.do_indent()
+      printer.println('return 0;')
+      printer.un_indent()
+      printer.println('}')
+
+    expected = io.StringIO()
+    print_code(util.CppPrinter(expected))
+    out = io.StringIO()
+    with util.CppPrinter(out, buffer_size=1 << 10) as printer:
+      print_code(printer)
+      self.assertEqual(out.getvalue(), '')
+    self.assertEqual(out.getvalue(), expected.getvalue())
+    self.assertEqual(expected.getvalue(), 'int f() {\n  return 0;\n}\n')
+
+  def test_update_file(self):
+    with tempfile.TemporaryDirectory() as tmpdir:
+      path = os.path.join(tmpdir, 'kernel.cpp')
+      manifest_path = os.path.join(tmpdir, 'manifest.json')
+      with util.Manifest(manifest_path) as manifest:
+        with util.open_if_changed(path, manifest) as out:
+          util.CppPrinter(out).println('int x;')
+        self.assertTrue(manifest.is_unchanged(
+            path,
+            hashlib.sha256(b'int x;\n').hexdigest()))
+      os.utime(path, ns=(0, 0))
+
+      manifest = util.Manifest(manifest_path)
+      self.assertFalse(manifest.is_unchanged(path, ''))
+      self.assertFalse(util.update_file(path, 'int x;\n', manifest))
+      self.assertEqual(os.stat(path).st_mtime_ns, 0)
+      self.assertTrue(util.update_file(path, 'int y;\n', manifest))
+      with open(path) as in_file:
+        self.assertEqual(in_file.read(), 'int y;\n')
+      self.assertEqual(sorted(os.listdir(tmpdir)),
+                       ['kernel.cpp', 'manifest.json'])
+
+      # new files follow the umask, and existing files keep their mode
+      umask = os.umask(0o027)
+      try:
+        new_path = os.path.join(tmpdir, 'kernel.h')
+        self.assertTrue(util.update_file(new_path, b''))
+        self.assertEqual(os.stat(new_path).st_mode & 0o777, 0o640)
+      finally:
+        os.umask(umask)
+      os.chmod(path, 0o600)
+      self.assertTrue(util.update_file(path, 'int z;\n'))
+      self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
 
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,89 @@
+import gc
+import unittest
+import weakref
+
+from haoda import ir
+from haoda.ir import visitor
+
+
+class TestVisitor(unittest.TestCase):
+
+  def setUp(self):
+    self.src, self.dst = ir.Module(), ir.Module()
+    self.fifo = ir.FIFO(self.src, self.dst)
+    self.var = ir.make_var('x')
+    self.dram_ref = ir.DRAMRef(haoda_type='float', dram=(0,), var='a', offset=0)
+    # the same var appears twice as a shared subtree
+    self.expr = ir.Unary(operator=('-', '~'),
+                         operand=ir.Unary(operator=('-',), operand=self.var))
+    self.module = ir.Module()
+    self.module.lets = [
+        ir.Let(haoda_type='float', name=self.dram_ref, expr=self.expr)
+    ]
+    self.module.exprs[ir.FIFO(self.module, self.dst)] = ir.Unary(
+        operator=('-',), operand=self.fifo)
+
+  def test_get_instances(self):
+    dram_refs, var_refs, unaries = visitor.get_instances(
+        [self.module.lets[0], self.expr], ir.DRAMRef, ir.Var, ir.Unary)
+    self.assertEqual(len(dram_refs), 1)
+    self.assertIs(dram_refs[0], self.dram_ref)
+    self.assertEqual(var_refs, (self.var, self.var))
+    self.assertIs(unaries[0], self.expr)
+    self.assertEqual(len(unaries), 4)
+    self.assertEqual(visitor.get_vars(self.expr), (self.var,))
+    with self.assertRaises(TypeError):
+      visitor.get_vars(0)
+
+  def test_module(self):
+    index = visitor.NodeIndex(self.module)
+    self.assertEqual(index.get(ir.DRAMRef), (self.dram_ref,))
+    self.assertEqual(index.query(ir.FIFO, (ir.Var, ir.DRAMRef)),
+                     ((self.fifo,), (self.dram_ref, self.var)))
+    self.assertEqual(visitor.get_read_fifo_set(self.module), (self.fifo,))
+    with self.assertRaises(TypeError):
+      visitor.get_read_fifo_set(self.expr)
+
+  def test_cache(self):
+    index = visitor.NodeIndex(self.expr)
+    self.assertIs(index.get(ir.Var)[0], self.var)
+    # queries of the same index are not walked again
+    self.assertIs(index.get(ir.Var), index.get(ir.Var))
+    # children assigned after indexing are seen by new indexes
+    expr = ir.Unary(operator=('-',), operand=self.var)
+    self.assertEqual(visitor.get_vars(expr), (self.var,))
+    expr.operand = self.dram_ref
+    self.assertEqual(visitor.get_vars(expr), ())
+    self.assertEqual(visitor.get_dram_refs(expr), (self.dram_ref,))
+    # so are descendants assigned after indexing
+    expr = ir.Unary(operator=('-',),
+                    operand=ir.Unary(operator=('-',), operand=self.var))
+    self.assertEqual(visitor.get_vars(expr), (self.var,))
+    expr.operand.operand = self.dram_ref
+    self.assertEqual(visitor.get_vars(expr), ())
+
+  def test_no_leak(self):
+    expr = ir.Unary(operator=('-',), operand=ir.make_var('x'))
+    ref = weakref.ref(expr)
+    self.assertEqual(len(visitor.get_vars(expr)), 1)
+    del expr
+    gc.collect()
+    self.assertIsNone(ref())
+
+  def test_module_interfaces(self):
+    self.assertEqual(self.module.dram_writes, ((self.dram_ref, 0),))
+    self.assertEqual(self.module.dram_reads, ())
+    self.assertEqual(self.module.input_fifos, (self.fifo.c_expr,))
+    # the interfaces are updated when the lets are mutated in place
+    dram_ref = ir.DRAMRef(haoda_type='float', dram=(1,), var='b', offset=0)
+    self.module.lets.append(ir.Let(haoda_type=None, name='y', expr=dram_ref))
+    self.assertEqual(self.module.dram_reads, ((dram_ref, 1),))
+    # FIFO names follow the module ids
+    self.assertEqual(self.module.input_fifos, (self.fifo.c_expr,))
+    self.src.module_id = 42
+    self.assertEqual(self.module.input_fifos,
+                     ('from_module_42_to_%s' % self.dst.name,))
+
+
+if __name__ == '__main__':
+  unittest.main()
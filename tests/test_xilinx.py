@@ -0,0 +1,162 @@
+import asyncio
+import io
+import os
+import re
+import tempfile
+import unittest
+
+from haoda.backend import xilinx
+
+
+class TestXilinx(unittest.TestCase):
+
+  def test_fifo_cost(self):
+    table = xilinx.FIFO_COST_TABLES['ultrascale_plus']
+    self.assertEqual(table.get_cost('srl', 32, 64)['LUT'], 64)
+    self.assertEqual(table.get_cost('bram', 32, 1024)['BRAM_18K'], 2)
+    self.assertEqual(table.get_cost('uram', 512, 4096)['URAM'], 8)
+    with self.assertRaises(ValueError):
+      xilinx.FIFO_COST_TABLES['7series'].get_cost('uram', 32, 2)
+
+  def test_select_fifo_impls(self):
+    fifos = [('a', 32, 2), ('b', 32, 32), ('c', 64, 2048), ('d', 64, 2048)]
+    capacity = {'FF': 10000, 'LUT': 3000, 'BRAM_18K': 8}
+    selection = xilinx.select_fifo_impls(fifos, capacity)
+    self.assertEqual(list(selection), ['a', 'b', 'c', 'd'])
+    self.assertEqual(selection['b'][0], 'srl')
+    # the deep FIFOs do not both fit in either LUTRAM or BRAM
+    self.assertEqual(sorted(selection[_][0] for _ in 'cd'), ['bram', 'lutram'])
+    # URAM is not considered if not available
+    self.assertNotIn('uram', {impl for impl, _ in selection.values()})
+
+    out = io.StringIO()
+    xilinx.print_fifo_report(out, selection, {_[0]: _[1:] for _ in fifos})
+    self.assertEqual(len(out.getvalue().splitlines()), 6)
+
+  def test_fifo_module(self):
+    out = io.StringIO()
+    xilinx.VerilogPrinter(out).fifo_module(32, 64, name='fifo_x', impl='uram')
+    self.assertIn('module fifo_x', out.getvalue())
+    self.assertIn('"ultra"', out.getvalue())
+    with self.assertRaises(ValueError):
+      xilinx.VerilogPrinter(out).fifo_module(32, 64, impl='flipflop')
+
+  def test_fifo_styles(self):
+    out = io.StringIO()
+    printer = xilinx.VerilogPrinter(out)
+    printer.fifo_module(32, 16, name='fifo_a', impl='almost_full')
+    printer.fifo_module(32, 16, name='fifo_b', impl='relay_station', level=2)
+    printer.fifo_module(32, 2, name='fifo_c', impl='register_slice')
+    modules = re.findall(r'^module (\w+)', out.getvalue(), re.MULTILINE)
+    self.assertEqual(modules, ['fifo_a', 'fifo_b_tail', 'fifo_b', 'fifo_c'])
+    self.assertIn('GRACE_PERIOD = 5', out.getvalue())
+    with self.assertRaises(ValueError):
+      printer.fifo_module(32, 4, impl='relay_station', level=2)
+    with self.assertRaises(ValueError):
+      printer.fifo_module(32, 4, impl='register_slice')
+
+  def test_fifo_library(self):
+    library = xilinx.FifoLibrary()
+    out = io.StringIO()
+    printer = xilinx.VerilogPrinter(out)
+    args = ('.clk(ap_clk)',)
+    library.instance(printer, 'fifo_a', 32, 2, args)
+    library.instance(printer, 'fifo_b', 32, 2, args)
+    library.instance(printer, 'fifo_c', 64, 1024, args, impl='uram')
+    self.assertIn('fifo_srl #(', out.getvalue())
+    self.assertIn('.MEM_STYLE("ultra")', out.getvalue())
+    self.assertEqual(library.wrapper(32, 2), 'fifo_w32_d2_A')
+    with self.assertRaises(ValueError):
+      library.wrapper(32, 2, impl='registers')
+    self.assertEqual(library.shapes, {
+        ('srl', 32, 2): 3,
+        ('uram', 64, 1024): 1
+    })
+
+    out = io.StringIO()
+    library.print_modules(xilinx.VerilogPrinter(out))
+    modules = re.findall(r'^module (\w+)', out.getvalue(), re.MULTILINE)
+    self.assertEqual(modules, ['fifo_srl', 'fifo_bram', 'fifo_w32_d2_A'])
+
+  def test_hls_cache(self):
+    with tempfile.TemporaryDirectory() as tmpdir:
+      kernel_file = os.path.join(tmpdir, 'kernel.cpp')
+      with open(kernel_file, 'w') as f:
+        f.write('void kernel() {}\n')
+      cache = xilinx.HlsCache(os.path.join(tmpdir, 'cache'), 'test')
+      args = ((kernel_file,), 'kernel', '3.33', 'xcu200')
+      key = cache.get_key(*args)
+      self.assertEqual(key, cache.get_key(*args))
+      self.assertNotEqual(key, cache.get_key(((kernel_file, '-DN=1'),),
+                                             *args[1:]))
+      self.assertNotEqual(key, cache.get_key(*args, reset_low=False))
+      self.assertIsNone(cache.load(key))
+      cache.store(key, b'tarball')
+
+      # a hit never launches vivado_hls
+      tarfileobj = io.BytesIO()
+      with xilinx.RunHls(tarfileobj, *args, cache=cache) as proc:
+        proc.communicate()
+      self.assertTrue(proc.cached)
+      self.assertEqual(proc.returncode, 0)
+      self.assertEqual(tarfileobj.getvalue(), b'tarball')
+
+      tarfileobj = io.BytesIO()
+      proc = xilinx.AsyncRunHls(tarfileobj, *args, cache=cache)
+      loop = asyncio.new_event_loop()
+      try:
+        self.assertEqual(loop.run_until_complete(proc.run()), 0)
+      finally:
+        loop.close()
+      self.assertEqual(tarfileobj.getvalue(), b'tarball')
+
+      with open(kernel_file, 'a') as f:
+        f.write('// changed\n')
+      self.assertNotEqual(key, cache.get_key(*args))
+
+      # included headers are hashed, via the kernel directory or -I
+      include_dir = os.path.join(tmpdir, 'include')
+      os.mkdir(include_dir)
+      with open(os.path.join(include_dir, 'common.h'), 'w') as f:
+        f.write('#define N 1\n')
+      with open(os.path.join(tmpdir, 'kernel.h'), 'w') as f:
+        f.write('#include <common.h>\n')
+      with open(kernel_file, 'w') as f:
+        f.write('#include "kernel.h"\nvoid kernel() {}\n')
+      header_args = (((kernel_file, '-I' + include_dir),), 'kernel', '3.33',
+                     'xcu200')
+      self.assertEqual(xilinx.get_included_files(kernel_file,
+                                                 '-I' + include_dir),
+                       [
+                           os.path.join(include_dir, 'common.h'),
+                           os.path.join(tmpdir, 'kernel.h'),
+                       ])
+      header_key = cache.get_key(*header_args)
+      with open(os.path.join(include_dir, 'common.h'), 'w') as f:
+        f.write('#define N 2\n')
+      self.assertNotEqual(header_key, cache.get_key(*header_args))
+      header_key = cache.get_key(*header_args)
+      extra_file = os.path.join(tmpdir, 'data.txt')
+      with open(extra_file, 'w') as f:
+        f.write('data\n')
+      self.assertNotEqual(header_key,
+                          cache.get_key(*header_args, extra_files=(extra_file,)))
+
+      # kernels of the same name in different directories differ
+      other_dir = os.path.join(tmpdir, 'other')
+      os.mkdir(other_dir)
+      other_file = os.path.join(other_dir, 'kernel.cpp')
+      with open(kernel_file) as src, open(other_file, 'w') as dst:
+        dst.write(src.read())
+      self.assertNotEqual(
+          header_key,
+          cache.get_key(((other_file, '-I' + include_dir),), *header_args[1:]))
+
+      cache.store('0' * 64, b'newer tarball')
+      cache.evict(len(b'newer tarball'))
+      self.assertIsNone(cache.load(key))
+      self.assertIsNotNone(cache.load('0' * 64))
+
+
+if __name__ == '__main__':
+  unittest.main()